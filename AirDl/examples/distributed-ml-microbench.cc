@@ -0,0 +1,342 @@
+/* -*- Mode:C++; c-file-style:"gnu"; indent-tabs-mode:nil; -*- */
+/*
+ * Microbenchmarks of the host side hot paths of the model transfer and aggregation.
+ *
+ * Every benchmark runs --repeat times per configuration and reports the best run: nanoseconds per model
+ * byte and heap allocations (count and bytes) per operation, counted by the operator new of this program.
+ * The sweep covers the model size (floats), the fragment size (bytes) and the number of clients whose
+ * updates are aggregated:
+ *
+ *   ToPackets     model -> Packet
+ *   PacketsTo     Packet -> MTensor
+ *   GetBuffer     copy of the model of an MlBuffer
+ *   CopyFromMem   layers -> MlBuffer, --layers layers of equal size
+ *   PasteToMem    MlBuffer -> layers
+ *   BulkSend      FedSend of the model into a socket that accepts everything, fixed fragment size
+ *   BulkSendAdaptive  same with a FragmentSizer
+ *   FedAvgSpan    average the fragments of --clients updates, header already parsed (StreamReassembler path)
+ *   FedAvgPacket  same from Packets carrying a SeqTsSizeHeader
+ *   FedUpdateSpan copy the fragments of one update
+ *
+ * ./waf --run "distributed-ml-microbench --modelSizes=100000,1000000 --packetSizes=536,1024,65536 --clients=1,8"
+ */
+#include "ns3/core-module.h"
+#include "ns3/network-module.h"
+#include "ns3/distributed-ml-utils.h"
+
+#include <chrono>
+#include <cstdlib>
+#include <fstream>
+#include <limits>
+#include <new>
+#include <sstream>
+
+using namespace ns3;
+
+NS_LOG_COMPONENT_DEFINE ("DistributedMlMicrobench");
+
+
+static uint64_t g_allocs = 0;
+static uint64_t g_allocBytes = 0;
+
+void*
+operator new (std::size_t size)
+{
+  g_allocs += 1;
+  g_allocBytes += size;
+  void* p = std::malloc (size ? size : 1);
+  if (!p)
+    {
+      throw std::bad_alloc ();
+    }
+  return p;
+}
+
+void
+operator delete (void* p) noexcept
+{
+  std::free (p);
+}
+
+void
+operator delete (void* p, std::size_t) noexcept
+{
+  std::free (p);
+}
+
+
+/**
+ * A socket that accepts every packet at once and only counts them, so that BulkSend measures the
+ * fragmentation and not TCP.
+ */
+class SinkSocket : public Socket
+{
+public:
+  static TypeId GetTypeId (void)
+  {
+    static TypeId tid = TypeId ("ns3::DistributedMlSinkSocket")
+      .SetParent<Socket> ()
+      .SetGroupName ("DistributedMl")
+      .AddConstructor<SinkSocket> ();
+    return tid;
+  }
+
+  uint64_t GetBytes (void) const { return m_bytes; }
+  uint64_t GetPackets (void) const { return m_packets; }
+
+  virtual enum SocketErrno GetErrno (void) const { return ERROR_NOTERROR; }
+  virtual enum SocketType GetSocketType (void) const { return NS3_SOCK_STREAM; }
+  virtual Ptr<Node> GetNode (void) const { return 0; }
+  virtual int Bind (const Address &address) { return 0; }
+  virtual int Bind (void) { return 0; }
+  virtual int Bind6 (void) { return 0; }
+  virtual int Close (void) { return 0; }
+  virtual int ShutdownSend (void) { return 0; }
+  virtual int ShutdownRecv (void) { return 0; }
+  virtual int Connect (const Address &address) { return 0; }
+  virtual int Listen (void) { return 0; }
+  virtual uint32_t GetTxAvailable (void) const { return std::numeric_limits<uint32_t>::max (); }
+  virtual int Send (Ptr<Packet> p, uint32_t flags)
+  {
+    m_bytes += p->GetSize ();
+    m_packets += 1;
+    return p->GetSize ();
+  }
+  virtual int SendTo (Ptr<Packet> p, uint32_t flags, const Address &toAddress) { return Send (p, flags); }
+  virtual uint32_t GetRxAvailable (void) const { return 0; }
+  virtual Ptr<Packet> Recv (uint32_t maxSize, uint32_t flags) { return 0; }
+  virtual Ptr<Packet> RecvFrom (uint32_t maxSize, uint32_t flags, Address &fromAddress) { return 0; }
+  virtual int GetSockName (Address &address) const { return 0; }
+  virtual int GetPeerName (Address &address) const { return 0; }
+  virtual bool SetAllowBroadcast (bool allowBroadcast) { return false; }
+  virtual bool GetAllowBroadcast () const { return false; }
+
+private:
+  uint64_t m_bytes = 0;
+  uint64_t m_packets = 0;
+};
+
+
+struct Result
+{
+  double ns = 0;
+  uint64_t allocs = 0;
+  uint64_t allocBytes = 0;
+};
+
+
+/* Run op repeat times after one warm-up run, and keep the fastest run with its allocations. */
+template <class Op>
+static Result
+Measure (uint32_t repeat, Op op)
+{
+  op ();
+  Result best;
+  for (uint32_t r = 0; r < repeat; r++)
+    {
+      uint64_t allocs = g_allocs;
+      uint64_t allocBytes = g_allocBytes;
+      std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now ();
+      op ();
+      double ns = std::chrono::duration<double, std::nano> (std::chrono::steady_clock::now () - start).count ();
+      if (r == 0 || ns < best.ns)
+        {
+          best.ns = ns;
+          best.allocs = g_allocs - allocs;
+          best.allocBytes = g_allocBytes - allocBytes;
+        }
+    }
+  return best;
+}
+
+
+static std::vector<uint32_t>
+ParseList (std::string list)
+{
+  std::vector<uint32_t> values;
+  std::istringstream is (list);
+  std::string item;
+  while (std::getline (is, item, ','))
+    {
+      values.push_back (std::stoul (item));
+    }
+  return values;
+}
+
+
+/* The fragments of one update as FedAvg receives them, seq being the float offset + 1 and 0 for the last one. */
+static std::vector<std::pair<uint32_t, uint32_t> >
+Fragments (uint32_t modelFloats, uint32_t packetSize)
+{
+  uint32_t floats = std::max (uint32_t (1), packetSize / uint32_t (sizeof (float)));
+  std::vector<std::pair<uint32_t, uint32_t> > fragments;
+  for (uint32_t offset = 0; offset < modelFloats; offset += floats)
+    {
+      uint32_t n = std::min (floats, modelFloats - offset);
+      fragments.push_back (std::make_pair (offset + n == modelFloats ? 0 : offset + 1, n));
+    }
+  return fragments;
+}
+
+
+static void
+Report (std::ostream& os, std::ostream* csv, std::string name, uint32_t modelFloats, uint32_t packetSize,
+        uint32_t clients, double bytes, const Result& result)
+{
+  char line[256];
+  snprintf (line, sizeof (line), "%-18s %12u %8u %8u %10.3f %12.1f %14.1f\n", name.c_str (), modelFloats, packetSize,
+            clients, result.ns / bytes, double (result.allocs), double (result.allocBytes));
+  os << line;
+  if (csv)
+    {
+      *csv << name << "," << modelFloats << "," << packetSize << "," << clients << "," << result.ns / bytes << ","
+           << result.allocs << "," << result.allocBytes << std::endl;
+    }
+}
+
+
+int
+main (int argc, char *argv[])
+{
+  std::string modelSizes = "10000,100000,1000000";
+  std::string packetSizes = "536,1024,4096,65536";
+  std::string clientCounts = "1,4,16";
+  uint32_t layers = 8;
+  uint32_t repeat = 5;
+  std::string output = "";
+
+  CommandLine cmd;
+  cmd.AddValue ("modelSizes", "comma separated model sizes in floats", modelSizes);
+  cmd.AddValue ("packetSizes", "comma separated fragment sizes in bytes", packetSizes);
+  cmd.AddValue ("clients", "comma separated numbers of aggregated updates", clientCounts);
+  cmd.AddValue ("layers", "number of layers of the model for CopyFromMem/PasteToMem", layers);
+  cmd.AddValue ("repeat", "timed runs per configuration, the best is reported", repeat);
+  cmd.AddValue ("output", "if given, also write the results to this csv file", output);
+  cmd.Parse (argc, argv);
+
+  std::ofstream csvFile;
+  std::ostream* csv = NULL;
+  if (!output.empty ())
+    {
+      csvFile.open (output.c_str ());
+      NS_ABORT_MSG_IF (!csvFile.is_open (), "Cannot open " << output);
+      csvFile << "benchmark,model_floats,packet_size,clients,ns_per_byte,allocs_per_op,alloc_bytes_per_op" << std::endl;
+      csv = &csvFile;
+    }
+
+  std::cout << "benchmark           model floats   packet  clients    ns/byte   allocs/op  alloc bytes/op" << std::endl;
+
+  for (uint32_t modelFloats : ParseList (modelSizes))
+    {
+      double modelBytes = double (modelFloats) * sizeof (float);
+      std::vector<float> model (modelFloats);
+      for (uint32_t i = 0; i < modelFloats; i++)
+        {
+          model[i] = float (i % 1000) / 1000;
+        }
+      MTensor<float> tensor (model.data (), modelFloats);
+
+      // model size only
+      Report (std::cout, csv, "ToPackets", modelFloats, 0, 1, modelBytes,
+              Measure (repeat, [&] () { ToPackets (tensor); }));
+
+      Ptr<Packet> packet = ToPackets (tensor);
+      Report (std::cout, csv, "PacketsTo", modelFloats, 0, 1, modelBytes,
+              Measure (repeat, [&] () {
+                         MTensor<float> t = PacketsTo (packet);
+                         delete[] (uint8_t*) t.data ();
+                       }));
+
+      MlBuffer buffer (tensor);
+      Report (std::cout, csv, "GetBuffer", modelFloats, 0, 1, modelBytes,
+              Measure (repeat, [&] () {
+                         MTensor<float> t = buffer.GetBuffer ();
+                         delete[] t.data ();
+                       }));
+
+      std::vector<uint32_t> sizes;
+      std::vector<uint64_t> addrs;
+      for (uint32_t l = 0, offset = 0; l < layers && offset < modelFloats; l++)
+        {
+          uint32_t n = (l + 1 == layers) ? modelFloats - offset : modelFloats / layers;
+          sizes.push_back (n);
+          addrs.push_back (uint64_t (model.data () + offset));
+          offset += n;
+        }
+      MlBuffer layered (addrs.data (), sizes);
+      Report (std::cout, csv, "CopyFromMem", modelFloats, 0, 1, modelBytes,
+              Measure (repeat, [&] () { layered.CopyFromMem (); }));
+      Report (std::cout, csv, "PasteToMem", modelFloats, 0, 1, modelBytes,
+              Measure (repeat, [&] () { layered.PasteToMem (); }));
+
+      // model and fragment sizes
+      for (uint32_t packetSize : ParseList (packetSizes))
+        {
+          Ptr<SinkSocket> sink = CreateObject<SinkSocket> ();
+          Report (std::cout, csv, "BulkSend", modelFloats, packetSize, 1, modelBytes,
+                  Measure (repeat, [&] () { buffer.FedSend (sink, packetSize, DataRate ("1Gbps")); }));
+
+          FragmentSizer sizer (512, 65536, packetSize);   // packetSize as the MSS
+          Report (std::cout, csv, "BulkSendAdaptive", modelFloats, packetSize, 1, modelBytes,
+                  Measure (repeat, [&] () { buffer.FedSend (sink, &sizer, DataRate ("1Gbps")); }));
+
+          std::vector<std::pair<uint32_t, uint32_t> > fragments = Fragments (modelFloats, packetSize);
+          std::vector<Ptr<Packet> > packets;
+          for (const std::pair<uint32_t, uint32_t>& f : fragments)
+            {
+              uint32_t offset = f.first ? f.first - 1 : modelFloats - f.second;
+              Ptr<Packet> p = Create<Packet> ((const uint8_t*) (model.data () + offset), f.second * sizeof (float));
+              SeqTsSizeHeader header;
+              header.SetSeq (f.first);
+              header.SetSize (p->GetSize () + header.GetSerializedSize ());
+              p->AddHeader (header);
+              packets.push_back (p);
+            }
+
+          MTensor<float> target (modelFloats);
+          MlBuffer aggregate (target);
+          Report (std::cout, csv, "FedUpdateSpan", modelFloats, packetSize, 1, modelBytes,
+                  Measure (repeat, [&] () {
+                             for (const std::pair<uint32_t, uint32_t>& f : fragments)
+                               {
+                                 uint32_t offset = f.first ? f.first - 1 : modelFloats - f.second;
+                                 aggregate.FedUpdate (f.first, (const uint8_t*) (model.data () + offset), f.second * sizeof (float));
+                               }
+                           }));
+
+          // model and fragment sizes and client counts
+          for (uint32_t clients : ParseList (clientCounts))
+            {
+              Report (std::cout, csv, "FedAvgSpan", modelFloats, packetSize, clients, modelBytes * clients,
+                      Measure (repeat, [&] () {
+                                 aggregate.Zero ();
+                                 for (uint32_t c = 0; c < clients; c++)
+                                   {
+                                     for (const std::pair<uint32_t, uint32_t>& f : fragments)
+                                       {
+                                         uint32_t offset = f.first ? f.first - 1 : modelFloats - f.second;
+                                         aggregate.FedAvg (f.first, (const uint8_t*) (model.data () + offset), f.second * sizeof (float));
+                                       }
+                                   }
+                               }));
+
+              Report (std::cout, csv, "FedAvgPacket", modelFloats, packetSize, clients, modelBytes * clients,
+                      Measure (repeat, [&] () {
+                                 aggregate.Zero ();
+                                 for (uint32_t c = 0; c < clients; c++)
+                                   {
+                                     for (const Ptr<Packet>& p : packets)
+                                       {
+                                         Ptr<Packet> copy = p->Copy ();
+                                         aggregate.FedAvg (copy);
+                                       }
+                                   }
+                               }));
+            }
+          delete[] target.data ();
+        }
+    }
+
+  Simulator::Destroy ();
+  return 0;
+}
@@ -20,9 +20,12 @@
 #include "ns3/distributed-ml-tcp-helper.h"
 #include "ns3/distributed-ml-utils.h"
 #include "ns3/uinteger.h"
+#include "ns3/boolean.h"
 #include "ns3/names.h"
 #include "ns3/tcp-socket-factory.h"
+#include "ns3/abort.h"
 #include <vector>
+#include <fstream>
 
 #include "ns3/mobility-model.h"
 
@@ -42,6 +45,7 @@ DistributedMlTcpAgentHelper::SetAttribute (
   const AttributeValue &value)
 {
   m_factory.Set (name, value);
+  m_attributes.push_back (std::make_pair (name, value.Copy ()));
 }
 
 ObjectFactory
@@ -191,6 +195,80 @@ DistributedMlTcpAgentHelper::SetModel (ApplicationContainer apps, std::vector<ui
 }
 
 
+void
+DistributedMlTcpAgentHelper::SetModels (ApplicationContainer apps, std::vector<uint32_t> t_addrs, std::vector<uint32_t> sizes)
+{
+  NS_ABORT_MSG_IF (apps.GetN () == 0 || sizes.size () % apps.GetN () != 0, "SetModels needs the same number of tensors per application");
+  NS_ABORT_MSG_IF (t_addrs.size () != 2 * sizes.size (), "SetModels needs two uint32_t per tensor address");
+
+  uint32_t n = sizes.size () / apps.GetN ();
+  for (uint32_t i = 0; i < apps.GetN (); i++){
+    std::vector<uint32_t> addrs (t_addrs.begin () + 2 * n * i, t_addrs.begin () + 2 * n * (i + 1));
+    std::vector<uint32_t> appSizes (sizes.begin () + n * i, sizes.begin () + n * (i + 1));
+    apps.Get (i)->GetObject<DistributedMlTcpAgent>()->SetModel (addrs, appSizes);
+  }
+}
+
+
+void
+DistributedMlTcpAgentHelper::SetAirComp (ApplicationContainer apps, Ptr<AirCompAggregator> aircomp)
+{
+  for (ApplicationContainer::Iterator i = apps.Begin (); i != apps.End (); ++i){
+    (*i)->GetObject<DistributedMlTcpAgent>()->SetAirComp (aircomp);
+  }
+}
+
+
+static void
+WriteFlowStats (ApplicationContainer apps, std::string path)
+{
+  std::ofstream os (path.c_str ());
+  FlowStats::WriteHeader (os);
+  for (ApplicationContainer::Iterator i = apps.Begin (); i != apps.End (); ++i){
+    (*i)->GetObject<DistributedMlTcpAgent>()->WriteFlowStats (os);
+  }
+}
+
+
+void
+DistributedMlTcpAgentHelper::EnableFlowStats (ApplicationContainer apps, std::string path)
+{
+  for (ApplicationContainer::Iterator i = apps.Begin (); i != apps.End (); ++i){
+    (*i)->SetAttribute ("FlowStats", BooleanValue (true));
+  }
+  Simulator::ScheduleDestroy (&WriteFlowStats, apps, path);
+}
+
+
+ApplicationContainer
+DistributedMlTcpAgentHelper::SetupAgents (ApplicationContainer apps, NodeContainer nodes, Address address, std::string role,
+                                          uint32_t packet_size, uint32_t num_packets, uint32_t num_clients,
+                                          DeviceEnergyModelContainer energy, DataRate data_rate)
+{
+  NS_ABORT_MSG_IF (apps.GetN () > nodes.GetN (), "SetupAgents needs one node per application");
+  NS_ABORT_MSG_IF (energy.GetN () > 0 && energy.GetN () < apps.GetN (), "SetupAgents needs one energy model per application");
+
+  for (uint32_t i = 0; i < apps.GetN (); i++){
+    Ptr<Node> node = nodes.Get (i);
+    Ptr<DistributedMlTcpAgent> app = apps.Get (i)->GetObject<DistributedMlTcpAgent> ();
+
+    for (auto& attribute : m_attributes){
+      app->SetAttribute (attribute.first, *attribute.second);
+    }
+    app->SetAttributes (address, CreateSocket (node), packet_size, num_packets, num_clients, data_rate);
+    app->SetRole (role);
+
+    if (energy.GetN () > 0){
+      app->SetEnergy (DynamicCast<MlDeviceEnergyModel> (energy.Get (i)));
+    }
+
+    node->AddApplication (app);
+  }
+
+  return apps;
+}
+
+
 
 MlDeviceEnergyModelHelper::MlDeviceEnergyModelHelper ()
 {
@@ -30,6 +30,7 @@
 #include "ns3/distributed-ml-utils.h"
 #include "ns3/uinteger.h"
 #include "ns3/names.h"
+#include "ns3/device-energy-model-container.h"
 
 
 #include <vector>
@@ -117,6 +118,37 @@ public:
 
   void SetModel (ApplicationContainer apps, std::vector<uint32_t> t_addrs, std::vector<uint32_t> sizes);
 
+  /**
+   * Give every application its own model.
+   *
+   * All models have the same layout: sizes holds the tensor sizes of every application one after the
+   * other, sizes.size()/apps.GetN() per application, and t_addrs the matching addresses split in two
+   * uint32_t as for SetModel.
+   */
+  void SetModels (ApplicationContainer apps, std::vector<uint32_t> t_addrs, std::vector<uint32_t> sizes);
+
+  void SetAirComp (ApplicationContainer apps, Ptr<AirCompAggregator> aircomp);
+
+  /**
+   * Collect the per-round transport statistics of the applications (their FlowStats attribute, off by default)
+   * and write them to path when the simulator is destroyed, one tab separated line per connection and round
+   * (see FlowStats::WriteHeader). Call it before the applications start.
+   */
+  void EnableFlowStats (ApplicationContainer apps, std::string path);
+
+  /**
+   * Set up agents created outside the helper (e.g. Python subclasses) in one call.
+   *
+   * The i-th application gets the attributes recorded with SetAttribute, a new socket on the i-th node,
+   * the remote address, sizes and role and, if energy is not empty, the i-th MlDeviceEnergyModel.
+   * It is then added to its node.
+   *
+   * \returns the applications
+   */
+  ApplicationContainer SetupAgents (ApplicationContainer apps, NodeContainer nodes, Address address, std::string role,
+                                    uint32_t packet_size=512, uint32_t num_packets=3, uint32_t num_clients=3,
+                                    DeviceEnergyModelContainer energy=DeviceEnergyModelContainer (), DataRate data_rate=DataRate ("10Mbps"));
+
   virtual Ptr<DistributedMlTcpAgent> InstallPriv (Ptr<Node> node) const;
 
 protected:
@@ -133,6 +165,8 @@ private:
    */
   
   ObjectFactory m_factory; //!< Object factory.
+
+  std::vector<std::pair<std::string, Ptr<AttributeValue> > > m_attributes; //!< Attributes set with SetAttribute, for SetupAgents
 };
 
 
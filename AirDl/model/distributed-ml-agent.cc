@@ -15,6 +15,14 @@
 #include "ns3/uinteger.h"
 #include "ns3/trace-source-accessor.h"
 #include "ns3/boolean.h"
+#include "ns3/double.h"
+#include "ns3/tcp-socket-state.h"
+#include "ns3/tcp-socket-base.h"
+#include "ns3/tcp-header.h"
+
+#include <cmath>
+#include <sstream>
+#include <chrono>
 
 
 
@@ -32,7 +40,7 @@ DistributedMlTcpAgent::GetTypeId (void)
     .SetGroupName("Applications")
     .AddConstructor<DistributedMlTcpAgent> ()
     .AddAttribute ("NumPackets",
-                   "The number of packets the application will send",
+                   "The number of models the application will send, the number of broadcast rounds for a server",
                    UintegerValue (3),
                    MakeUintegerAccessor (&DistributedMlTcpAgent::m_nPackets),
                    MakeUintegerChecker<uint32_t> ())
@@ -61,6 +69,51 @@ DistributedMlTcpAgent::GetTypeId (void)
                    UintegerValue (3),
                    MakeUintegerAccessor (&DistributedMlTcpAgent::m_clients),
                    MakeUintegerChecker<uint32_t> ())
+    .AddAttribute ("AdaptiveFragment",
+                   "Pick the fragment size per connection from the MSS, the observed losses and the model size, instead of PacketSize",
+                   BooleanValue (false),
+                   MakeBooleanAccessor (&DistributedMlTcpAgent::m_adaptiveFragment),
+                   MakeBooleanChecker ())
+    .AddAttribute ("MinFragmentSize",
+                   "The smallest fragment payload used by adaptive fragmentation",
+                   UintegerValue (512),
+                   MakeUintegerAccessor (&DistributedMlTcpAgent::m_minFragment),
+                   MakeUintegerChecker<uint32_t> (4))
+    .AddAttribute ("MaxFragmentSize",
+                   "The largest fragment payload used by adaptive fragmentation",
+                   UintegerValue (65536),
+                   MakeUintegerAccessor (&DistributedMlTcpAgent::m_maxFragment),
+                   MakeUintegerChecker<uint32_t> (4))
+    .AddAttribute ("TriggerPolicy",
+                   "When a received model triggers processing: custom (calls TriggerLogic), count, fraction, deadline or every",
+                   StringValue ("custom"),
+                   MakeStringAccessor (&DistributedMlTcpAgent::m_triggerPolicy),
+                   MakeStringChecker ())
+    .AddAttribute ("CountThreshold",
+                   "With the count policy, the number of models to wait for in a round, 0 waits for NumClients",
+                   UintegerValue (0),
+                   MakeUintegerAccessor (&DistributedMlTcpAgent::m_countThreshold),
+                   MakeUintegerChecker<uint32_t> ())
+    .AddAttribute ("ClientFraction",
+                   "With the fraction policy, the share of NumClients to wait for in a round",
+                   DoubleValue (1.0),
+                   MakeDoubleAccessor (&DistributedMlTcpAgent::m_clientFraction),
+                   MakeDoubleChecker<double> (0, 1))
+    .AddAttribute ("Deadline",
+                   "With the deadline policy, trigger this long after the global model of a round was sent, or earlier once all NumClients arrived. Must be positive",
+                   TimeValue (Seconds (0)),
+                   MakeTimeAccessor (&DistributedMlTcpAgent::m_deadline),
+                   MakeTimeChecker ())
+    .AddAttribute ("UpdatesPerTrigger",
+                   "With the every policy, trigger once every k received models",
+                   UintegerValue (1),
+                   MakeUintegerAccessor (&DistributedMlTcpAgent::m_updatesPerTrigger),
+                   MakeUintegerChecker<uint32_t> (1))
+    .AddAttribute ("FlowStats",
+                   "Collect per-round transport statistics of every connection, see GetFlowRecords. Set by DistributedMlTcpAgentHelper::EnableFlowStats",
+                   BooleanValue (false),
+                   MakeBooleanAccessor (&DistributedMlTcpAgent::m_collectFlowStats),
+                   MakeBooleanChecker ())
     .AddAttribute ("Role",
                    "The role this agent will play",
                    StringValue ("client"),
@@ -177,6 +230,36 @@ DistributedMlTcpAgent::GetRole(void){
 }
 
 
+uint32_t
+DistributedMlTcpAgent::GetCount(void){
+  return m_count;
+}
+
+
+uint32_t
+DistributedMlTcpAgent::GetSeq(void){
+  return m_seq;
+}
+
+
+std::vector<FlowRecord>
+DistributedMlTcpAgent::GetFlowRecords(void){
+  std::vector<FlowRecord> records;
+  for (auto& flow : m_flowOrder){
+    records.insert (records.end (), flow->GetRecords ().begin (), flow->GetRecords ().end ());
+  }
+  return records;
+}
+
+
+void
+DistributedMlTcpAgent::WriteFlowStats(std::ostream& os){
+  for (auto& flow : m_flowOrder){
+    flow->Write (os, m_id);
+  }
+}
+
+
 void 
 DistributedMlTcpAgent::SetEnergy(Ptr<MlDeviceEnergyModel> mlEnergy){
 
@@ -193,6 +276,46 @@ DistributedMlTcpAgent::ChaneEnergyState(MlState state){
     m_mlEnergy->ChangeState(state);
 
   } 
+
+  if (m_timeline && int (state) != m_energyState){
+    if (m_energyState >= 0){
+      TimelineSpan (TimelineRecorder::ENERGY, m_energyState == MlState::BUSY ? "BUSY" : "IDLE", m_energySince, Simulator::Now ());
+    }
+    m_energyState = state;
+    m_energySince = Simulator::Now ();
+  }
+}
+
+
+static double
+WallMicroSeconds (void)
+{
+  return std::chrono::duration<double, std::micro> (std::chrono::steady_clock::now ().time_since_epoch ()).count ();
+}
+
+
+uint32_t
+DistributedMlTcpAgent::ConnectionTrack (Ptr<Socket> socket)
+{
+  auto it = m_tracks.find (socket);
+  if (it == m_tracks.end ()){
+    it = m_tracks.insert (std::make_pair (socket, TimelineRecorder::CONNECTION + m_tracks.size ())).first;
+  }
+  return it->second;
+}
+
+
+void
+DistributedMlTcpAgent::TimelineSpan (uint32_t track, const char* name, Time start, Time end, double wallUs)
+{
+  if (m_timeline){
+    m_timeline->Span (m_id, track, name, start, end, wallUs);
+  }
+}
+
+void 
+DistributedMlTcpAgent::SetAirComp(Ptr<AirCompAggregator> aircomp){
+  m_airComp = aircomp;
 }
 
 bool
@@ -244,8 +367,8 @@ DistributedMlTcpAgent::Initialize(void){
 
     NS_LOG_INFO("SERVER:: Initialize one server...");
     Buff.Zero();
-    m_nPackets *= m_clients;
-    NS_LOG_INFO("SERVER:: Number of required packets: " << m_nPackets);
+    // one unit of the budget per broadcast round, whatever the number of connections it goes to
+    NS_LOG_INFO("SERVER:: Number of rounds: " << m_nPackets);
 
     if (m_socket->Bind (m_remote) == -1)
     {
@@ -264,8 +387,25 @@ DistributedMlTcpAgent::Initialize(void){
 void
 DistributedMlTcpAgent::StartApplication (void)
 {
+  m_timeline = TimelineRecorder::Get ();
+
+  // a zero deadline would expire again as soon as it is re-armed, without simulated time moving
+  NS_ABORT_MSG_IF (IsServer () && m_triggerPolicy.compare ("deadline") == 0 && m_deadline <= Seconds (0),
+                   "The deadline trigger policy needs a positive Deadline");
+
   Initialize();
 
+  if (m_timeline){
+    Buff.SetSentCallback (MakeCallback (&DistributedMlTcpAgent::HandleSent, this));
+  }
+
+  if (m_collectFlowStats){
+    Buff.SetRetryCallback (MakeCallback (&DistributedMlTcpAgent::HandleRetry, this));
+    if (IsClient ()){
+      GetFlowStats (m_socket, m_remote);
+    }
+  }
+
   if(IsServer()){
     m_socket->SetAcceptCallback (
             MakeNullCallback<bool, Ptr<Socket>, const Address &> (),
@@ -287,6 +427,17 @@ DistributedMlTcpAgent::StopApplication (void)
     Simulator::Cancel (m_sendEvent);
   }
 
+  if (m_deadlineEvent.IsRunning ())
+  {
+    Simulator::Cancel (m_deadlineEvent);
+  }
+
+  if (m_timeline && m_energyState >= 0)
+  {
+    TimelineSpan (TimelineRecorder::ENERGY, m_energyState == MlState::BUSY ? "BUSY" : "IDLE", m_energySince, Simulator::Now ());
+    m_energyState = -1;
+  }
+
   while(!m_socketList.empty ()) //these are accepted sockets, close them
   {
     Ptr<Socket> acceptedSocket = m_socketList.front ();
@@ -307,7 +458,26 @@ DistributedMlTcpAgent::HandleAccept (Ptr<Socket> s, const Address& from)
 {
   NS_LOG_FUNCTION (this << s << from);
 
-  HandleSynchron(s, 0);
+  if (m_collectFlowStats){
+    GetFlowStats (s, from);
+  }
+  if (InetSocketAddress::IsMatchingType (from)
+      && InetSocketAddress::ConvertFrom (from).GetPort () == AirCompAggregator::UploadPort)
+    {
+      // an AirComp aggregator only uploads cell averages. The clients get the model over their own connections
+      // and answer through their aggregator, so the versions sent to them are not tracked
+      m_uploaders.insert (s);
+      m_sentRounds.clear ();
+    }
+  else
+    {
+      HandleSynchron(s, 0);
+      if (m_uploaders.empty ())
+        {
+          m_sentRounds[s].push_back (m_round);
+        }
+    }
+  ArmDeadline ();
   m_socketList.push_back (s);
   NS_LOG_INFO("Server:: number of accepted socket: " << m_socketList.size());
   s->SetRecvCallback (MakeCallback (&DistributedMlTcpAgent::HandleRead, this));
@@ -316,11 +486,141 @@ DistributedMlTcpAgent::HandleAccept (Ptr<Socket> s, const Address& from)
 
 
 void DistributedMlTcpAgent::HandleSynchron(Ptr<Socket> socket, uint32_t availableBufferSize){
+  double wall = WallMicroSeconds ();
   Buff.CopyFromMem();
+  TimelineSpan (TimelineRecorder::ML, "CopyFromMem", Simulator::Now (), Simulator::Now (), WallMicroSeconds () - wall);
   NS_LOG_INFO("ID:: " << m_id << "  Calling HandleSynchron At time " << Simulator::Now ().As (Time::S));
 
-  Buff.FedSend (socket, m_packetSize, m_dataRate);
+  SendModel (socket);
+
+}
+
+
+static void
+SizerCongStateChange (FragmentSizer* sizer, TcpSocketState::TcpCongState_t oldState, TcpSocketState::TcpCongState_t newState)
+{
+  bool wasLossy = oldState == TcpSocketState::CA_RECOVERY || oldState == TcpSocketState::CA_LOSS;
+  bool isLossy = newState == TcpSocketState::CA_RECOVERY || newState == TcpSocketState::CA_LOSS;
+  if (isLossy && !wasLossy)
+    {
+      sizer->NotifyLoss ();
+    }
+}
+
+
+FragmentSizer*
+DistributedMlTcpAgent::GetSizer (Ptr<Socket> socket)
+{
+  auto it = m_sizers.find (socket);
+  if (it == m_sizers.end ())
+    {
+      FragmentSizer sizer (m_minFragment, m_maxFragment);
+      UintegerValue mss;
+      if (socket->GetAttributeFailSafe ("SegmentSize", mss))
+        {
+          sizer.SetMss (mss.Get ());
+        }
+      it = m_sizers.insert (std::make_pair (socket, sizer)).first;
+      socket->TraceConnectWithoutContext ("CongState", MakeBoundCallback (&SizerCongStateChange, &it->second));
+    }
+  return &it->second;
+}
+
+
+static void
+FlowTx (Ptr<FlowStats> stats, Ptr<const Packet> packet, const TcpHeader& header, Ptr<const TcpSocketBase> socket)
+{
+  stats->NotifyTx (header.GetSequenceNumber (), packet->GetSize ());
+}
+
+
+static void
+FlowRtt (Ptr<FlowStats> stats, Time oldRtt, Time newRtt)
+{
+  stats->NotifyRtt (newRtt.GetSeconds ());
+}
+
+
+static void
+FlowDataSent (Ptr<FlowStats> stats, Ptr<Socket> socket, uint32_t bytes)
+{
+  stats->NotifyAcked (bytes);
+}
+
+
+Ptr<FlowStats>
+DistributedMlTcpAgent::GetFlowStats (Ptr<Socket> socket, Address peer)
+{
+  auto it = m_flows.find (socket);
+  if (it != m_flows.end ())
+    {
+      return it->second;
+    }
+
+  std::ostringstream name;
+  if (InetSocketAddress::IsMatchingType (peer))
+    {
+      name << InetSocketAddress::ConvertFrom (peer).GetIpv4 ();
+    }
+  else
+    {
+      name << peer;
+    }
+
+  Ptr<FlowStats> stats = Create<FlowStats> (name.str ());
+  m_flows[socket] = stats;
+  m_flowOrder.push_back (stats);
+
+  socket->TraceConnectWithoutContext ("Tx", MakeBoundCallback (&FlowTx, stats));
+  socket->TraceConnectWithoutContext ("RTT", MakeBoundCallback (&FlowRtt, stats));
+  // TcpSocketBase notifies DataSent with the newly acknowledged bytes
+  socket->SetDataSentCallback (MakeBoundCallback (&FlowDataSent, stats));
+  return stats;
+}
+
+
+void
+DistributedMlTcpAgent::HandleRetry (Ptr<Socket> socket)
+{
+  auto it = m_flows.find (socket);
+  if (it != m_flows.end ())
+    {
+      it->second->NotifyRetry ();
+    }
+}
+
+
+void
+DistributedMlTcpAgent::HandleSent (Ptr<Socket> socket)
+{
+  auto it = m_sendStart.find (socket);
+  if (it != m_sendStart.end ())
+    {
+      TimelineSpan (ConnectionTrack (socket), "BulkSend", it->second, Simulator::Now ());
+      m_sendStart.erase (it);
+    }
+}
+
 
+EventId
+DistributedMlTcpAgent::SendModel (Ptr<Socket> socket)
+{
+  if (m_timeline)
+    {
+      m_sendStart[socket] = Simulator::Now ();
+    }
+
+  auto it = m_flows.find (socket);
+  if (it != m_flows.end ())
+    {
+      it->second->NotifySendStart ();
+    }
+
+  if (m_adaptiveFragment)
+    {
+      return Buff.FedSend (socket, GetSizer (socket), m_dataRate);
+    }
+  return Buff.FedSend (socket, m_packetSize, m_dataRate);
 }
 
 
@@ -328,6 +628,7 @@ void
 DistributedMlTcpAgent::HandleRead (Ptr<Socket> socket)
 {
   NS_LOG_FUNCTION (this << socket);
+  HostTimer timer (HostProfiler::HANDLE_READ);
 
   Ptr<Packet> packet;
   Address from;
@@ -361,6 +662,14 @@ DistributedMlTcpAgent::HandleRead (Ptr<Socket> socket)
 void DistributedMlTcpAgent::HandleSend(Ptr<Socket> socket, uint32_t availableBufferSize){
   NS_LOG_INFO( "ID:: " << m_id << " calling HandleSend At time " << Simulator::Now ().As (Time::S) );
   if (GetTrigger()){
+    if (IsServer ())
+      {
+        // close the round, the updates received until the broadcast are stale
+        m_roundOpen = false;
+        Simulator::Cancel (m_deadlineEvent);
+        m_TV.Initialize ();
+      }
+
     ChaneEnergyState(MlState::IDLE);
 
     // if(m_id>0){
@@ -369,20 +678,40 @@ void DistributedMlTcpAgent::HandleSend(Ptr<Socket> socket, uint32_t availableBuf
 
     SetTrigger(false);
 
+    Time now = Simulator::Now ();
+    double wall = WallMicroSeconds ();
+
     Buff.PasteToMem();  //TODO: PasteToMem has something wrong
 
-    double delay_process = Processing();
+    double wallPaste = WallMicroSeconds ();
+    TimelineSpan (TimelineRecorder::ML, "PasteToMem", now, now, wallPaste - wall);
+
+    double delay_process;
+    {
+      HostTimer timer (HostProfiler::PROCESSING);
+      delay_process = Processing();
+    }
 
     // std::cout << "ID:: " << m_id << "delay value: " << delay_process << std::endl;
 
+    double wallProcess = WallMicroSeconds ();
+
     Buff.CopyFromMem();
     
     Time tNext_process (Seconds (delay_process));
+    TimelineSpan (TimelineRecorder::ML, "Processing", now, now + tNext_process, wallProcess - wallPaste);
+    TimelineSpan (TimelineRecorder::ML, "CopyFromMem", now + tNext_process, now + tNext_process, WallMicroSeconds () - wallProcess);
     Simulator::Schedule (tNext_process, &DistributedMlTcpAgent::ChaneEnergyState, this, MlState::BUSY);
 
-    double delay_sleep = Sleeping();
+    wall = WallMicroSeconds ();
+    double delay_sleep;
+    {
+      HostTimer timer (HostProfiler::SLEEPING);
+      delay_sleep = Sleeping();
+    }
 
     Time tNext_sleep (Seconds (delay_process+delay_sleep));
+    TimelineSpan (TimelineRecorder::ML, "Sleeping", now + tNext_process, now + tNext_sleep, WallMicroSeconds () - wall);
     Simulator::Schedule (tNext_sleep, &DistributedMlTcpAgent::SendPacket, this, socket);
 
   }
@@ -400,7 +729,11 @@ DistributedMlTcpAgent::SendPacket(Ptr<Socket> socket){
   socket->GetPeerName (to);
 
   if(IsClient()){
-    m_sendEvent = Buff.FedSend (socket, m_packetSize, m_dataRate);
+    if (m_airComp){
+      m_airComp->Transmit (m_id, Buff.GetTensor ());
+    }else{
+      m_sendEvent = SendModel (socket);
+    }
     m_nPackets-=1;
 
   }else if(IsServer()){
@@ -410,22 +743,32 @@ DistributedMlTcpAgent::SendPacket(Ptr<Socket> socket){
       NS_LOG_INFO( "ID:: " << m_id << "  Calling m_allowBroadcast At time " << Simulator::Now ().As (Time::S) << "at size: " << m_socketList.size() );
 
     }
+    NS_ABORT_MSG_IF (m_nPackets == 0, "SERVER:: a round was sent after the last one");
+    m_round += 1;
     while(!memory_socketList.empty ()) //these are accepted sockets, close them
     {
       Ptr<Socket> socket = memory_socketList.front ();      
+      memory_socketList.pop_front();
+      if (m_uploaders.count (socket))
+        {
+          continue;
+        }
       
       Address from, to;
       socket->GetSockName (from);
       socket->GetPeerName (to);
       
-      m_sendEvent = Buff.FedSend (socket, m_packetSize, m_dataRate);
-
-      m_nPackets-=1;
-      memory_socketList.pop_front();
+      m_sendEvent = SendModel (socket);
+      if (m_uploaders.empty ())
+        {
+          m_sentRounds[socket].push_back (m_round);
+        }
     }
+    m_nPackets-=1;
 
     Buff.Zero();   //Set Buff value to be zero, to FedAvg new data
-    m_TV.Initialize();
+    m_roundOpen = true;
+    ArmDeadline ();
   }
 
   NS_LOG_INFO ("ID:: " << m_id << " Finished SendPacket At time: " << Simulator::Now ().As (Time::S));
@@ -437,57 +780,76 @@ void
 DistributedMlTcpAgent::PacketReceived (Ptr<Socket> socket, const Ptr<Packet> &p, const Address &from,
                             const Address &localAddress)
 {
-  SeqTsSizeHeader header;
-  Ptr<Packet> buffer;
-  
+  HostTimer timer (HostProfiler::PACKET_RECEIVED);
+
   auto itBuffer = m_buffer.find (from);
   if (itBuffer == m_buffer.end ())
     {
-      itBuffer = m_buffer.insert (std::make_pair (from, Create<Packet> (0))).first;
+      itBuffer = m_buffer.insert (std::make_pair (from, StreamReassembler ())).first;
     }
 
-  buffer = itBuffer->second;
-  buffer->AddAtEnd (p);
-  buffer->PeekHeader (header);
+  auto itFlow = m_flows.find (socket);
+  if (itFlow != m_flows.end ())
+    {
+      itFlow->second->NotifyReceived (p->GetSize ());
+    }
 
-  NS_ABORT_IF (header.GetSize () == 0);
+  StreamReassembler& buffer = itBuffer->second;
+  buffer.Append (p);
 
-  while (buffer->GetSize () >= header.GetSize () && header.GetSize () > 20)
-    { 
+  uint32_t seq;
+  const uint8_t* payload;
+  uint32_t size;
 
-      Ptr<Packet> complete = buffer->CreateFragment (0, static_cast<uint32_t> (header.GetSize ()));
-      buffer->RemoveAtStart (static_cast<uint32_t> (header.GetSize ()));
+  while (buffer.Next (seq, payload, size))
+    { 
+      if (m_timeline && m_recvStart.find (socket) == m_recvStart.end ())
+        {
+          m_recvStart[socket] = Simulator::Now ();
+        }
 
       if(IsClient()){
-        m_seq = Buff.FedUpdate(complete);
+        m_seq = Buff.FedUpdate(seq, payload, size);
       }else if(IsServer()){
-        m_seq = Buff.FedAvg(complete);
+        // a dropped fragment only matters if it ends the model
+        m_seq = FreshUpdate (socket) ? Buff.FedAvg(seq, payload, size) : seq;
       }
+      buffer.Consume ();
       
       if (m_seq==0)
       {      
         m_seq=1;
+
+        if (IsServer ())
+          {
+            bool fresh = FreshUpdate (socket);
+            m_updateRound.erase (socket);
+            if (!fresh)
+              {
+                NS_LOG_INFO ("ID:: " << m_id << " dropped a stale model At time " << Simulator::Now ().As (Time::S));
+                m_recvStart.erase (socket);
+                continue;
+              }
+          }
         m_count += 1;
+
+        auto itStart = m_recvStart.find (socket);
+        if (itStart != m_recvStart.end ())
+          {
+            TimelineSpan (ConnectionTrack (socket), "receive-model", itStart->second, Simulator::Now ());
+            m_recvStart.erase (itStart);
+          }
         NS_LOG_INFO("ID:: " << m_id << "  SetTrigger At time " << Simulator::Now ().As (Time::S));
         
         if(IsServer()){
           memory_socketList.push_back(socket);
         }
 
-        if(TriggerLogic()){
+        if(EvaluateTrigger(socket)){
           SetTrigger(true);
         }
 
       }
-
-      if (buffer->GetSize () > header.GetSerializedSize ())
-        {
-          buffer->PeekHeader (header);
-        }
-      else
-        {
-          break;
-        }
       
     }
     
@@ -500,5 +862,98 @@ bool DistributedMlTcpAgent::TriggerLogic(){
 }
 
 
+bool
+DistributedMlTcpAgent::EvaluateTrigger (Ptr<Socket> socket)
+{
+  if (m_triggerPolicy.compare ("custom") == 0)
+    {
+      return TriggerLogic ();
+    }
+  else if (m_triggerPolicy.compare ("count") == 0)
+    {
+      return m_count == (m_countThreshold > 0 ? m_countThreshold : m_clients);
+    }
+  else if (m_triggerPolicy.compare ("fraction") == 0)
+    {
+      uint32_t required = std::max<uint32_t> (1, std::ceil (m_clientFraction * m_clients));
+      return m_count == required;
+    }
+  else if (m_triggerPolicy.compare ("deadline") == 0)
+    {
+      // all models arrived before the deadline, armed when the global model was sent (see ArmDeadline)
+      return m_count == m_clients;
+    }
+  else if (m_triggerPolicy.compare ("every") == 0)
+    {
+      return m_count % m_updatesPerTrigger == 0;
+    }
+
+  NS_LOG_ERROR ("ERROR:: Unknown trigger policy " << m_triggerPolicy << ", falling back to TriggerLogic");
+  return TriggerLogic ();
+}
+
+
+void
+DistributedMlTcpAgent::HandleDeadline (Ptr<Socket> socket)
+{
+  NS_LOG_INFO ("ID:: " << m_id << " deadline reached with " << m_count << " models At time " << Simulator::Now ().As (Time::S));
+
+  if (m_count == 0)
+    {
+      // nothing to average yet, give the round another deadline
+      ArmDeadline ();
+      return;
+    }
+
+  SetTrigger (true);
+  if (m_nPackets > 0)
+    {
+      HandleSend (socket, 0);
+    }
+}
+
+
+void
+DistributedMlTcpAgent::ArmDeadline (void)
+{
+  if (m_triggerPolicy.compare ("deadline") == 0 && !m_deadlineEvent.IsRunning ())
+    {
+      m_deadlineEvent = Simulator::Schedule (m_deadline, &DistributedMlTcpAgent::HandleDeadline, this, m_socket);
+    }
+}
+
+
+bool
+DistributedMlTcpAgent::FreshUpdate (Ptr<Socket> socket)
+{
+  auto itRound = m_updateRound.find (socket);
+  if (itRound == m_updateRound.end ())
+    {
+      uint32_t round = std::numeric_limits<uint32_t>::max ();  // never fresh
+      if (m_uploaders.count (socket))
+        {
+          // first fragment of a cell average: it belongs to the round open when it starts arriving
+          if (m_roundOpen)
+            {
+              round = m_round;
+            }
+        }
+      else
+        {
+          // first fragment of an update: it was trained on the oldest model sent to this client and not answered
+          // yet, with more updates than models sent it is never fresh
+          std::deque<uint32_t>& sent = m_sentRounds[socket];
+          if (!sent.empty ())
+            {
+              round = sent.front ();
+              sent.pop_front ();
+            }
+        }
+      itRound = m_updateRound.insert (std::make_pair (socket, round)).first;
+    }
+  return itRound->second == m_round && m_roundOpen;
+}
+
+
 
 }
\ No newline at end of file
@@ -19,8 +19,14 @@
 #include "ns3/traced-value.h"
 
 #include "ns3/distributed-ml-utils.h"
+#include "ns3/distributed-ml-aircomp.h"
+#include "ns3/distributed-ml-traces.h"
 #include <vector>
 #include <unordered_map>
+#include <map>
+#include <deque>
+#include <set>
+#include <limits>
 
 
 namespace ns3{
@@ -60,12 +66,25 @@ public:
 
   void ChaneEnergyState(MlState state);
 
+  // Upload models through an over-the-air aggregator instead of the socket
+  void SetAirComp(Ptr<AirCompAggregator> aircomp);
+
   void EnableBroadcast(void);
 
   void DisableBroadcast(void);
 
   MlBuffer GetBuff(void){return Buff;};
 
+  uint32_t GetCount(void);  // models received in the current round
+
+  uint32_t GetSeq(void);
+
+  // The per-round FlowRecords of every connection of the agent, in connection then round order
+  std::vector<FlowRecord> GetFlowRecords(void);
+
+  // Write the FlowRecords as lines of FlowStats::WriteHeader
+  void WriteFlowStats(std::ostream& os);
+
   TracedVariables m_TV = TracedVariables(m_count, m_seq, m_trigged);
 
 
@@ -81,6 +100,7 @@ protected:
     return 0.0;
   };
 
+  // Only called with TriggerPolicy "custom", the built-in policies are evaluated in C++
   virtual bool TriggerLogic(void);
 
   virtual void StartApplication (void);
@@ -107,6 +127,28 @@ private:
 
   void HandleSynchron(Ptr<Socket> socket, uint32_t availableBufferSize);
 
+  EventId SendModel(Ptr<Socket> socket);  // FedSend Buff with fixed or adaptive fragments
+
+  FragmentSizer* GetSizer(Ptr<Socket> socket);
+
+  bool EvaluateTrigger(Ptr<Socket> socket);  // apply m_triggerPolicy once a whole model has been received
+
+  void HandleDeadline(Ptr<Socket> socket);
+
+  void ArmDeadline(void);  // "deadline": start the timer of the round whose global model is being sent
+
+  bool FreshUpdate(Ptr<Socket> socket);  // server: whether a fragment counts toward the open round
+
+  Ptr<FlowStats> GetFlowStats(Ptr<Socket> socket, Address peer);  // created and hooked on the first call
+
+  void HandleRetry(Ptr<Socket> socket);
+
+  void HandleSent(Ptr<Socket> socket);  // the whole model was accepted by the socket
+
+  uint32_t ConnectionTrack(Ptr<Socket> socket);  // timeline track of one connection
+
+  void TimelineSpan(uint32_t track, const char* name, Time start, Time end, double wallUs=-1);
+
   struct AddressHash
   {
     size_t operator() (const Address &x) const
@@ -117,7 +159,7 @@ private:
     }
   };
 
-  std::unordered_map<Address, Ptr<Packet>, AddressHash> m_buffer; //!< Buffer for received packets
+  std::unordered_map<Address, StreamReassembler, AddressHash> m_buffer; //!< Reassembly buffer per peer
 
 
   Ptr<Socket>     m_socket;
@@ -128,6 +170,11 @@ private:
   uint32_t        m_nPackets;
   DataRate        m_dataRate;
 
+  bool            m_adaptiveFragment;
+  uint32_t        m_minFragment;
+  uint32_t        m_maxFragment;
+  std::map<Ptr<Socket>, FragmentSizer> m_sizers;  // fragment sizer per connection, if adaptive
+
   EventId         m_sendEvent;
 
   //if received header seq==0, wait for FedSend
@@ -140,6 +187,33 @@ private:
   std::string     m_role;
   uint32_t        m_clients;  //the number of clients that server has to received, if set set syncronous
 
+  std::string     m_triggerPolicy;      // "custom", "count", "fraction", "deadline" or "every"
+  uint32_t        m_countThreshold;     // "count": models to wait for, 0 means m_clients
+  double          m_clientFraction;     // "fraction": share of m_clients to wait for
+  Time            m_deadline;           // "deadline": time after the global model of a round was sent
+  uint32_t        m_updatesPerTrigger;  // "every": trigger once every k received models
+  EventId         m_deadlineEvent;
+
+  // Server rounds: m_round is the version of the latest global model sent, the round being aggregated. From the
+  // trigger to the broadcast the round is closed and the updates received meanwhile are dropped, so they are
+  // neither averaged into the model about to be sent nor counted toward the next round.
+  uint32_t        m_round = 0;
+  bool            m_roundOpen = true;
+  std::map<Ptr<Socket>, std::deque<uint32_t> > m_sentRounds;  // versions sent to each client and not answered yet
+  std::map<Ptr<Socket>, uint32_t> m_updateRound;               // round of the update being received from each client
+  std::set<Ptr<Socket> > m_uploaders;                          // AirComp aggregators, sent no model
+
+  bool            m_collectFlowStats;
+  std::map<Ptr<Socket>, Ptr<FlowStats> > m_flows;  // transport statistics per connection
+  std::vector<Ptr<FlowStats> > m_flowOrder;         // m_flows in connection order
+
+  Ptr<TimelineRecorder> m_timeline;                 // 0 unless the timeline is enabled
+  std::map<Ptr<Socket>, Time> m_recvStart;          // first fragment of the model being received
+  std::map<Ptr<Socket>, Time> m_sendStart;          // start of the model being sent
+  std::map<Ptr<Socket>, uint32_t> m_tracks;
+  int             m_energyState = -1;               // last state given to ChaneEnergyState
+  Time            m_energySince;
+
 
   std::list<Ptr<Socket>>  memory_socketList; // socket list to record socket which has sent seq 0
 
@@ -149,6 +223,8 @@ private:
 
   Ptr<MlDeviceEnergyModel> m_mlEnergy;
 
+  Ptr<AirCompAggregator> m_airComp;
+
   // WifiRadioEnergyModel::WifiRadioEnergyDepletionCallback m_depletionCallback; 
   
 };
@@ -0,0 +1,356 @@
+#include "ns3/distributed-ml-aircomp.h"
+
+#include "ns3/log.h"
+#include "ns3/uinteger.h"
+#include "ns3/double.h"
+#include "ns3/boolean.h"
+#include "ns3/string.h"
+#include "ns3/inet-socket-address.h"
+#include "ns3/socket.h"
+#include "ns3/simulator.h"
+#include "ns3/packet.h"
+
+#include <cmath>
+#include <limits>
+
+
+namespace ns3{
+
+NS_LOG_COMPONENT_DEFINE ("DistributedMlAirComp");
+
+NS_OBJECT_ENSURE_REGISTERED (AirCompAggregator);
+
+TypeId
+AirCompAggregator::GetTypeId (void)
+{
+  static TypeId tid = TypeId ("ns3::AirCompAggregator")
+    .SetParent<Application> ()
+    .SetGroupName("Applications")
+    .AddConstructor<AirCompAggregator> ()
+    .AddAttribute ("PacketSize",
+                   "The size of packets forwarded to the server",
+                   UintegerValue (516),
+                   MakeUintegerAccessor (&AirCompAggregator::m_packetSize),
+                   MakeUintegerChecker<uint32_t> ())
+    .AddAttribute ("RemoteAddress",
+                   "The address of the server the cell aggregate is forwarded to",
+                   AddressValue (),
+                   MakeAddressAccessor (&AirCompAggregator::m_remote),
+                   MakeAddressChecker ())
+    .AddAttribute ("DataRate",
+                   "The forwarding data rate",
+                   DataRateValue (DataRate ("1Mbps")),
+                   MakeDataRateAccessor (&AirCompAggregator::m_dataRate),
+                   MakeDataRateChecker ())
+    .AddAttribute ("NumTransmitters",
+                   "The number of clients transmitting in one slot",
+                   UintegerValue (1),
+                   MakeUintegerAccessor (&AirCompAggregator::m_numTransmitters),
+                   MakeUintegerChecker<uint32_t> (1))
+    .AddAttribute ("SymbolRate",
+                   "The number of analog model parameters carried per second",
+                   DoubleValue (1e6),
+                   MakeDoubleAccessor (&AirCompAggregator::m_symbolRate),
+                   MakeDoubleChecker<double> (0))
+    .AddAttribute ("SlotTimeout",
+                   "Close the slot this long after the first transmission even if clients are missing, 0 waits for all",
+                   TimeValue (Seconds (0)),
+                   MakeTimeAccessor (&AirCompAggregator::m_slotTimeout),
+                   MakeTimeChecker ())
+    .AddAttribute ("Fading",
+                   "The fading model of the uplink: none or rayleigh",
+                   StringValue ("none"),
+                   MakeStringAccessor (&AirCompAggregator::m_fading),
+                   MakeStringChecker ())
+    .AddAttribute ("ChannelInversion",
+                   "Whether clients pre-scale their signal by the inverse of their channel gain",
+                   BooleanValue (true),
+                   MakeBooleanAccessor (&AirCompAggregator::m_channelInversion),
+                   MakeBooleanChecker ())
+    .AddAttribute ("TruncationThreshold",
+                   "With channel inversion, clients whose power gain is below this threshold do not transmit",
+                   DoubleValue (0),
+                   MakeDoubleAccessor (&AirCompAggregator::m_truncation),
+                   MakeDoubleChecker<double> (0))
+    .AddAttribute ("NoiseType",
+                   "The receiver noise: add, multi or none",
+                   StringValue ("add"),
+                   MakeStringAccessor (&AirCompAggregator::m_noiseType),
+                   MakeStringChecker ())
+    .AddAttribute ("NoiseRatio",
+                   "The standard deviation of the receiver noise",
+                   DoubleValue (0),
+                   MakeDoubleAccessor (&AirCompAggregator::m_noiseRatio),
+                   MakeDoubleChecker<double> (0))
+  ;
+  return tid;
+}
+
+
+AirCompAggregator::AirCompAggregator ()
+{
+  m_gain = CreateObject<ExponentialRandomVariable> ();
+  m_noiseSeed = CreateObject<UniformRandomVariable> ();
+}
+
+
+AirCompAggregator::~AirCompAggregator ()
+{
+  m_socket = 0;
+}
+
+
+void
+AirCompAggregator::SetAttributes (Address address, Ptr<Socket> socket, uint32_t packet_size, uint32_t num_transmitters, DataRate data_rate)
+{
+  m_remote = address;
+  m_socket = socket;
+  m_packetSize = packet_size;
+  m_numTransmitters = num_transmitters;
+  m_dataRate = data_rate;
+}
+
+
+void
+AirCompAggregator::SetSocket (Ptr<Socket> socket)
+{
+  m_socket = socket;
+}
+
+
+Ptr<Socket>
+AirCompAggregator::GetSocket (void)
+{
+  return m_socket;
+}
+
+
+int64_t
+AirCompAggregator::AssignStreams (int64_t stream)
+{
+  m_gain->SetStream (stream);
+  m_noiseSeed->SetStream (stream + 1);
+  return 2;
+}
+
+
+Time
+AirCompAggregator::GetAirtime (uint32_t size) const
+{
+  return Seconds (static_cast<double> (size) / m_symbolRate);
+}
+
+
+uint32_t
+AirCompAggregator::GetNumSlots (void) const
+{
+  return m_slots;
+}
+
+
+void
+AirCompAggregator::StartApplication (void)
+{
+  NS_LOG_INFO ("AIRCOMP:: Initialize one aggregator for " << m_numTransmitters << " transmitters...");
+
+  m_socket->Bind (InetSocketAddress (Ipv4Address::GetAny (), UploadPort));
+  m_socket->Connect (m_remote);
+  // the server sends nothing to the UploadPort connections, anything received is dropped
+  m_socket->SetRecvCallback (MakeCallback (&AirCompAggregator::HandleRead, this));
+}
+
+
+void
+AirCompAggregator::StopApplication (void)
+{
+  if (m_timeoutEvent.IsRunning ())
+    {
+      Simulator::Cancel (m_timeoutEvent);
+    }
+
+  if (m_deliverEvent.IsRunning ())
+    {
+      Simulator::Cancel (m_deliverEvent);
+    }
+
+  if (m_socket)
+    {
+      m_socket->Close ();
+      m_socket->SetRecvCallback (MakeNullCallback<void, Ptr<Socket> > ());
+      m_socket = 0;
+    }
+}
+
+
+void
+AirCompAggregator::HandleRead (Ptr<Socket> socket)
+{
+  Ptr<Packet> packet;
+  while ((packet = socket->Recv ()))
+    {
+      if (packet->GetSize () == 0)
+        {
+          break;
+        }
+    }
+}
+
+
+double
+AirCompAggregator::Fading (void)
+{
+  if (m_fading.compare ("rayleigh") == 0)
+    {
+      // |h|^2 of a unit-power Rayleigh channel is exponentially distributed
+      double power = m_gain->GetValue ();
+      if (m_channelInversion)
+        {
+          return power < m_truncation ? 0.0 : 1.0;
+        }
+      return std::sqrt (power);
+    }
+  else if (m_fading.compare ("none") != 0)
+    {
+      NS_LOG_ERROR ("AIRCOMP:: Unknown fading model " << m_fading << ", using none");
+    }
+  return 1.0;
+}
+
+
+void
+AirCompAggregator::ApplyNoise (std::vector<float>& superposition)
+{
+  if (m_noiseRatio <= 0 || m_noiseType.compare ("none") == 0)
+    {
+      return;
+    }
+
+  // one RandomVariableStream draw per slot instead of one per parameter, the per-parameter noise comes from a
+  // local generator that the compiler can inline, so MB-sized models do not spend the slot in virtual calls
+  std::mt19937 engine (m_noiseSeed->GetInteger (0, std::numeric_limits<uint32_t>::max ()));
+  std::normal_distribution<float> noise (0, m_noiseRatio);
+
+  if (m_noiseType.compare ("add") == 0)
+    {
+      for (auto& v : superposition)
+        {
+          v += noise (engine);
+        }
+    }
+  else if (m_noiseType.compare ("multi") == 0)
+    {
+      for (auto& v : superposition)
+        {
+          v *= 1 + noise (engine);
+        }
+    }
+  else
+    {
+      NS_LOG_ERROR ("AIRCOMP:: Unknown noise type " << m_noiseType << ", no noise added");
+    }
+}
+
+
+void
+AirCompAggregator::OpenSlot (uint32_t size)
+{
+  m_slotOpen = true;
+  m_transmitted = 0;
+  m_contributors = 0;
+  m_sum.assign (size, 0);
+
+  if (!m_slotTimeout.IsZero ())
+    {
+      m_timeoutEvent = Simulator::Schedule (m_slotTimeout, &AirCompAggregator::CloseSlot, this);
+    }
+}
+
+
+void
+AirCompAggregator::Transmit (uint32_t id, MTensor<float> tensor)
+{
+  if (!m_slotOpen)
+    {
+      OpenSlot (tensor.size ());
+    }
+
+  NS_ABORT_MSG_IF (tensor.size () != m_sum.size (), "AirComp transmitters must share the same model size");
+
+  NS_LOG_INFO ("AIRCOMP:: client " << id << " transmits at time " << Simulator::Now ().As (Time::S));
+
+  m_transmitted += 1;
+
+  double gain = Fading ();
+  if (gain > 0)
+    {
+      float* data = tensor.data ();
+      for (uint32_t i = 0; i < m_sum.size (); i++)
+        {
+          m_sum[i] += gain * data[i];
+        }
+      m_contributors += 1;
+    }
+
+  if (m_transmitted >= m_numTransmitters)
+    {
+      CloseSlot ();
+    }
+}
+
+
+void
+AirCompAggregator::CloseSlot (void)
+{
+  if (!m_slotOpen)
+    {
+      return;
+    }
+
+  if (m_deliverEvent.IsRunning ())
+    {
+      // the channel is still carrying the previous slot, start right after it
+      Simulator::Cancel (m_timeoutEvent);
+      m_timeoutEvent = Simulator::Schedule (Simulator::GetDelayLeft (m_deliverEvent), &AirCompAggregator::CloseSlot, this);
+      return;
+    }
+
+  if (m_timeoutEvent.IsRunning ())
+    {
+      Simulator::Cancel (m_timeoutEvent);
+    }
+
+  m_slotOpen = false;
+  m_onAir.swap (m_sum);
+  m_onAirContributors = m_contributors;
+
+  m_deliverEvent = Simulator::Schedule (GetAirtime (m_onAir.size ()), &AirCompAggregator::Deliver, this);
+}
+
+
+void
+AirCompAggregator::Deliver (void)
+{
+  m_slots += 1;
+
+  if (m_onAirContributors == 0)
+    {
+      NS_LOG_WARN ("AIRCOMP:: slot " << m_slots << " received no signal, nothing is forwarded");
+      return;
+    }
+
+  ApplyNoise (m_onAir);
+
+  for (auto& v : m_onAir)
+    {
+      v /= m_onAirContributors;
+    }
+
+  NS_LOG_INFO ("AIRCOMP:: slot " << m_slots << " forwards the average of " << m_onAirContributors
+               << " clients at time " << Simulator::Now ().As (Time::S));
+
+  m_relay = MlBuffer (MTensor<float> (m_onAir.data (), m_onAir.size ()));
+  m_relay.FedSend (m_socket, m_packetSize, m_dataRate);
+}
+
+
+}
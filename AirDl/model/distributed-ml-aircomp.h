@@ -0,0 +1,115 @@
+#ifndef DISTRIBUTED_ML_AIRCOMP_H
+#define DISTRIBUTED_ML_AIRCOMP_H
+
+
+#include "ns3/application.h"
+#include "ns3/event-id.h"
+#include "ns3/ptr.h"
+#include "ns3/address.h"
+#include "ns3/socket.h"
+#include "ns3/simulator.h"
+#include "ns3/data-rate.h"
+#include "ns3/nstime.h"
+#include "ns3/random-variable-stream.h"
+
+#include "ns3/distributed-ml-utils.h"
+#include <vector>
+#include <random>
+
+
+namespace ns3{
+
+/**
+ * Over-the-air computation (AirComp) uplink of one wifi cell.
+ *
+ * The clients of a cell transmit their analog model segments simultaneously in
+ * a shared slot. The channel superposes them, applies fading and noise, and the
+ * AP receives the sum directly: the airtime of a slot only depends on the model
+ * size, not on the number of transmitters. The AP then forwards the cell
+ * average to the server over its own TCP connection, so the server sees one
+ * "client" per cell.
+ *
+ * The aggregator is installed as an application on the AP node. Clients hand
+ * their model over with Transmit() instead of sending it through their socket.
+ */
+class AirCompAggregator : public Application
+{
+public:
+  static TypeId GetTypeId (void);
+
+  // Local port of the aggregators: the server recognizes their connections by it and sends them no model.
+  static const uint16_t UploadPort = 8081;
+
+  AirCompAggregator ();
+
+  virtual ~AirCompAggregator ();
+
+  void SetAttributes (Address address, Ptr<Socket> socket, uint32_t packet_size=512, uint32_t num_transmitters=1, DataRate data_rate=DataRate ("10Mbps"));
+
+  void SetSocket (Ptr<Socket> socket);
+
+  Ptr<Socket> GetSocket (void);
+
+  // Superpose the model of client `id` into the current slot.
+  void Transmit (uint32_t id, MTensor<float> tensor);
+
+  // Airtime of one slot carrying `size` parameters.
+  Time GetAirtime (uint32_t size) const;
+
+  uint32_t GetNumSlots (void) const;
+
+  int64_t AssignStreams (int64_t stream);
+
+protected:
+  virtual void StartApplication (void);
+  virtual void StopApplication (void);
+
+private:
+  void OpenSlot (uint32_t size);
+
+  void CloseSlot (void);
+
+  void Deliver (void);
+
+  double Fading (void);
+
+  void ApplyNoise (std::vector<float>& superposition);
+
+  void HandleRead (Ptr<Socket> socket);
+
+  Ptr<Socket>     m_socket;
+  Address         m_remote;
+  uint32_t        m_packetSize;
+  DataRate        m_dataRate;
+
+  uint32_t        m_numTransmitters;   // transmitters expected in one slot
+  double          m_symbolRate;        // analog parameters per second
+  Time            m_slotTimeout;       // close a slot early if stragglers miss it, 0 disables
+  std::string     m_fading;            // "none" or "rayleigh"
+  bool            m_channelInversion;  // clients pre-scale by the inverse of their channel gain
+  double          m_truncation;        // clients with a power gain below this stay silent
+  std::string     m_noiseType;         // "add", "multi" or "none"
+  double          m_noiseRatio;
+
+  bool            m_slotOpen = false;
+  uint32_t        m_transmitted = 0;   // clients that transmitted in the current slot
+  uint32_t        m_contributors = 0;  // clients whose signal made it into the superposition
+  uint32_t        m_onAirContributors = 0;
+  uint32_t        m_slots = 0;
+
+  std::vector<float> m_sum;            // superposition of the current slot
+  std::vector<float> m_onAir;          // superposition being received by the AP
+
+  EventId         m_timeoutEvent;
+  EventId         m_deliverEvent;
+
+  MlBuffer        m_relay = MlBuffer();
+
+  Ptr<ExponentialRandomVariable> m_gain;
+  Ptr<UniformRandomVariable>     m_noiseSeed;       // one draw per slot seeds the noise of all its parameters
+};
+
+
+}
+
+#endif
@@ -4,12 +4,17 @@
 #include "ns3/position-allocator.h"
 #include "ns3/hierarchical-mobility-model.h"
 #include "ns3/log.h"
+#include "ns3/abort.h"
 #include "ns3/pointer.h"
 #include "ns3/config.h"
 #include "ns3/simulator.h"
 #include "ns3/names.h"
 #include "ns3/string.h"
 #include <iostream>
+#include <cstring>
+#include <algorithm>
+#include <cmath>
+#include <fstream>
 
 #include "ns3/trace-helper.h"
 #include "ns3/net-device.h"
@@ -18,13 +23,14 @@
 using namespace ns3;
 
 bool
-SavedFreq(double time_now, uint64_t& count){
-  if (time_now>=TraceHelper::freq*count){
-    count+=1;
-    return true;
-  }else{
-    return false;
-  }
+TraceSampler::Sample (double now)
+{
+  if (now < m_next)
+    {
+      return false;
+    }
+  m_next = m_period > 0 ? (std::floor (now / m_period) + 1) * m_period : now;
+  return true;
 }
 
 
@@ -52,11 +58,12 @@ DoRound (double v)
 
 
 void
-CourseChange (Ptr<OutputStreamWrapper> stream, uint64_t& count, Ptr<const MobilityModel> mobility)
+CourseChange (Ptr<OutputStreamWrapper> stream, Ptr<TraceSampler> sampler, Ptr<const MobilityModel> mobility)
 {
+  HostTimer timer (HostProfiler::TRACE);
   double now = Simulator::Now ().GetSeconds ();
 
-  if(SavedFreq(now, count)){
+  if(sampler->Sample (now)){
     std::ostream* os = stream->GetStream ();
     Ptr<Node> node = mobility->GetObject<Node> ();
     *os << "now=" << Simulator::Now ().GetSeconds ()
@@ -94,16 +101,17 @@ TraceHelper::trace_mobility(Ptr<Node> node, std::string path){
 	uint32_t nodeid = node->GetId ();
 	oss << "/NodeList/" << nodeid << "/$ns3::MobilityModel/CourseChange";
 
-	Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&CourseChange, stream, m_CourseChange_count));
+	Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&CourseChange, stream, Create<TraceSampler> (m_CourseChange_freq)));
 }
 
 
 
 void
-CwndChange (Ptr<OutputStreamWrapper> stream, uint64_t count, uint32_t oldCwnd, uint32_t newCwnd)
+CwndChange (Ptr<OutputStreamWrapper> stream, Ptr<TraceSampler> sampler, uint32_t oldCwnd, uint32_t newCwnd)
 {
+  HostTimer timer (HostProfiler::TRACE);
   double now = Simulator::Now ().GetSeconds ();
-  if(SavedFreq(now, count)){
+  if(sampler->Sample (now)){
     std::ostream* os = stream->GetStream ();
     std::streamsize saved_precision = os->precision ();
     std::ios::fmtflags saved_flags = os->flags ();
@@ -123,17 +131,18 @@ TraceHelper::trace_cwnd(Ptr<Socket> socket, std::string path){
 
   AsciiTraceHelper asciiTraceHelper;
 	Ptr<OutputStreamWrapper> stream = asciiTraceHelper.CreateFileStream (path);
-	socket->TraceConnectWithoutContext ("CongestionWindow", MakeBoundCallback (&CwndChange, stream, m_CwndChange_count));;
+	socket->TraceConnectWithoutContext ("CongestionWindow", MakeBoundCallback (&CwndChange, stream, Create<TraceSampler> (m_CwndChange_freq)));;
 }
 
 
 
 
 void
-RxDrop (Ptr<PcapFileWrapper> file, uint64_t& count,  Ptr<const Packet> p)
+RxDrop (Ptr<PcapFileWrapper> file, Ptr<TraceSampler> sampler,  Ptr<const Packet> p)
 {
+  HostTimer timer (HostProfiler::TRACE);
   double now = Simulator::Now ().GetSeconds ();
-  if(SavedFreq(now, count)){
+  if(sampler->Sample (now)){
     file->Write (Simulator::Now (), p);
   }
   
@@ -147,7 +156,7 @@ TraceHelper::trace_drop(Ptr<NetDevice> netdevice, std::string path)
 
 	PcapHelper pcapHelper;
 	Ptr<PcapFileWrapper> file = pcapHelper.CreateFile (path, std::ios::out, PcapHelper::DLT_PPP);
-	netdevice->TraceConnectWithoutContext ("PhyRxDrop", MakeBoundCallback (&RxDrop, file, m_RxDrop_count));
+	netdevice->TraceConnectWithoutContext ("PhyRxDrop", MakeBoundCallback (&RxDrop, file, Create<TraceSampler> (m_RxDrop_freq)));
 
 }
 
@@ -155,11 +164,12 @@ TraceHelper::trace_drop(Ptr<NetDevice> netdevice, std::string path)
 
 /// Trace function for remaining energy at node.
 void
-RemainingEnergy (Ptr<OutputStreamWrapper> stream, uint64_t& count, double oldValue, double remainingEnergy)
+RemainingEnergy (Ptr<OutputStreamWrapper> stream, Ptr<TraceSampler> sampler, double oldValue, double remainingEnergy)
 {
+  HostTimer timer (HostProfiler::TRACE);
   
   double now = Simulator::Now ().GetSeconds ();
-  if(SavedFreq(now, count)){
+  if(sampler->Sample (now)){
     std::ostream* os = stream->GetStream ();
     std::streamsize saved_precision = os->precision ();
     std::ios::fmtflags saved_flags = os->flags ();
@@ -183,17 +193,18 @@ TraceHelper::trace_energy_remaining(Ptr< EnergySource > source, std::string path
   Ptr<OutputStreamWrapper> stream = asciiTraceHelper.CreateFileStream (path);
 
   Ptr<BasicEnergySource> basicSourcePtr = DynamicCast<BasicEnergySource> (source);
-  basicSourcePtr->TraceConnectWithoutContext ("RemainingEnergy", MakeBoundCallback (&RemainingEnergy, stream, m_RemainingEnergy_count));
+  basicSourcePtr->TraceConnectWithoutContext ("RemainingEnergy", MakeBoundCallback (&RemainingEnergy, stream, Create<TraceSampler> (m_RemainingEnergy_freq)));
 
 }
 
 
 void
-ConsumedEnergy (Ptr<OutputStreamWrapper> stream, uint64_t& count, double oldValue, double totalEnergy)
+ConsumedEnergy (Ptr<OutputStreamWrapper> stream, Ptr<TraceSampler> sampler, double oldValue, double totalEnergy)
 {
+  HostTimer timer (HostProfiler::TRACE);
 
   double now = Simulator::Now ().GetSeconds ();
-  if(SavedFreq(now, count)){
+  if(sampler->Sample (now)){
     std::ostream* os = stream->GetStream ();
     std::streamsize saved_precision = os->precision ();
     std::ios::fmtflags saved_flags = os->flags ();
@@ -221,7 +232,7 @@ ConsumedEnergy (Ptr<OutputStreamWrapper> stream, uint64_t& count, double oldValu
 //     basicSourcePtr->FindDeviceEnergyModels ("ns3::WifiRadioEnergyModel").Get (0);
 //   NS_ASSERT (basicRadioModelPtr != NULL);
 
-//   basicRadioModelPtr->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&ConsumedEnergy, stream, m_ConsumedEnergy_count));
+//   basicRadioModelPtr->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&ConsumedEnergy, stream, Create<TraceSampler> (m_ConsumedEnergy_freq)));
 
 // }
 
@@ -234,7 +245,7 @@ TraceHelper::trace_wifi_energy_consumation(Ptr< WifiRadioEnergyModel > basicWifi
   Ptr<OutputStreamWrapper> stream = asciiTraceHelper.CreateFileStream (path);
   Ptr< DeviceEnergyModel > basicRadioModelPtr = static_cast<Ptr< DeviceEnergyModel >> (basicWifiRadioModelPtr);
 
-  basicRadioModelPtr->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&ConsumedEnergy, stream, m_ConsumedEnergy_count));
+  basicRadioModelPtr->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&ConsumedEnergy, stream, Create<TraceSampler> (m_ConsumedEnergy_freq)));
 
 }
 
@@ -248,11 +259,604 @@ TraceHelper::trace_ml_energy_consumation(Ptr< MlDeviceEnergyModel > basicWifiRad
   Ptr<OutputStreamWrapper> stream = asciiTraceHelper.CreateFileStream (path);
   // Ptr< SimpleDeviceEnergyModel > basicRadioModelPtr = static_cast<Ptr< SimpleDeviceEnergyModel >> (basicWifiRadioModelPtr);
 
-  basicWifiRadioModelPtr->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&ConsumedEnergy, stream, m_ConsumedEnergy_count));
+  basicWifiRadioModelPtr->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&ConsumedEnergy, stream, Create<TraceSampler> (m_ConsumedEnergy_freq)));
+
+}
+
+
+
+const uint32_t BinaryTraceSink::Version;
+const uint32_t BinaryTraceSink::HeaderSize;
+const uint32_t BinaryTraceSink::RecordSize;
+const uint32_t BinaryTraceSink::IndexEntrySize;
+const uint32_t BinaryTraceSink::TrailerSize;
+
+
+/// Open binary sinks per path, so the cells of one rank share a shard
+static std::map<std::string, Ptr<BinaryTraceSink> >&
+OpenBinarySinks (void)
+{
+  static std::map<std::string, Ptr<BinaryTraceSink> > sinks;
+  return sinks;
+}
+
+
+Ptr<BinaryTraceSink>
+BinaryTraceSink::Open (std::string path, uint32_t bufferSize)
+{
+  std::map<std::string, Ptr<BinaryTraceSink> >& sinks = OpenBinarySinks ();
+  auto it = sinks.find (path);
+  if (it == sinks.end ())
+    {
+      Ptr<BinaryTraceSink> sink = Create<BinaryTraceSink> (path, bufferSize);
+      Simulator::ScheduleDestroy (&BinaryTraceSink::Close, sink);
+      it = sinks.insert (std::make_pair (path, sink)).first;
+    }
+  return it->second;
+}
+
+
+BinaryTraceSink::BinaryTraceSink (std::string path, uint32_t bufferSize)
+  : m_path (path),
+    m_file (path, std::ios::out | std::ios::binary | std::ios::trunc),
+    m_bufferSize (bufferSize)
+{
+  NS_ABORT_MSG_IF (!m_file.is_open (), "Cannot open binary trace file " << path);
+
+  char header[HeaderSize];
+  uint32_t version = Version;
+  uint32_t recordSize = RecordSize;
+  memcpy (header, "AIRDLTR1", 8);
+  memcpy (header + 8, &version, 4);
+  memcpy (header + 12, &recordSize, 4);
+  m_file.write (header, HeaderSize);
+}
+
+
+BinaryTraceSink::~BinaryTraceSink ()
+{
+  WriteIndex ();
+}
+
+
+void
+BinaryTraceSink::Write (uint32_t node, uint32_t metric, double value)
+{
+  NS_ABORT_MSG_IF (m_closed, "Binary trace " << m_path << " is already closed");
+
+  TraceRecord record = {Simulator::Now ().GetSeconds (), node, metric, value};
+  m_pending[node].push_back (record);
+
+  m_used += RecordSize;
+  m_records += 1;
+
+  if (m_used >= m_bufferSize)
+    {
+      Flush ();
+    }
+}
+
+
+void
+BinaryTraceSink::Flush (void)
+{
+  for (auto& it : m_pending)
+    {
+      std::vector<TraceRecord>& records = it.second;
+      if (records.empty ())
+        {
+          continue;
+        }
+      IndexEntry entry = {it.first, static_cast<uint32_t> (records.size ()), m_offset};
+      m_file.write (reinterpret_cast<const char*> (records.data ()), records.size () * RecordSize);
+      m_index.push_back (entry);
+      m_offset += records.size () * RecordSize;
+      records.clear ();
+    }
+  m_used = 0;
+  m_file.flush ();
+}
+
+
+void
+BinaryTraceSink::Close (void)
+{
+  if (m_closed)
+    {
+      return;
+    }
+  WriteIndex ();
+  OpenBinarySinks ().erase (m_path);
+}
+
+
+void
+BinaryTraceSink::WriteIndex (void)
+{
+  if (m_closed)
+    {
+      return;
+    }
+  Flush ();
+
+  static_assert (sizeof (IndexEntry) == IndexEntrySize, "IndexEntry must not be padded");
+  uint64_t indexOffset = m_offset;
+  m_file.write (reinterpret_cast<const char*> (m_index.data ()), m_index.size () * IndexEntrySize);
+  m_file.write ("AIRDLIDX", 8);
+  m_file.write (reinterpret_cast<const char*> (&indexOffset), 8);
+  m_file.close ();
+  m_closed = true;
+}
+
+
+uint64_t
+BinaryTraceSink::GetNumRecords (void) const
+{
+  return m_records;
+}
+
+
+TraceRing::TraceRing (uint32_t capacity)
+  : m_records (std::max<uint32_t> (capacity, 1))
+{
+  static_assert (sizeof (TraceRecord) == BinaryTraceSink::RecordSize, "TraceRecord must match the binary record layout");
+}
+
+
+void
+TraceRing::Write (uint32_t node, uint32_t metric, double value)
+{
+  TraceRecord& record = m_records[m_count % m_records.size ()];
+  record.time = Simulator::Now ().GetSeconds ();
+  record.node = node;
+  record.metric = metric;
+  record.value = value;
+  m_count += 1;
+}
+
+
+uint64_t
+TraceRing::GetAddress (void) const
+{
+  return reinterpret_cast<uint64_t> (m_records.data ());
+}
+
+
+uint32_t
+TraceRing::GetCapacity (void) const
+{
+  return m_records.size ();
+}
+
+
+uint64_t
+TraceRing::GetCount (void) const
+{
+  return m_count;
+}
+
+
+static Ptr<TimelineRecorder>&
+CurrentTimeline (void)
+{
+  static Ptr<TimelineRecorder> timeline;
+  return timeline;
+}
+
+
+static void
+CloseTimeline (Ptr<TimelineRecorder> timeline)
+{
+  timeline->Write ();
+  if (CurrentTimeline () == timeline)
+    {
+      CurrentTimeline () = 0;
+    }
+}
+
+
+Ptr<TimelineRecorder>
+TimelineRecorder::Enable (std::string path)
+{
+  Ptr<TimelineRecorder>& timeline = CurrentTimeline ();
+  if (!timeline)
+    {
+      timeline = Create<TimelineRecorder> (path);
+      Simulator::ScheduleDestroy (&CloseTimeline, timeline);
+    }
+  return timeline;
+}
+
+
+Ptr<TimelineRecorder>
+TimelineRecorder::Get (void)
+{
+  return CurrentTimeline ();
+}
+
+
+void
+TimelineRecorder::Span (uint32_t node, uint32_t track, const char* name, Time start, Time end, double wallUs)
+{
+  Span_ span = {name, node, track, start.GetMicroSeconds () * 1.0, (end - start).GetMicroSeconds () * 1.0, wallUs};
+  m_spans.push_back (span);
+}
+
+
+void
+TimelineRecorder::Write (void)
+{
+  std::ofstream os (m_path.c_str ());
+  NS_ABORT_MSG_IF (!os.is_open (), "Cannot open timeline file " << m_path);
+  os.setf (std::ios::fixed, std::ios::floatfield);
+  os.precision (3);
+
+  os << "{\"displayTimeUnit\":\"ms\",\"traceEvents\":[";
+  std::map<uint32_t, std::map<uint32_t, bool> > named;  // tracks named so far, per node
+  bool first = true;
+  for (const Span_& span : m_spans)
+    {
+      std::map<uint32_t, bool>& tracks = named[span.node];
+      if (tracks.empty ())
+        {
+          os << (first ? "\n" : ",\n")
+             << "{\"ph\":\"M\",\"name\":\"process_name\",\"pid\":" << span.node
+             << ",\"args\":{\"name\":\"" << (span.node == 0 ? "server" : "agent") << " " << span.node << "\"}}";
+          first = false;
+        }
+      if (tracks.insert (std::make_pair (span.track, true)).second)
+        {
+          os << ",\n{\"ph\":\"M\",\"name\":\"thread_name\",\"pid\":" << span.node << ",\"tid\":" << span.track
+             << ",\"args\":{\"name\":\"";
+          if (span.track == ML)
+            {
+              os << "ml";
+            }
+          else if (span.track == ENERGY)
+            {
+              os << "energy";
+            }
+          else
+            {
+              os << "connection " << span.track - CONNECTION;
+            }
+          os << "\"}}";
+        }
+      os << ",\n{\"ph\":\"X\",\"name\":\"" << span.name << "\",\"pid\":" << span.node << ",\"tid\":" << span.track
+         << ",\"ts\":" << span.start << ",\"dur\":" << span.duration;
+      if (span.wall >= 0)
+        {
+          os << ",\"args\":{\"wall_us\":" << span.wall << "}";
+        }
+      os << "}";
+    }
+  os << "\n]}\n";
+}
+
+
+uint64_t
+TimelineRecorder::GetNumSpans (void) const
+{
+  return m_spans.size ();
+}
+
 
+/// Where a record trace callback writes: the binary sink and/or the rings of its metrics, its node and first metric, and its own sampler
+struct BinaryTraceTarget : public SimpleRefCount<BinaryTraceTarget>
+{
+  BinaryTraceTarget (Ptr<BinaryTraceSink> sink, uint32_t node, uint32_t metric, double period)
+    : sink (sink), node (node), metric (metric), sampler (Create<TraceSampler> (period)) {};
+
+  // the k-th value of an event is written as metric+k
+  void Write (uint32_t k, double value)
+  {
+    if (sink)
+      {
+        sink->Write (node, metric + k, value);
+      }
+    if (k < rings.size () && rings[k])
+      {
+        rings[k]->Write (node, metric + k, value);
+      }
+  }
+
+  Ptr<BinaryTraceSink> sink;
+  uint32_t node;
+  uint32_t metric;
+  Ptr<TraceSampler> sampler;
+  std::vector<Ptr<TraceRing> > rings;
+};
+
+
+static void
+BinaryEnergy (Ptr<BinaryTraceTarget> target, double oldValue, double totalEnergy)
+{
+  HostTimer timer (HostProfiler::TRACE);
+  if (target->sampler->Sample (Simulator::Now ().GetSeconds ()))
+    {
+      target->Write (0, totalEnergy);
+    }
 }
 
 
+static void
+BinaryCourseChange (Ptr<BinaryTraceTarget> target, Ptr<const MobilityModel> mobility)
+{
+  HostTimer timer (HostProfiler::TRACE);
+  if (target->sampler->Sample (Simulator::Now ().GetSeconds ()))
+    {
+      Vector pos = mobility->GetPosition ();
+      Vector vel = mobility->GetVelocity ();
+      double values[6] = {pos.x, pos.y, pos.z, vel.x, vel.y, vel.z};
+      for (uint32_t k = 0; k < 6; k++)
+        {
+          target->Write (k, values[k]);
+        }
+    }
+}
+
+
+void
+TraceHelper::EnableRing(uint32_t capacity, bool keep_files)
+{
+  m_ringCapacity = capacity;
+  m_keepFiles = keep_files;
+}
+
+
+Ptr<TraceRing>
+TraceHelper::GetRing(uint32_t metric)
+{
+  if (m_ringCapacity == 0)
+    {
+      return 0;
+    }
+  auto it = m_rings.find (metric);
+  if (it == m_rings.end ())
+    {
+      it = m_rings.insert (std::make_pair (metric, Create<TraceRing> (m_ringCapacity))).first;
+    }
+  return it->second;
+}
+
+
+void
+TraceHelper::EnableBinary(std::string path, uint32_t buffer_size)
+{
+  m_sink = BinaryTraceSink::Open (path, buffer_size);
+}
+
+
+Ptr<BinaryTraceSink>
+TraceHelper::GetBinarySink(void)
+{
+  return m_sink;
+}
+
+
+void
+TraceHelper::trace_mobility(NodeContainer nodes, std::string prefix, uint32_t first_id)
+{
+  AsciiTraceHelper asciiTraceHelper;
+  for (uint32_t i = 0; i < nodes.GetN (); i++)
+    {
+      std::ostringstream path;
+      path << prefix << first_id + i << ".txt";
+      // connect to the model directly instead of resolving a Config path per node
+      Ptr<MobilityModel> mobility = nodes.Get (i)->GetObject<MobilityModel> ();
+      NS_ABORT_MSG_IF (!mobility, "trace_mobility needs a MobilityModel on every node");
+      if (m_sink || m_ringCapacity > 0)
+        {
+          Ptr<BinaryTraceTarget> target = Create<BinaryTraceTarget> (m_sink, first_id + i, BinaryTraceSink::POSITION_X, m_CourseChange_freq);
+          for (uint32_t k = 0; k < 6; k++)
+            {
+              target->rings.push_back (GetRing (BinaryTraceSink::POSITION_X + k));
+            }
+          mobility->TraceConnectWithoutContext ("CourseChange", MakeBoundCallback (&BinaryCourseChange, target));
+        }
+      if (m_sink || !m_keepFiles)
+        {
+          continue;
+        }
+      Ptr<OutputStreamWrapper> stream = asciiTraceHelper.CreateFileStream (path.str ());
+      mobility->TraceConnectWithoutContext ("CourseChange", MakeBoundCallback (&CourseChange, stream, Create<TraceSampler> (m_CourseChange_freq)));
+    }
+}
+
+
+void
+TraceHelper::trace_energy_consumation(DeviceEnergyModelContainer models, std::string prefix, uint32_t first_id)
+{
+  AsciiTraceHelper asciiTraceHelper;
+  for (uint32_t i = 0; i < models.GetN (); i++)
+    {
+      std::ostringstream path;
+      path << prefix << first_id + i << ".txt";
+      if (m_sink || m_ringCapacity > 0)
+        {
+          uint32_t metric = DynamicCast<MlDeviceEnergyModel> (models.Get (i)) ? BinaryTraceSink::ML_ENERGY : BinaryTraceSink::WIFI_ENERGY;
+          Ptr<BinaryTraceTarget> target = Create<BinaryTraceTarget> (m_sink, first_id + i, metric, m_ConsumedEnergy_freq);
+          target->rings.push_back (GetRing (metric));
+          models.Get (i)->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&BinaryEnergy, target));
+        }
+      if (m_sink || !m_keepFiles)
+        {
+          continue;
+        }
+      Ptr<OutputStreamWrapper> stream = asciiTraceHelper.CreateFileStream (path.str ());
+      models.Get (i)->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&ConsumedEnergy, stream, Create<TraceSampler> (m_ConsumedEnergy_freq)));
+    }
+}
+
+
+TraceWindow::TraceWindow (std::string path, double window)
+  : m_window (window)
+{
+  NS_ABORT_MSG_IF (window <= 0, "TraceWindow needs a positive window");
+
+  AsciiTraceHelper asciiTraceHelper;
+  m_stream = asciiTraceHelper.CreateFileStream (path);
+  *m_stream->GetStream () << "# time\tnode\tcount\tmin\tmax\tmean\tlast" << std::endl;
+}
+
+
+TraceWindow::~TraceWindow ()
+{
+  Flush ();
+}
+
+
+void
+TraceWindow::Add (uint32_t key, double value)
+{
+  double start = std::floor (Simulator::Now ().GetSeconds () / m_window) * m_window;
+
+  auto it = m_stats.find (key);
+  if (it != m_stats.end () && it->second.start != start)
+    {
+      Emit (key, it->second);
+      m_stats.erase (it);
+      it = m_stats.end ();
+    }
+  if (it == m_stats.end ())
+    {
+      Stats stats = {start, 0, value, value, 0, value};
+      it = m_stats.insert (std::make_pair (key, stats)).first;
+    }
+
+  Stats& stats = it->second;
+  stats.count += 1;
+  stats.min = std::min (stats.min, value);
+  stats.max = std::max (stats.max, value);
+  stats.sum += value;
+  stats.last = value;
+}
+
+
+void
+TraceWindow::Flush (void)
+{
+  for (auto& it : m_stats)
+    {
+      Emit (it.first, it.second);
+    }
+  m_stats.clear ();
+  m_stream->GetStream ()->flush ();
+}
+
+
+void
+TraceWindow::Emit (uint32_t key, const Stats& stats)
+{
+  std::ostream* os = m_stream->GetStream ();
+  *os << stats.start << "\t" << key << "\t" << stats.count << "\t" << stats.min << "\t" << stats.max
+      << "\t" << stats.sum / stats.count << "\t" << stats.last << "\n";
+}
+
+
+static void
+WindowEnergy (Ptr<TraceWindow> window, uint32_t key, double oldValue, double totalEnergy)
+{
+  HostTimer timer (HostProfiler::TRACE);
+  window->Add (key, totalEnergy);
+}
+
+
+/* The energy of a cell: each STA adds what it consumed since its previous update, so the cell total is
+   the sum of the cumulative energies of its STAs.
+*/
+struct CellEnergy : public SimpleRefCount<CellEnergy>
+{
+  double total = 0;
+};
+
+
+static void
+WindowCellEnergy (Ptr<TraceWindow> window, Ptr<CellEnergy> cell, uint32_t key, double oldValue, double totalEnergy)
+{
+  HostTimer timer (HostProfiler::TRACE);
+  cell->total += totalEnergy - oldValue;
+  window->Add (key, cell->total);
+}
+
+
+static void
+WindowCwnd (Ptr<TraceWindow> window, uint32_t key, uint32_t oldCwnd, uint32_t newCwnd)
+{
+  HostTimer timer (HostProfiler::TRACE);
+  window->Add (key, newCwnd);
+}
+
+
+Ptr<TraceWindow>
+TraceHelper::GetWindow(std::string path, double window)
+{
+  auto it = m_windows.find (path);
+  if (it == m_windows.end ())
+    {
+      Ptr<TraceWindow> traceWindow = Create<TraceWindow> (path, window);
+      Simulator::ScheduleDestroy (&TraceWindow::Flush, traceWindow);
+      it = m_windows.insert (std::make_pair (path, traceWindow)).first;
+    }
+  return it->second;
+}
+
+
+void
+TraceHelper::SetSamplingPeriod(std::string trace, double period)
+{
+  if (trace.compare ("energy") == 0)
+    {
+      m_ConsumedEnergy_freq = period;
+    }
+  else if (trace.compare ("remaining") == 0)
+    {
+      m_RemainingEnergy_freq = period;
+    }
+  else if (trace.compare ("cwnd") == 0)
+    {
+      m_CwndChange_freq = period;
+    }
+  else if (trace.compare ("mobility") == 0)
+    {
+      m_CourseChange_freq = period;
+    }
+  else if (trace.compare ("drop") == 0)
+    {
+      m_RxDrop_freq = period;
+    }
+  else
+    {
+      printf("Wrongly Input Value: %s. Please Input string value selected from 'energy', 'remaining', 'cwnd', 'mobility' and 'drop'\n", trace.c_str());
+    }
+}
+
+
+void
+TraceHelper::trace_energy_window(DeviceEnergyModelContainer models, std::string path, double window, uint32_t first_id, bool per_cell)
+{
+  Ptr<TraceWindow> traceWindow = GetWindow (path, window);
+  Ptr<CellEnergy> cell = Create<CellEnergy> ();
+  for (uint32_t i = 0; i < models.GetN (); i++)
+    {
+      if (per_cell)
+        {
+          models.Get (i)->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&WindowCellEnergy, traceWindow, cell, first_id));
+        }
+      else
+        {
+          models.Get (i)->TraceConnectWithoutContext ("TotalEnergyConsumption", MakeBoundCallback (&WindowEnergy, traceWindow, first_id + i));
+        }
+    }
+}
+
+
+void
+TraceHelper::trace_cwnd_window(Ptr<Socket> socket, std::string path, double window, uint32_t id)
+{
+  socket->TraceConnectWithoutContext ("CongestionWindow", MakeBoundCallback (&WindowCwnd, GetWindow (path, window), id));
+}
+
 
 TimeWithUnit  
 PyTimer::now(std::string resolution){
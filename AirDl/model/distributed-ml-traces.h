@@ -18,10 +18,16 @@
 #include "ns3/energy-source.h"
 #include "ns3/basic-energy-source.h"
 #include "ns3/energy-source-container.h"
+#include "ns3/device-energy-model-container.h"
+#include "ns3/node-container.h"
 
 #include "ns3/nstime.h"
 #include "ns3/wifi-radio-energy-model.h"
 #include "ns3/distributed-ml-utils.h"
+#include "ns3/simple-ref-count.h"
+
+#include <fstream>
+#include <map>
 
 namespace ns3 {
 
@@ -29,6 +35,219 @@ class PositionAllocator;
 class MobilityModel;
 
 
+/// One record of BinaryTraceSink and TraceRing, 24 bytes without padding
+struct TraceRecord
+{
+  double   time;
+  uint32_t node;
+  uint32_t metric;
+  double   value;
+};
+
+
+/**
+ * Binary trace file with fixed-width records and a per-node index.
+ *
+ * The file starts with a 16 bytes header: the magic "AIRDLTR1", the format version (uint32) and the
+ * record size (uint32). Records follow, 24 bytes each: time in seconds (double), node (uint32),
+ * metric (uint32, see Metric) and value (double), in the byte order of the host.
+ *
+ * Records are buffered per node and written as chunks of one node each once bufferSize bytes are
+ * pending, so the records of a node are in time order within and across its chunks. When the
+ * simulator is destroyed, the remaining chunks are written, followed by the index, one 16 bytes
+ * entry per chunk: node (uint32), number of records (uint32) and file offset of the chunk (uint64).
+ * The file ends with a 16 bytes trailer: the magic "AIRDLIDX" and the offset of the index (uint64).
+ *
+ * Sinks are shared by path: all the TraceHelpers of a rank opening the same path write to one shard.
+ */
+class BinaryTraceSink : public SimpleRefCount<BinaryTraceSink>
+{
+public:
+  enum Metric {
+    ML_ENERGY = 0,
+    WIFI_ENERGY = 1,
+    REMAINING_ENERGY = 2,
+    CWND = 3,
+    POSITION_X = 4,
+    POSITION_Y = 5,
+    POSITION_Z = 6,
+    VELOCITY_X = 7,
+    VELOCITY_Y = 8,
+    VELOCITY_Z = 9
+  };
+
+  static const uint32_t Version = 2;
+  static const uint32_t HeaderSize = 16;
+  static const uint32_t RecordSize = 24;
+  static const uint32_t IndexEntrySize = 16;
+  static const uint32_t TrailerSize = 16;
+
+  // The sink writing to path, created (and closed at Simulator::Destroy) on the first call
+  static Ptr<BinaryTraceSink> Open (std::string path, uint32_t bufferSize=1<<20);
+
+  BinaryTraceSink (std::string path, uint32_t bufferSize=1<<20);
+
+  virtual ~BinaryTraceSink ();
+
+  void Write (uint32_t node, uint32_t metric, double value);  // one record at Simulator::Now
+
+  void Flush (void);   // write the pending chunks
+
+  void Close (void);   // write the pending chunks, the index and the trailer
+
+  uint64_t GetNumRecords (void) const;
+
+private:
+  void WriteIndex (void);
+
+  struct IndexEntry
+  {
+    uint32_t node;
+    uint32_t count;
+    uint64_t offset;
+  };
+
+  std::string       m_path;
+  std::ofstream     m_file;
+  uint32_t          m_bufferSize;
+  std::map<uint32_t, std::vector<TraceRecord> > m_pending;  // records not written yet, per node
+  uint32_t          m_used = 0;                             // bytes in m_pending
+  uint64_t          m_offset = HeaderSize;                  // file offset of the next chunk
+  std::vector<IndexEntry> m_index;
+  uint64_t          m_records = 0;
+  bool              m_closed = false;
+};
+
+
+/**
+ * Bounded in-memory buffer of the latest records of one metric.
+ *
+ * The records live in one fixed array that is never reallocated, so Python can map it once as a NumPy
+ * array from GetAddress() and GetCapacity() and read it at any simulated time without copies. Record
+ * n (counted from 0 since the start) is stored at slot n % capacity, GetCount() gives the number of
+ * records written so far.
+ */
+class TraceRing : public SimpleRefCount<TraceRing>
+{
+public:
+  TraceRing (uint32_t capacity);
+
+  void Write (uint32_t node, uint32_t metric, double value);  // one record at Simulator::Now
+
+  uint64_t GetAddress (void) const;
+
+  uint32_t GetCapacity (void) const;
+
+  uint64_t GetCount (void) const;
+
+private:
+  std::vector<TraceRecord> m_records;
+  uint64_t                 m_count = 0;
+};
+
+
+/**
+ * Timeline of the agents in the Chrome trace event format, for chrome://tracing or ui.perfetto.dev.
+ *
+ * Every agent is one process (pid = agent id) with one ML track (PasteToMem, Processing, Sleeping,
+ * CopyFromMem), one ENERGY track (IDLE and BUSY states) and one track per connection from CONNECTION on
+ * (receive-model and BulkSend), so that the transfers of a server do not overlap on one track. Spans are
+ * complete events ("ph":"X") in simulated microseconds, memory copies and Python calls also carry their
+ * wall-clock duration in args. The events are kept in memory and written when the simulator is destroyed.
+ */
+class TimelineRecorder : public SimpleRefCount<TimelineRecorder>
+{
+public:
+  enum Track {
+    ML = 0,
+    ENERGY = 1,
+    CONNECTION = 2
+  };
+
+  // Start recording the agents of this rank to path, written (and disabled) at Simulator::Destroy
+  static Ptr<TimelineRecorder> Enable (std::string path);
+
+  static Ptr<TimelineRecorder> Get (void);  // 0 unless enabled
+
+  TimelineRecorder (std::string path) : m_path (path) {};
+
+  // name must outlive the recorder, e.g. a string literal; wallUs < 0 means no wall-clock duration
+  void Span (uint32_t node, uint32_t track, const char* name, Time start, Time end, double wallUs=-1);
+
+  void Write (void);
+
+  uint64_t GetNumSpans (void) const;
+
+private:
+  struct Span_
+  {
+    const char* name;
+    uint32_t    node;
+    uint32_t    track;
+    double      start;   // us
+    double      duration;
+    double      wall;
+  };
+
+  std::string        m_path;
+  std::vector<Span_> m_spans;
+};
+
+
+/**
+ * Keeps at most one event per period of one traced object.
+ *
+ * An event is kept if it falls in a later period than the last kept one, a period of 0 keeps every event.
+ */
+class TraceSampler : public SimpleRefCount<TraceSampler>
+{
+public:
+  TraceSampler (double period) : m_period (period) {};
+
+  bool Sample (double now);
+
+private:
+  double m_period;
+  double m_next = 0;  // start of the first period without a kept event
+};
+
+
+/**
+ * Aggregates values per key (node or cell) over fixed windows of simulated time.
+ *
+ * Each finished window of a key gives one line "start key count min max mean last" in the output
+ * file, windows without values give none. The open windows are written when the simulator is
+ * destroyed.
+ */
+class TraceWindow : public SimpleRefCount<TraceWindow>
+{
+public:
+  TraceWindow (std::string path, double window);
+
+  virtual ~TraceWindow ();
+
+  void Add (uint32_t key, double value);  // a value of key at Simulator::Now
+
+  void Flush (void);                      // write the open windows
+
+private:
+  struct Stats
+  {
+    double start;
+    uint64_t count;
+    double min;
+    double max;
+    double sum;
+    double last;
+  };
+
+  void Emit (uint32_t key, const Stats& stats);
+
+  Ptr<OutputStreamWrapper>     m_stream;
+  double                       m_window;
+  std::map<uint32_t, Stats>    m_stats;
+};
+
 
 /**
  * \ingroup mobility
@@ -45,12 +264,11 @@ public:
    */
 
   TraceHelper (double period=1.0){
-    m_ConsumedEnergy_count = 0;
-    m_RemainingEnergy_count = 0;
-    m_CourseChange_count = 0;
-    m_CwndChange_count = 0;
-    m_RxDrop_count = 0;
-    freq = period;
+    m_ConsumedEnergy_freq = period;
+    m_RemainingEnergy_freq = period;
+    m_CourseChange_freq = period;
+    m_CwndChange_freq = period;
+    m_RxDrop_freq = period;
   };
 
   /**
@@ -71,9 +289,44 @@ public:
 
   void trace_wifi_energy_consumation(Ptr< WifiRadioEnergyModel > basicWifiRadioModelPtr, std::string path="energy_consumation.txt");
 
+  // Trace a whole container in one call, the i-th element writes to <prefix><first_id+i>.txt
+  void trace_mobility(NodeContainer nodes, std::string prefix, uint32_t first_id=1);
+
+  // Works for both the wifi radio and the ml energy models
+  void trace_energy_consumation(DeviceEnergyModelContainer models, std::string prefix, uint32_t first_id=1);
+
+  /* Send the container traces above to one binary file instead of one text file per element.
+      Records carry first_id+i as node and the prefix is ignored. Single-element traces keep their text files.
+      TraceHelpers given the same path share the file, e.g. one shard per MPI rank.
+  */
+  void EnableBinary(std::string path, uint32_t buffer_size=1<<20);
+
+  Ptr<BinaryTraceSink> GetBinarySink(void);
+
+  /* Sampling period in seconds of the traces hooked afterwards, per trace: "energy", "remaining", "cwnd",
+      "mobility" or "drop". Every hooked object keeps at most one event per period, 0 keeps all of them.
+  */
+  void SetSamplingPeriod(std::string trace, double period);
+
+  /* Windowed aggregates instead of sampled events: one line per window of `window` seconds per node,
+      nodes being numbered from first_id, or per cell (key first_id) if per_cell, the energy of a cell being
+      the sum of the energy of its nodes. Traces given the same path share one file, e.g. the cwnd of all the
+      clients of a cell.
+  */
+  void trace_energy_window(DeviceEnergyModelContainer models, std::string path, double window, uint32_t first_id=1, bool per_cell=false);
+
+  void trace_cwnd_window(Ptr<Socket> socket, std::string path, double window, uint32_t id);
+
+  /* Also record the container traces in one TraceRing of `capacity` records per metric (BinaryTraceSink::Metric).
+      Without keep_files, the container traces write no text file at all.
+  */
+  void EnableRing(uint32_t capacity, bool keep_files=true);
+
+  Ptr<TraceRing> GetRing(uint32_t metric);  // 0 if rings are not enabled
 
-  static double freq;
 private:
+  Ptr<TraceWindow> GetWindow(std::string path, double window);
+
 
   // void CourseChange (Ptr<OutputStreamWrapper> stream, Ptr<const MobilityModel> mobility);
 
@@ -86,34 +339,21 @@ private:
 //   void RemainingEnergy (Ptr<OutputStreamWrapper> stream, double oldValue, double remainingEnergy);
   
 
-  // double m_ConsumedEnergy_freq;
-  // double m_RemainingEnergy_freq;
-  // double m_CwndChange_freq;
-  // double m_CourseChange_freq;
-  // double m_RxDrop_freq;
-
-  uint64_t m_ConsumedEnergy_count;
-  uint64_t m_RemainingEnergy_count;
-  uint64_t m_CwndChange_count;
-  uint64_t m_CourseChange_count;
-  uint64_t m_RxDrop_count;
-  
-};
-
+  double m_ConsumedEnergy_freq;
+  double m_RemainingEnergy_freq;
+  double m_CwndChange_freq;
+  double m_CourseChange_freq;
+  double m_RxDrop_freq;
 
-double TraceHelper::freq = 1.0;
+  Ptr<BinaryTraceSink> m_sink;
 
-// double TraceHelper::m_ConsumedEnergy_freq = 0;
-// double TraceHelper::m_RemainingEnergy_freq = 0;
-// double TraceHelper::m_CwndChange_freq = 0;
-// double TraceHelper::m_CourseChange_freq = 0;
-// double TraceHelper::m_RxDrop_freq = 0;
+  std::map<std::string, Ptr<TraceWindow> > m_windows;
 
-// uint64_t TraceHelper::m_ConsumedEnergy_count=0;
-// uint64_t TraceHelper::m_RemainingEnergy_count=0;
-// uint64_t TraceHelper::m_CwndChange_count=0;
-// uint64_t TraceHelper::m_CourseChange_count=0;
-// uint64_t TraceHelper::m_RxDrop_count=0;
+  uint32_t m_ringCapacity = 0;
+  bool     m_keepFiles = true;
+  std::map<uint32_t, Ptr<TraceRing> > m_rings;
+  
+};
 
 
 class PyTimer
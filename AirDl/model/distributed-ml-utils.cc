@@ -4,6 +4,8 @@
 #include <stdio.h>
 #include <algorithm>
 #include <numeric>
+#include <fstream>
+#include <sys/resource.h>
 
 #include "ns3/simulator.h"
 #include "ns3/mpi-interface.h"
@@ -28,9 +30,81 @@ MTensor<float> PacketsTo(const Ptr<Packet>& packet){
 }
 
 
+StreamReassembler::StreamReassembler(uint32_t capacity): m_data(capacity){
+	// the parsing below relies on the wire layout of SeqTsSizeHeader
+	NS_ASSERT (SeqTsSizeHeader().GetSerializedSize() == 20);
+}
+
+
+void StreamReassembler::Append(const Ptr<Packet>& packet){
+	uint32_t size = packet->GetSize();
+
+	if(m_head == m_tail){
+		m_head = m_tail = 0;
+	}
+
+	if(m_data.size() - m_tail < size){
+		uint32_t live = m_tail - m_head;
+		if(live + size > m_data.size()){
+			m_data.resize(std::max(uint32_t(2*m_data.size()), live + size));
+		}
+		memmove(m_data.data(), m_data.data() + m_head, live);
+		m_head = 0;
+		m_tail = live;
+	}
+
+	packet->CopyData(m_data.data() + m_tail, size);
+	m_tail += size;
+}
+
+
+/* SeqTsSizeHeader is serialized in network byte order as
+    size (uint64) | seq (uint32) | ts (uint64)
+*/
+bool StreamReassembler::Next(uint32_t& seq, const uint8_t*& payload, uint32_t& size){
+	const uint32_t headerSize = 20;
+
+	if(m_tail - m_head < headerSize){
+		return false;
+	}
+
+	const uint8_t* p = m_data.data() + m_head;
+
+	uint64_t fragmentSize = 0;
+	for(int i=0; i<8; i++){
+		fragmentSize = (fragmentSize << 8) | p[i];
+	}
+
+	NS_ABORT_IF (fragmentSize == 0);
+
+	if(fragmentSize <= headerSize || m_tail - m_head < fragmentSize){
+		return false;
+	}
+
+	seq = (uint32_t(p[8]) << 24) | (uint32_t(p[9]) << 16) | (uint32_t(p[10]) << 8) | uint32_t(p[11]);
+	payload = p + headerSize;
+	size = uint32_t(fragmentSize) - headerSize;
+	m_fragmentSize = uint32_t(fragmentSize);
+
+	return true;
+}
+
+
+void StreamReassembler::Consume(void){
+	m_head += m_fragmentSize;
+	m_fragmentSize = 0;
+}
+
+
+uint32_t StreamReassembler::GetSize(void){
+	return m_tail - m_head;
+}
+
+
 
 //Copy m_tensor from the memmory.
 void MlBuffer::CopyFromMem(){
+	HostTimer timer(HostProfiler::COPY_FROM_MEM);
 	if(m_addrs){
 		// uint32_t total_sizes = accumulate(m_sizes.begin(), m_sizes.end(),0);
 		if(!m_tensor_initialized){
@@ -47,8 +121,6 @@ void MlBuffer::CopyFromMem(){
 			copy_start_point += m_sizes[i];
 		}
 
-		fresh_flag = false;  // m_tensor copied value from memory, DO NOT need to fresh it from buffer
-
 	}else{
 		NS_LOG_ERROR("CopyFromMem:: Works only when m_addrs is not NULL !!! ");
 	}
@@ -58,7 +130,7 @@ void MlBuffer::CopyFromMem(){
 
 //Paste m_tensor to the memmory.
 void MlBuffer::PasteToMem(void){
-	freshMTensor();
+	HostTimer timer(HostProfiler::PASTE_TO_MEM);
 	if(m_addrs ){
 		uint32_t copy_start_point = 0;
 		for (auto i=0; i<int(m_sizes.size()); i++){
@@ -76,6 +148,9 @@ void MlBuffer::PasteToMem(void){
 
 
 Ptr<Packet> MlBuffer::preSend(Ptr<Packet>& packet, SeqTsSizeHeader& header, uint32_t m_packetSize){
+	// fragments carry whole floats, so that receivers can place them by offset
+	m_packetSize = std::max(uint32_t(sizeof(float)), uint32_t(m_packetSize - m_packetSize%sizeof(float)));
+
 	Ptr<Packet> fragment = packet->CreateFragment (0, std::min(m_packetSize, packet->GetSize()));
 
 	header.SetSize(fragment->GetSize()+header.GetSerializedSize ());
@@ -90,70 +165,58 @@ Ptr<Packet> MlBuffer::preSend(Ptr<Packet>& packet, SeqTsSizeHeader& header, uint
 
 
 void MlBuffer::afterSend(Ptr<Packet>& packet, SeqTsSizeHeader& header){
-	packet->RemoveAtStart(header.GetSize()-header.GetSerializedSize ());
+	uint32_t payload = header.GetSize()-header.GetSerializedSize ();
+	packet->RemoveAtStart(payload);
 	
-	header.SetSeq(header.GetSeq()+1);
+	header.SetSeq(header.GetSeq()+payload/sizeof(float));
 }
 
 
-EventId MlBuffer::BulkSend(const Ptr<Socket>& socket, Ptr<Packet>& packet, SeqTsSizeHeader& header, uint32_t m_packetSize, DataRate m_dataRate, int actual){
+EventId MlBuffer::BulkSend(const Ptr<Socket>& socket, Ptr<Packet>& packet, SeqTsSizeHeader& header, uint32_t m_packetSize, DataRate m_dataRate, FragmentSizer* sizer){
 	// std::cout << "At time " << Simulator::Now ().As (Time::S) << " Called BulkSend" << std::endl;
+	HostTimer timer(HostProfiler::BULK_SEND);
 	uint32_t count_1 = 0;
 	while(packet->GetSize()>0){
 
-		fragment = preSend(packet, header, m_packetSize);
+		fragment = preSend(packet, header, sizer ? sizer->GetSize() : m_packetSize);
 
-		actual  = socket->Send (fragment);
+		int actual  = socket->Send (fragment);
 
 		if(actual==-1 || int(actual) < int(fragment->GetSize())){
 			count_1 += 1;
+			if(!m_retry.IsNull()){
+				m_retry(socket);
+			}
 			// std::cout << "At time " << Simulator::Now ().As (Time::S) << " Packet Size: " << packet->GetSize() << " actual: " << actual << std::endl;
 			Time tNext (Seconds (m_delay_ratio*static_cast<double>(fragment->GetSize() * 8 * count_1) / static_cast<double> (m_dataRate.GetBitRate ())));
-			Simulator::Schedule (tNext, &MlBuffer::BulkSend, this, socket, packet, header, m_packetSize, m_dataRate, actual);
+			Simulator::Schedule (tNext, &MlBuffer::BulkSend, this, socket, packet, header, m_packetSize, m_dataRate, sizer);
 			
 			break;
 		}else{
 			count_1 = 0;
+			if(sizer){
+				sizer->NotifySent();
+			}
 			afterSend(packet, header);
 		}
 	}
+	if(packet->GetSize()==0 && !m_sent.IsNull()){
+		m_sent(socket);
+	}
 	return m_sendEvent;
 }
 
 
 void MlBuffer::Zero(void){
 	m_tensor.zero();
-	for(auto seq=0; seq<=int(maxSeq); seq++){
-		if (!seqBuffer.empty()){
-			seqBuffer[seq].zero();
-			seqCount[seq]=0;
-		}
-		
-	}	
+	std::fill(m_elemCount.begin(), m_elemCount.end(), 0);
 }
 
 
-//TODO: The GetBuffer could be optimized... leave for future work...
 MTensor<float> MlBuffer::GetBuffer(void){
-	
-	uint32_t size=0;
-	
-	for(auto seq=0; seq<=int(maxSeq); seq++){
-		size += seqBuffer[seq].size(); 
-	}
-
-	float* buffer = new float[size];
-
-	size = 0;
-
-	for(auto seq=1; seq<=int(maxSeq); seq++){
-		memcpy(buffer+size, seqBuffer[seq].data(), seqBuffer[seq].size()*sizeof(float));
-		size += seqBuffer[seq].size();
-	}
-	memcpy(buffer+size, seqBuffer[0].data(), seqBuffer[0].size()*sizeof(float));
-	size += seqBuffer[0].size();
-
-	return MTensor<float>(buffer, size);
+	MTensor<float> buffer(m_tensor.size());
+	buffer.copy(m_tensor);
+	return buffer;
 }
 
 
@@ -162,144 +225,402 @@ uint32_t MlBuffer::GetMaxSeq(void){
 	return maxSeq;
 }
 
-bool MlBuffer::freshMTensor(void){
-    if(fresh_flag || m_tensor.empty()){
-        m_tensor.copy(GetBuffer());
-        fresh_flag = false;
-        return true;
-    }else{
-    	return false;
-    }
-}
-
 
 float MlBuffer::operator[](const uint32_t i){
-	freshMTensor();
     return m_tensor[i];
 }
 
 
 Ptr<Packet> MlBuffer::GetPacket(void){
-	freshMTensor();
 	return ToPackets(m_tensor);
 }
 
 
 uint32_t MlBuffer::size(void){
-	freshMTensor();
     return m_tensor.size();
 }
 
 MTensor<float> MlBuffer::GetTensor(void){	
-	freshMTensor();
 	return m_tensor;
 }
 
-void MlBuffer::AvgBuff(uint32_t seq, const Ptr<Packet>& packet){
 
-	// NS_LOG_INFO("MlBuffer:: Calling AvgBuff...");
+EventId MlBuffer::FedSend(Ptr<Socket> socket, uint32_t m_packetSize, DataRate m_dataRate){
+	SeqTsSizeHeader header;
+	header.SetSeq(1);
+
+	Ptr<Packet> packet = GetPacket();
+	m_sendEvent = BulkSend(socket, packet, header, m_packetSize, m_dataRate, NULL);
 
-	if (seqBuffer[seq].size()==0)
-	{
-		NS_LOG_ERROR("AvgBuff:: Received empty Tensor at seq: " << seq);
+	return m_sendEvent;
+}
+
+
+EventId MlBuffer::FedSend(Ptr<Socket> socket, FragmentSizer* sizer, DataRate m_dataRate){
+	SeqTsSizeHeader header;
+	header.SetSeq(1);
+
+	Ptr<Packet> packet = GetPacket();
+	sizer->Reset(packet->GetSize());
+	m_sendEvent = BulkSend(socket, packet, header, sizer->GetSize(), m_dataRate, sizer);
+
+	return m_sendEvent;
+}
+
+
+uint32_t MlBuffer::FedAvg(Ptr<Packet>& packet){
+	SeqTsSizeHeader header;
+	packet->RemoveHeader (header);
+
+	std::vector<uint8_t> data(packet->GetSize());
+	packet->CopyData(data.data(), data.size());
+
+	return FedAvg(header.GetSeq(), data.data(), data.size());
+}
+
+
+uint32_t MlBuffer::FedUpdate(Ptr<Packet>& packet){
+	SeqTsSizeHeader header;
+	packet->RemoveHeader (header);
+
+	std::vector<uint8_t> data(packet->GetSize());
+	packet->CopyData(data.data(), data.size());
+
+	return FedUpdate(header.GetSeq(), data.data(), data.size());
+}
+
+
+uint32_t MlBuffer::FragmentOffset(uint32_t seq, uint32_t size){
+	NS_ABORT_MSG_IF (size > m_tensor.size(), "MlBuffer:: received a fragment larger than the model, was SetModel called?");
+
+	uint32_t offset = (seq==0) ? m_tensor.size()-size : seq-1;
+
+	NS_ABORT_MSG_IF (offset+size > m_tensor.size(), "MlBuffer:: received a fragment beyond the model size at seq: " << seq);
+
+	maxSeq = std::max(maxSeq, seq);
+	return offset;
+}
+
+
+uint32_t MlBuffer::FedAvg(uint32_t seq, const uint8_t* data, uint32_t size){
+	HostTimer timer(HostProfiler::FED_AVG);
+	if(size==0){
+		NS_LOG_ERROR("FedAvg::  Something wrong:  received empty packet at seq: " << seq);
+		return seq;
+	}
+
+	uint32_t n = size/sizeof(float);
+	uint32_t offset = FragmentOffset(seq, n);
+
+	if(m_elemCount.size() != m_tensor.size()){
+		m_elemCount.assign(m_tensor.size(), 0);
 	}
 
-	MTensor<float> tensor = PacketsTo(packet);
+	// the span is only valid during this call, values are averaged into m_tensor
+	const float* values = (const float*)data;
+	float* target = m_tensor.data() + offset;
+	uint32_t* count = m_elemCount.data() + offset;
 
-	NS_ABORT_IF (seqBuffer[seq].size() != tensor.size());
+	for(uint32_t i=0; i<n; i++){
+		target[i] = (target[i] * count[i] + values[i]) / (count[i]+1);
+		count[i] += 1;
+	}
 
-	// seqBuffer[seq] = (seqBuffer[seq]*seqCount[seq] + tensor)/(seqCount[seq]+1);
-	seqBuffer[seq].FedAvg(tensor, seqCount[seq]);
-	seqCount[seq] += 1;
-	
-	tensor.clear();
+	return seq;
 }
 
 
-void MlBuffer::UpdateBuff(uint32_t seq, const Ptr<Packet>& packet){
+uint32_t MlBuffer::FedUpdate(uint32_t seq, const uint8_t* data, uint32_t size){
+	HostTimer timer(HostProfiler::FED_UPDATE);
+	if(size==0){
+		NS_LOG_ERROR("FedUpdate:: Received empty Tensor at seq: " << seq);
+		return seq;
+	}
+
+	uint32_t n = size/sizeof(float);
+	uint32_t offset = FragmentOffset(seq, n);
+
+	memcpy(m_tensor.data() + offset, data, n*sizeof(float));
+
+	return seq;
+}
 
-	if (seqBuffer[seq].size()==0)
-	{
-		NS_LOG_ERROR("UpdateBuff:: Received empty Tensor at seq: " << seq);
+
+
+FragmentSizer::FragmentSizer(uint32_t minSize, uint32_t maxSize, uint32_t mss): m_min(minSize), m_max(maxSize), m_mss(mss){
+	NS_ABORT_IF (m_min > m_max);
+}
+
+
+void FragmentSizer::SetMss(uint32_t mss){
+	m_mss = std::max(mss, uint32_t(1));
+}
+
+
+void FragmentSizer::Reset(uint32_t modelBytes){
+	m_segments = std::max(uint32_t(1), modelBytes / (TargetFragments * m_mss));
+	m_clean = 0;
+}
+
+
+void FragmentSizer::NotifyLoss(void){
+	m_lossEvents += 1;
+	m_segments = std::max(uint32_t(1), m_segments/2);
+	m_clean = 0;
+}
+
+
+void FragmentSizer::NotifySent(void){
+	m_clean += 1;
+	if(m_clean >= GrowthWindow && GetSize() < m_max){
+		m_segments += 1;
+		m_clean = 0;
 	}
+}
 
-	// seqBuffer[seq] = PacketsTo(packet);
-	MTensor<float> tensor = PacketsTo(packet);
-	seqBuffer[seq].FedAvg(tensor, 0);
 
-	tensor.clear();
+uint32_t FragmentSizer::GetSize(void){
+	// the header shares the first segment with the payload
+	const uint32_t headerSize = 20;
+	uint32_t size = m_segments * m_mss > headerSize ? m_segments * m_mss - headerSize : m_mss;
+	size = std::min(std::max(size, m_min), m_max);
+	return std::max(uint32_t(sizeof(float)), uint32_t(size - size%sizeof(float)));
 }
 
 
-EventId MlBuffer::FedSend(Ptr<Socket> socket, uint32_t m_packetSize, DataRate m_dataRate){
-	SeqTsSizeHeader header;
-	header.SetSeq(1);
+uint32_t FragmentSizer::GetLossEvents(void){
+	return m_lossEvents;
+}
 
-	Ptr<Packet> packet = GetPacket();
-	m_sendEvent = BulkSend(socket, packet, header, m_packetSize, m_dataRate, 0);
 
-	return m_sendEvent;
+double FlowRecord::GetSendGoodput(void) const{
+	double duration = sendEnd - sendStart;
+	return (sendStart >= 0 && duration > 0) ? bytesAcked * 8 / duration : 0;
 }
 
 
-uint32_t MlBuffer::FedAvg(Ptr<Packet>& packet){
-	//using map: with seq as key and packetToVec as value
+double FlowRecord::GetRecvGoodput(void) const{
+	double duration = recvEnd - recvStart;
+	return (recvStart >= 0 && duration > 0) ? bytesReceived * 8 / duration : 0;
+}
 
-	SeqTsSizeHeader header;
-	packet->RemoveHeader (header);
-	uint32_t seq = header.GetSeq();
 
-	if(seq > maxSeq){
-		maxSeq += 1;
+double FlowRecord::GetRttMean(void) const{
+	return rttSamples > 0 ? rttSum / rttSamples : 0;
+}
+
+
+FlowStats::FlowStats(std::string peer){
+	m_records.push_back(FlowRecord());
+	m_records.back().peer = peer;
+}
+
+
+void FlowStats::NotifySendStart(void){
+	FlowRecord& record = m_records.back();
+	if(record.sendStart < 0){
+		record.sendStart = Simulator::Now().GetSeconds();
 	}
+}
 
-	if(packet->GetSize()==0){
-		NS_LOG_ERROR("FedAvg::  Something wrong:  received empty packet at seq: " << seq);
+
+void FlowStats::NotifyTx(SequenceNumber32 seq, uint32_t size){
+	if(size==0){
+		return;
 	}
-	
-	fresh_flag=true;
-	if (seqBuffer.find (seq) == seqBuffer.end ())
-	{	
-		seqBuffer.insert(std::make_pair (seq, PacketsTo(packet))).first;
-		seqCount.insert(std::make_pair (seq, 1)).first;
-	}else{
-		AvgBuff(seq, packet);
+	SequenceNumber32 end = seq + size;
+	if(m_txStarted && end <= m_highTx){
+		m_records.back().retransmissions += 1;
+		return;
+	}
+	// a segment may resend the tail of an earlier one, only the new bytes count
+	uint32_t fresh = (m_txStarted && seq < m_highTx) ? end - m_highTx : size;
+	m_records.back().bytesSent += fresh;
+	m_highTx = end;
+	m_txStarted = true;
+}
+
+
+void FlowStats::NotifyAcked(uint32_t bytes){
+	FlowRecord& record = m_records.back();
+	record.bytesAcked += bytes;
+	record.sendEnd = Simulator::Now().GetSeconds();
+}
+
+
+void FlowStats::NotifyReceived(uint32_t bytes){
+	if(m_records.back().sendStart >= 0){
+		// first bytes of the reply to the model sent in this round
+		FlowRecord next;
+		next.peer = m_records.back().peer;
+		next.round = m_records.back().round + 1;
+		m_records.push_back(next);
 	}
+	FlowRecord& record = m_records.back();
+	double now = Simulator::Now().GetSeconds();
+	if(record.recvStart < 0){
+		record.recvStart = now;
+	}
+	record.recvEnd = now;
+	record.bytesReceived += bytes;
+}
 
 
-	return seq;
+void FlowStats::NotifyRtt(double rtt){
+	FlowRecord& record = m_records.back();
+	record.rttSamples += 1;
+	record.rttSum += rtt;
+	record.rttMax = std::max(record.rttMax, rtt);
 }
 
 
-uint32_t MlBuffer::FedUpdate(Ptr<Packet>& packet){
-	SeqTsSizeHeader header;
-	packet->RemoveHeader (header);
-	uint32_t seq = header.GetSeq();
+void FlowStats::NotifyRetry(void){
+	m_records.back().retries += 1;
+}
+
+
+const std::vector<FlowRecord>& FlowStats::GetRecords(void){
+	return m_records;
+}
+
+
+void FlowStats::WriteHeader(std::ostream& os){
+	os << "# id\tpeer\tround\tbytes_sent\tbytes_acked\tbytes_received\tsend_start\tsend_end\trecv_start\trecv_end"
+	   << "\tsend_goodput\trecv_goodput\tretransmissions\trtt_samples\trtt_mean\trtt_max\tretries" << std::endl;
+}
 
-	if(seq > maxSeq){
-		maxSeq += 1;
+
+void FlowStats::Write(std::ostream& os, uint32_t id){
+	for(const FlowRecord& r : m_records){
+		os << id << "\t" << r.peer << "\t" << r.round << "\t" << r.bytesSent << "\t" << r.bytesAcked << "\t" << r.bytesReceived
+		   << "\t" << r.sendStart << "\t" << r.sendEnd << "\t" << r.recvStart << "\t" << r.recvEnd
+		   << "\t" << r.GetSendGoodput() << "\t" << r.GetRecvGoodput() << "\t" << r.retransmissions
+		   << "\t" << r.rttSamples << "\t" << r.GetRttMean() << "\t" << r.rttMax << "\t" << r.retries << std::endl;
 	}
-	
-	fresh_flag=true;
-	if (seqBuffer.find (seq) == seqBuffer.end ())
-	{	
-		seqBuffer.insert(std::make_pair (seq, PacketsTo(packet))).first;
-	}else{
-		UpdateBuff(seq, packet);
+}
+
+
+bool HostProfiler::s_enabled = false;
+std::string HostProfiler::s_path;
+double HostProfiler::s_meterInterval = 1.0;
+double HostProfiler::s_wall[HostProfiler::NUM_SECTIONS];
+uint64_t HostProfiler::s_calls[HostProfiler::NUM_SECTIONS];
+std::chrono::steady_clock::time_point HostProfiler::s_start;
+std::vector<std::vector<double> > HostProfiler::s_meter;
+
+
+void HostProfiler::Enable(std::string path, double meterInterval){
+	if(s_enabled){
+		return;
 	}
+	s_enabled = true;
+	s_path = path;
+	s_meterInterval = meterInterval;
+	std::fill(s_wall, s_wall+NUM_SECTIONS, 0.0);
+	std::fill(s_calls, s_calls+NUM_SECTIONS, 0);
+	s_meter.clear();
+
+	Simulator::Schedule(Seconds(0), &HostProfiler::Meter);
+	Simulator::ScheduleDestroy(&HostProfiler::Report);
+}
 
-	if(seqBuffer[seq].size() == 0){
-		NS_LOG_ERROR("FedUpdate:: Received empty Tensor at seq: " << seq);
+
+void HostProfiler::Add(uint32_t section, double seconds){
+	s_wall[section] += seconds;
+	s_calls[section] += 1;
+}
+
+
+double HostProfiler::GetWallTime(uint32_t section){
+	return section < NUM_SECTIONS ? s_wall[section] : 0;
+}
+
+
+uint64_t HostProfiler::GetCalls(uint32_t section){
+	return section < NUM_SECTIONS ? s_calls[section] : 0;
+}
+
+
+std::string HostProfiler::GetName(uint32_t section){
+	static const char* names[NUM_SECTIONS] = {"HandleRead", "PacketReceived", "FedAvg", "FedUpdate", "PasteToMem",
+	                                          "CopyFromMem", "Processing", "Sleeping", "BulkSend", "Trace"};
+	return section < NUM_SECTIONS ? names[section] : "";
+}
+
+
+void HostProfiler::Meter(void){
+	std::chrono::steady_clock::time_point now = std::chrono::steady_clock::now();
+	if(s_meter.empty()){
+		s_start = now;
 	}
+	s_meter.push_back({Simulator::Now().GetSeconds(), std::chrono::duration<double>(now - s_start).count(), double(Simulator::GetEventCount())});
 
-	return seq;
+	// stop metering with the last event, so that the meter does not keep the simulation running
+	if(s_enabled && s_meterInterval > 0 && !Simulator::IsFinished()){
+		Simulator::Schedule(Seconds(s_meterInterval), &HostProfiler::Meter);
+	}
+}
+
+
+void HostProfiler::Report(void){
+	if(!s_enabled){
+		return;
+	}
+	s_enabled = false;
+	Meter();   // final sample, not rescheduled
+
+	uint32_t rank = MpiInterface::GetSystemId();
+	const std::vector<double>& last = s_meter.back();
+	double wall = last[1];
+	double rate = wall > 0 ? last[2] / wall : 0;
+	struct rusage usage;
+	getrusage(RUSAGE_SELF, &usage);
+	long peakRss = usage.ru_maxrss;   // kB on Linux
+
+	printf("HostProfiler rank %u: %.3f s wall, %.3f s simulated, %.0f events (%.0f events/s), peak RSS %ld kB\n", rank, wall, last[0],
+	       last[2], rate, peakRss);
+	for(uint32_t i=0; i<NUM_SECTIONS; i++){
+		if(s_calls[i] > 0){
+			printf("  %-16s %10lu calls %10.3f s %6.1f%%\n", GetName(i).c_str(), (unsigned long)s_calls[i], s_wall[i],
+			       wall > 0 ? 100 * s_wall[i] / wall : 0.0);
+		}
+	}
+
+	if(s_path.empty()){
+		return;
+	}
+	std::ofstream os(s_path.c_str());
+	NS_ABORT_MSG_IF (!os.is_open(), "Cannot open profile file " << s_path);
+	os.precision(9);
+	os << "{\"rank\": " << rank << ", \"wall_s\": " << wall << ", \"sim_s\": " << last[0]
+	   << ", \"events\": " << uint64_t(last[2]) << ", \"events_per_s\": " << rate << ", \"peak_rss_kb\": " << peakRss
+	   << ",\n \"sections\": {";
+	for(uint32_t i=0; i<NUM_SECTIONS; i++){
+		os << (i ? ", " : "") << "\"" << GetName(i) << "\": {\"calls\": " << s_calls[i] << ", \"wall_s\": " << s_wall[i] << "}";
+	}
+	os << "},\n \"meter\": [";
+	for(uint32_t i=0; i<s_meter.size(); i++){
+		os << (i ? ", " : "") << "[" << s_meter[i][0] << ", " << s_meter[i][1] << ", " << uint64_t(s_meter[i][2]) << "]";
+	}
+	os << "]}\n";
 }
 
+
 void MlBuffer::setBulkSendDelay(uint32_t delay){
 	m_delay_ratio = delay;
 }
 
 
+void MlBuffer::SetRetryCallback(Callback<void, Ptr<Socket> > retry){
+	m_retry = retry;
+}
+
+
+void MlBuffer::SetSentCallback(Callback<void, Ptr<Socket> > sent){
+	m_sent = sent;
+}
+
+
 
 
 
@@ -7,6 +7,9 @@
 #include "ns3/seq-ts-size-header.h"
 #include "ns3/socket.h"
 #include "ns3/data-rate.h"
+#include "ns3/sequence-number.h"
+#include "ns3/simple-ref-count.h"
+#include "ns3/callback.h"
 
 #include <iostream>
 #include <vector>
@@ -18,6 +21,7 @@
 #include "simple-device-energy-model.h"
 #include <map>
 #include <algorithm>
+#include <chrono>
 
 #include "energy-source-container.h"
 #include "energy-source.h"
@@ -215,6 +219,208 @@ Ptr<Packet> ToPackets(MTensor<float>& tensor);
 MTensor<float> PacketsTo(const Ptr<Packet>& packet);
 
 
+/* Reassembles the fragments of one TCP connection.
+    Received bytes are copied once into a reusable per-connection buffer: they are appended at the tail,
+    the SeqTsSizeHeader of the fragment at the head is parsed in place, and complete fragments are
+    handed out as spans into the buffer. The live bytes are moved back to the front only when the tail
+    runs out of room, so no intermediate Packet is created per fragment.
+*/
+class StreamReassembler{
+public:
+    StreamReassembler(uint32_t capacity=65536);
+
+    virtual ~StreamReassembler(){};
+
+    void Append(const Ptr<Packet>& packet);  // copy the bytes of a TCP read to the tail
+
+    // If a complete fragment sits at the head, return true and point payload to its data (header excluded).
+    bool Next(uint32_t& seq, const uint8_t*& payload, uint32_t& size);
+
+    void Consume(void);   // drop the fragment returned by the last successful Next
+
+    uint32_t GetSize(void);  // number of buffered bytes
+
+private:
+    std::vector<uint8_t> m_data;
+    uint32_t m_head = 0;
+    uint32_t m_tail = 0;
+    uint32_t m_fragmentSize = 0;   // size of the fragment returned by Next, header included
+};
+
+
+/* Picks the payload size of the fragments sent on one connection.
+    The size is counted in TCP segments: a transfer starts with enough segments per fragment to cut the model
+    into about TargetFragments fragments, halves it on every loss event of the connection and grows it by one
+    segment after GrowthWindow fragments sent without loss. Sizes are multiples of sizeof(float) within
+    [minSize, maxSize], so the fragment size can change in the middle of a transfer.
+*/
+class FragmentSizer{
+public:
+    FragmentSizer(uint32_t minSize=512, uint32_t maxSize=65536, uint32_t mss=536);
+
+    virtual ~FragmentSizer(){};
+
+    void SetMss(uint32_t mss);
+
+    void Reset(uint32_t modelBytes);  // start a new transfer of modelBytes bytes
+
+    void NotifyLoss(void);            // the connection entered loss recovery
+
+    void NotifySent(void);            // one fragment was accepted by the socket
+
+    uint32_t GetSize(void);           // payload size of the next fragment
+
+    uint32_t GetLossEvents(void);
+
+    static const uint32_t TargetFragments = 64;
+
+    static const uint32_t GrowthWindow = 16;
+
+private:
+    uint32_t m_min;
+    uint32_t m_max;
+    uint32_t m_mss;
+    uint32_t m_segments = 1;   // fragment size in segments
+    uint32_t m_clean = 0;      // fragments sent since the last loss event
+    uint32_t m_lossEvents = 0;
+};
+
+
+/* Transport statistics of one round on one connection.
+    Times are simulated seconds, -1 if the round had no such event. bytesSent counts new TCP payload bytes
+    and bytesAcked the bytes acknowledged by the peer, so the send goodput is bytesAcked over [sendStart, sendEnd].
+*/
+struct FlowRecord{
+    std::string peer;
+    uint32_t round = 0;
+    uint64_t bytesSent = 0;
+    uint64_t bytesAcked = 0;
+    uint64_t bytesReceived = 0;
+    double sendStart = -1;      // first model fragment given to the socket
+    double sendEnd = -1;        // last acknowledgement
+    double recvStart = -1;      // first model byte received
+    double recvEnd = -1;        // last model byte received
+    uint32_t retransmissions = 0;
+    uint32_t rttSamples = 0;
+    double rttSum = 0;
+    double rttMax = 0;
+    uint32_t retries = 0;       // BulkSend calls rescheduled because the socket buffer was full
+
+    double GetSendGoodput(void) const;   // bits/s, 0 without acknowledged bytes
+    double GetRecvGoodput(void) const;
+    double GetRttMean(void) const;
+};
+
+
+/* Collects the FlowRecords of one connection.
+    A round ends when the first bytes of a model arrive after a model was sent, so each round of a client
+    is "receive the global model, send the update" and each round of the server "receive the updates,
+    send the global model", the first round of the server only sending the initial model.
+*/
+class FlowStats : public SimpleRefCount<FlowStats>{
+public:
+    FlowStats(std::string peer);
+
+    virtual ~FlowStats(){};
+
+    void NotifySendStart(void);                              // a model is given to the socket
+    void NotifyTx(SequenceNumber32 seq, uint32_t size);      // a TCP segment of size payload bytes left the socket
+    void NotifyAcked(uint32_t bytes);
+    void NotifyReceived(uint32_t bytes);
+    void NotifyRtt(double rtt);
+    void NotifyRetry(void);
+
+    const std::vector<FlowRecord>& GetRecords(void);         // the current round is the last record
+
+    static void WriteHeader(std::ostream& os);
+
+    void Write(std::ostream& os, uint32_t id);               // one line per round, columns of WriteHeader
+
+private:
+    std::vector<FlowRecord> m_records;
+    bool             m_txStarted = false;
+    SequenceNumber32 m_highTx;       // end of the highest payload byte sent
+};
+
+
+/* Wall-clock profiler of the host side hot paths of one rank.
+    Sections are timed by a HostTimer on the stack and are inclusive: HandleRead contains PacketReceived,
+    which contains FedAvg/FedUpdate. The rest of the run wall time is ns-3 itself (scheduler, TCP/IP, wifi).
+    Once enabled, the profiler also samples the event count of the simulator every meterInterval simulated
+    seconds, and reports at Simulator::Destroy: a summary on stdout and, if a path was given, a JSON file,
+    both with the peak RSS of the rank.
+    Disabled timers cost one branch.
+*/
+class HostProfiler{
+public:
+    enum Section {
+        HANDLE_READ = 0,
+        PACKET_RECEIVED,
+        FED_AVG,
+        FED_UPDATE,
+        PASTE_TO_MEM,
+        COPY_FROM_MEM,
+        PROCESSING,   // Python upcall, training included
+        SLEEPING,     // Python upcall
+        BULK_SEND,
+        TRACE,        // trace callbacks and their file I/O
+        NUM_SECTIONS
+    };
+
+    static void Enable(std::string path="", double meterInterval=1.0);
+
+    static bool IsEnabled(void){return s_enabled;};
+
+    static void Add(uint32_t section, double seconds);
+
+    static double GetWallTime(uint32_t section);   // seconds spent in a section so far
+
+    static uint64_t GetCalls(uint32_t section);
+
+    static std::string GetName(uint32_t section);
+
+    static void Report(void);                      // print the summary and write the JSON file, then disable
+
+private:
+    static void Meter(void);
+
+    static bool        s_enabled;
+    static std::string s_path;
+    static double      s_meterInterval;
+    static double      s_wall[NUM_SECTIONS];
+    static uint64_t    s_calls[NUM_SECTIONS];
+    static std::chrono::steady_clock::time_point s_start;                 // first event of the run
+    static std::vector<std::vector<double> > s_meter;                     // (simulated s, wall s, events)
+};
+
+
+class HostTimer{
+public:
+    HostTimer(uint32_t section): m_section(section){
+        if(HostProfiler::IsEnabled()){
+            m_start = std::chrono::steady_clock::now();
+            m_running = true;
+        }
+    };
+
+    virtual ~HostTimer(){
+        if(m_running){
+            HostProfiler::Add(m_section, std::chrono::duration<double>(std::chrono::steady_clock::now() - m_start).count());
+        }
+    };
+
+private:
+    uint32_t m_section;
+    bool     m_running = false;
+    std::chrono::steady_clock::time_point m_start;
+};
+
+
+/* MlBuffer keeps the model as one flat MTensor.
+    Each fragment on the wire carries the float offset of its payload in its SeqTsSizeHeader as seq = offset+1,
+    except the last fragment of a model, which has seq 0 and ends the tensor. Received fragments are written
+    (FedUpdate) or averaged element-wise (FedAvg) straight into m_tensor, so senders may use any fragment size.
+*/
 class MlBuffer{
 public:
     MlBuffer(){};
@@ -237,9 +443,7 @@ public:
 
     uint32_t GetMaxSeq(void);
 
-    MTensor<float> GetBuffer(void);  // The GetBuffer function changes the seqBuffer into a MTensor.
-
-    bool freshMTensor(void);
+    MTensor<float> GetBuffer(void);  // return a copy of m_tensor
 
     float operator[](const uint32_t i);
 
@@ -251,28 +455,34 @@ public:
 
     EventId FedSend(Ptr<Socket> socket, uint32_t m_packetSize, DataRate m_dataRate);
 
+    EventId FedSend(Ptr<Socket> socket, FragmentSizer* sizer, DataRate m_dataRate);  // fragment size picked by sizer
+
     uint32_t FedAvg(Ptr<Packet>& packet);
 
     uint32_t FedUpdate(Ptr<Packet>& packet);
 
-    void Zero(void);   // Set the data of m_tensor and seqBuffer to be 0, set seqCount to be 0
+    // Same as above, with the header already parsed and the payload given as a span of raw floats
+    uint32_t FedAvg(uint32_t seq, const uint8_t* data, uint32_t size);
+
+    uint32_t FedUpdate(uint32_t seq, const uint8_t* data, uint32_t size);
+
+    void Zero(void);   // Set the data of m_tensor to be 0, and reset the averaging counts
 
     void setBulkSendDelay(uint32_t delay);
 
-private:
+    void SetRetryCallback(Callback<void, Ptr<Socket> > retry);  // called when BulkSend has to wait for the socket
 
-    void AvgBuff(uint32_t seq, const Ptr<Packet>& packet);
+    void SetSentCallback(Callback<void, Ptr<Socket> > sent);    // called when the last fragment is accepted by the socket
 
-    void UpdateBuff(uint32_t seq, const Ptr<Packet>& packet);
+private:
 
     Ptr<Packet> preSend(Ptr<Packet>& packet, SeqTsSizeHeader& header, uint32_t m_packetSize);
      
 	void afterSend(Ptr<Packet>& packet, SeqTsSizeHeader& header);
 
-    EventId BulkSend(const Ptr<Socket>& socket, Ptr<Packet>& packet, SeqTsSizeHeader& header, uint32_t m_packetSize, DataRate m_dataRate, int actual);
-
+    EventId BulkSend(const Ptr<Socket>& socket, Ptr<Packet>& packet, SeqTsSizeHeader& header, uint32_t m_packetSize, DataRate m_dataRate, FragmentSizer* sizer);
 
-	bool fresh_flag = false;  // a flag to indicate whether m_tensor should be freshed
+    uint32_t FragmentOffset(uint32_t seq, uint32_t size);  // float offset of a received fragment of size floats
 
     MTensor<float> m_tensor;
     Ptr<Packet> fragment;
@@ -280,9 +490,7 @@ private:
 
     uint32_t maxSeq = 0;  //use to record the max seq from header
     
-    std::unordered_map<uint32_t, MTensor<float>> seqBuffer;
-
-    std::unordered_map<uint32_t, uint32_t> seqCount;
+    std::vector<uint32_t> m_elemCount;  // number of fragments averaged into each element of m_tensor
 
     uint64_t* m_addrs=NULL;
     std::vector<uint32_t> m_sizes;
@@ -291,6 +499,9 @@ private:
 
     EventId m_sendEvent; //!< Event to send the next packet
 
+    Callback<void, Ptr<Socket> > m_retry;
+    Callback<void, Ptr<Socket> > m_sent;
+
 };
 
 
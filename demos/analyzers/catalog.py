@@ -0,0 +1,246 @@
+"""
+SQLite catalog of the runs, built from the run.json manifests written by the demos.
+
+Each run is indexed by its full parameter set and its output artifacts, so finding the runs of a sweep is an
+indexed query instead of rebuilding record_prefix strings and probing directories:
+
+    catalog = Catalog("runs.db")
+    catalog.update(["../saved_minist", "../saved_traffic"])   # only new or changed manifests are read
+    for run in catalog.find(local_epochs=1, nActivePerCell=[2, 4], status="finished"):
+        print(run["params"]["error_rate"], run["artifacts"]["tf"])
+
+python catalog.py --db runs.db --update ../saved_minist --find local_epochs=1 aircomp=true
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+MANIFEST = "run.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    manifest TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    script TEXT,
+    status TEXT,
+    started REAL,
+    finished REAL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS params (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS params_key_value ON params(key, value, run_id);
+CREATE INDEX IF NOT EXISTS params_run ON params(run_id);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_run ON artifacts(run_id, kind);
+"""
+
+# bumped when the indexed values change, the runs of an older catalog are indexed again on the next update
+VERSION = 1
+
+# columns of the runs table that can be queried like parameters
+RUN_COLUMNS = ["script", "status"]
+
+
+def _canonical(value):
+    # argparse keeps default=0 of a type=float flag as int 0 but parses a given --flag 0 as 0.0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    return value
+
+
+def _value(value):
+    """
+    :return: the canonical text of a parameter value, the same for the manifest and the queries.
+             Numbers are stored as floats so that 0 and 0.0 match.
+    """
+    return json.dumps(_canonical(value), sort_keys=True)
+
+
+def _kind(name):
+    """
+    :return: the artifact kind of a file name, e.g. energy for energy12.txt and flows for flows0.txt
+    """
+    return re.sub(r"[\d_-]*$", "", os.path.splitext(name)[0]) or name
+
+
+def find_manifests(roots, depth=3):
+    """
+    :param roots: the directories to search, e.g. the --saved_dir of the demos
+    :param depth: how many directory levels below a root may hold a manifest
+    :return: the paths of the run.json manifests
+    """
+    manifests = []
+    stack = [(root, 0) for root in roots]
+    while stack:
+        path, level = stack.pop()
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name == MANIFEST and entry.is_file():
+                manifests.append(entry.path)
+            elif level < depth and entry.is_dir(follow_symlinks=False):
+                stack.append((entry.path, level + 1))
+    return manifests
+
+
+class Catalog:
+    def __init__(self, db_path="runs.db"):
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < VERSION:
+            self.db.execute("DELETE FROM runs")
+            self.db.execute("PRAGMA user_version = {}".format(VERSION))
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, roots, depth=3):
+        """
+        :param roots: the directories to scan for manifests
+        :return: the number of runs added or refreshed. Unchanged manifests (same mtime) are not read again,
+                 runs whose manifest disappeared under the roots are dropped.
+        """
+        known = dict(self.db.execute("SELECT manifest, mtime FROM runs").fetchall())
+        found = set()
+        changed = 0
+        for manifest in find_manifests(roots, depth):
+            manifest = os.path.abspath(manifest)
+            found.add(manifest)
+            try:
+                mtime = os.stat(manifest).st_mtime
+            except OSError:
+                continue
+            if known.get(manifest) == mtime:
+                continue
+            self._index(manifest, mtime)
+            changed += 1
+
+        prefixes = tuple(os.path.join(os.path.abspath(root), "") for root in roots)
+        for manifest in known:
+            if manifest.startswith(prefixes) and manifest not in found:
+                self.db.execute("DELETE FROM runs WHERE manifest = ?", (manifest,))
+        self.db.commit()
+        return changed
+
+    def _index(self, manifest, mtime):
+        try:
+            with open(manifest, "r") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return  # a manifest being written, picked up by the next update
+
+        self.db.execute("DELETE FROM runs WHERE manifest = ?", (manifest,))
+        cursor = self.db.execute(
+            "INSERT INTO runs (manifest, mtime, script, status, started, finished, record) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (manifest, mtime, record.get("script"), record.get("status"), record.get("started"), record.get("finished"),
+             json.dumps(record)))
+        run_id = cursor.lastrowid
+
+        params = record.get("params", {})
+        self.db.executemany("INSERT INTO params (run_id, key, value) VALUES (?, ?, ?)",
+                            [(run_id, key, _value(value)) for key, value in params.items()])
+
+        base = os.path.dirname(manifest)
+        artifacts = []
+        for kind, path in record.get("artifacts", {}).items():
+            path = os.path.normpath(os.path.join(base, path))
+            artifacts.append((run_id, kind, path))
+            if os.path.isdir(path):
+                artifacts.extend((run_id, _kind(entry.name), entry.path) for entry in os.scandir(path)
+                                 if entry.is_file() and entry.name != MANIFEST)
+        self.db.executemany("INSERT INTO artifacts (run_id, kind, path) VALUES (?, ?, ?)", artifacts)
+
+    def find(self, **query):
+        """
+        :param query: parameter (or script/status) values, a list selects any of its values
+        :return: the matching runs as dicts with manifest, params, artifacts ({kind: path or [paths]}) and the
+                 other manifest fields
+        """
+        where, args = [], []
+        for key, values in query.items():
+            values = values if isinstance(values, (list, tuple)) else [values]
+            marks = ", ".join("?" * len(values))
+            if key in RUN_COLUMNS:
+                where.append("runs.{} IN ({})".format(key, marks))
+                args.extend(values)
+            else:
+                where.append("runs.id IN (SELECT run_id FROM params WHERE key = ? AND value IN ({}))".format(marks))
+                args.append(key)
+                args.extend(_value(value) for value in values)
+
+        sql = "SELECT id, manifest, record FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        runs = []
+        for run_id, manifest, record in self.db.execute(sql + " ORDER BY started", args).fetchall():
+            run = json.loads(record)
+            run["manifest"] = manifest
+            run["artifacts"] = self.artifacts(run_id)
+            runs.append(run)
+        return runs
+
+    def artifacts(self, run_id):
+        """
+        :return: {kind: path} of a run, {kind: [paths]} for the kinds with several files
+        """
+        artifacts = {}
+        for kind, path in self.db.execute("SELECT kind, path FROM artifacts WHERE run_id = ? ORDER BY path", (run_id,)):
+            if kind in artifacts:
+                if not isinstance(artifacts[kind], list):
+                    artifacts[kind] = [artifacts[kind]]
+                artifacts[kind].append(path)
+            else:
+                artifacts[kind] = path
+        return artifacts
+
+
+def _parse_query(items):
+    query = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        values = []
+        for v in value.split(","):
+            try:
+                values.append(json.loads(v))
+            except ValueError:
+                values.append(v)
+        query[key] = values
+    return query
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="runs.db", type=str,
+                        help="the catalog database.")
+    parser.add_argument("--update", nargs="*", default=[], type=str,
+                        help="directories to scan for new or changed run.json manifests.")
+    parser.add_argument("--find", nargs="*", default=None, type=str,
+                        help="key=value[,value] queries on the run parameters, script or status.")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.db)
+    if args.update:
+        print("{} runs added or refreshed".format(catalog.update(args.update)))
+    if args.find is not None:
+        for run in catalog.find(**_parse_query(args.find)):
+            print("{}\t{}\t{}".format(run.get("status"), run.get("record_prefix"), os.path.dirname(run["manifest"])))
+    catalog.close()
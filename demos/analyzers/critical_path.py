@@ -0,0 +1,167 @@
+"""
+Critical path of the federated rounds, from the agent timelines (run the demos with --timeline).
+
+Round k of the server starts when it sends the global model (end of its Sleeping span k-1, or its first
+send for round 1) and ends when it sends the next one. The critical path of a round goes through the
+straggler, the client whose update is handed to the network last among the updates the server used, and
+splits the round time exactly into:
+    downlink:    round start to the end of the straggler's receive-model
+    compute:     the straggler's Processing
+    sleep:       the straggler's Sleeping
+    uplink:      end of the straggler's Sleeping to the last update received by the server
+    aggregation: last update received to the next send of the server (server Processing, Sleeping and waiting)
+
+python critical_path.py --dirs ../saved_minist/outputs-1/trace-... ../saved_minist/outputs-4/trace-... --clients_per_cell 4
+"""
+import argparse
+import glob
+import os
+
+import numpy as np
+from utils import parse_timeline
+
+COMPONENTS = ["downlink", "compute", "sleep", "uplink", "aggregation"]
+SERVER = 0
+
+
+def _first_after(spans, t, eps=1e-9):
+    """
+    :param spans: (tid, start, end) in time order
+    :return: the first span starting at or after t, None if there is none
+    """
+    for span in spans:
+        if span[1] >= t - eps:
+            return span
+    return None
+
+
+def round_boundaries(server):
+    """
+    :param server: the spans of the server, as returned by parse_timeline
+    :return: the send times of the server, round k lasts from boundaries[k-1] to boundaries[k]
+    """
+    sends = server.get("BulkSend", [])
+    if not sends:
+        return []
+    return [min(span[1] for span in sends)] + [span[2] for span in server.get("Sleeping", [])]
+
+
+def critical_paths(spans):
+    """
+    :param spans: the spans of one run, as returned by parse_timeline
+    :return: one dict per complete round: round, start, duration, straggler and the COMPONENTS in seconds
+    """
+    if SERVER not in spans:
+        return []
+    boundaries = round_boundaries(spans[SERVER])
+    received = [span[2] for span in spans[SERVER].get("receive-model", [])]
+    clients = [pid for pid in spans if pid != SERVER]
+
+    rounds = []
+    for k in range(1, len(boundaries)):
+        start, end = boundaries[k - 1], boundaries[k]
+        last = [t for t in received if start < t <= end]
+        if not last:
+            continue
+        last = max(last)
+
+        straggler, path = None, None
+        for pid in clients:
+            recv = _first_after(spans[pid].get("receive-model", []), start)
+            if recv is None or recv[1] >= end:
+                continue
+            proc = _first_after(spans[pid].get("Processing", []), recv[2])
+            sleep = _first_after(spans[pid].get("Sleeping", []), proc[2]) if proc else None
+            if sleep is None or sleep[2] > last:
+                # the update was not used in this round
+                continue
+            send = _first_after(spans[pid].get("BulkSend", []), sleep[2])
+            handed = send[2] if send is not None else sleep[2]
+            if path is None or handed > path[3]:
+                straggler, path = pid, (recv, proc, sleep, handed)
+
+        if path is None:
+            continue
+        recv, proc, sleep, _ = path
+        rounds.append({
+            "round": k,
+            "start": start,
+            "duration": end - start,
+            "straggler": straggler,
+            "downlink": recv[2] - start,
+            "compute": proc[2] - proc[1],
+            "sleep": sleep[2] - sleep[1],
+            "uplink": last - sleep[2],
+            "aggregation": end - last,
+        })
+    return rounds
+
+
+def summarize(rounds, clients_per_cell=None):
+    """
+    :param rounds: the output of critical_paths, possibly of several runs
+    :param clients_per_cell: if given, also count the stragglers per cell (clients are numbered from 1)
+    :return: a dict with the number of rounds, the mean round time, the mean and share of each component,
+             the limiting component and the straggler counts per client or cell
+    """
+    summary = {"rounds": len(rounds)}
+    if not rounds:
+        return summary
+    durations = np.array([r["duration"] for r in rounds])
+    summary["round_s"] = durations.mean()
+    for c in COMPONENTS:
+        values = np.array([r[c] for r in rounds])
+        summary[c] = values.mean()
+        summary[c + "_share"] = values.sum() / durations.sum()
+    summary["limit"] = max(COMPONENTS, key=lambda c: summary[c])
+
+    key = (lambda pid: (pid - 1) // clients_per_cell) if clients_per_cell else (lambda pid: pid)
+    stragglers, counts = np.unique([key(r["straggler"]) for r in rounds], return_counts=True)
+    summary["stragglers"] = dict(zip(stragglers.tolist(), counts.tolist()))
+    return summary
+
+
+def analyze_dir(path, pattern="timeline-rank*.json"):
+    """
+    :param path: a trace directory of one run
+    :return: the critical paths of its rounds
+    """
+    return critical_paths(parse_timeline(sorted(glob.glob(os.path.join(path, pattern)))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dirs", nargs="+", required=True, type=str,
+                        help="trace directories, one per run or configuration.")
+    parser.add_argument("--pattern", default="timeline-rank*.json", type=str,
+                        help="file name pattern of the timelines in each directory.")
+    parser.add_argument("--clients_per_cell", default=0, type=int,
+                        help="if given, count the stragglers per cell instead of per client.")
+    parser.add_argument("--rounds", action='store_true',
+                        help="if added, also print the critical path of every round.")
+    args = parser.parse_args()
+
+    header = "{:>6} {:>10} {:>10}" + " {:>12}" * len(COMPONENTS)
+    line = "{:>6} {:>10} {:>10.3f}" + " {:>12.3f}" * len(COMPONENTS)
+    share = "{:>6} {:>10} {:>10}" + " {:>11.1f}%" * len(COMPONENTS)
+
+    for path in args.dirs:
+        rounds = analyze_dir(path, args.pattern)
+        summary = summarize(rounds, args.clients_per_cell)
+        print(os.path.basename(os.path.normpath(path)))
+
+        if summary["rounds"] == 0:
+            print("  no complete round")
+            continue
+
+        print(header.format("round", "straggler", "round s", *COMPONENTS))
+        if args.rounds:
+            for r in rounds:
+                print(line.format(r["round"], r["straggler"], r["duration"], *[r[c] for c in COMPONENTS]))
+        print(line.format("mean", "", summary["round_s"], *[summary[c] for c in COMPONENTS]))
+        print(share.format("share", "", "", *[100 * summary[c + "_share"] for c in COMPONENTS]))
+
+        unit = "cell" if args.clients_per_cell else "client"
+        top = sorted(summary["stragglers"].items(), key=lambda item: -item[1])[:5]
+        print("  {} rounds, limited by {}, stragglers per {}: {}".format(
+            summary["rounds"], summary["limit"], unit, ", ".join("{}:{}".format(k, v) for k, v in top)))
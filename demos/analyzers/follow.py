@@ -0,0 +1,312 @@
+"""
+Follow runs in progress from their growing time-acc-loss.txt and energy<id>.txt / ml_energy<id>.txt traces.
+
+Every poll reads only the bytes appended since the previous one and updates running aggregates per run:
+    time-to-accuracy: the first round and simulated time at which each --accs / --losses threshold is crossed
+    energy per round: the energy of all the traced nodes consumed between two evaluations of the server
+    per-cell stats:   the energy so far of each cell and its ml share (clients are numbered from 1)
+    stalled:          the rounds since the best acc (or loss) last improved, to spot the runs to kill early
+
+Runs whose run.json says finished are polled a last time and dropped, the command returns when no run is left.
+
+python follow.py --dirs ../saved_traffic/outputs-4/trace-... --clients_per_cell 4 --losses 0.02 0.01 --interval 30
+"""
+import argparse
+import bisect
+import json
+import os
+import re
+import time
+
+MANIFEST = "run.json"
+RESULTS_FILE = "time-acc-loss.txt"
+ENERGY_FILE = re.compile(r"^(ml_)?energy(\d+)\.txt$")
+ENERGY_LINE = re.compile(r"^\D*(\d+\.?\d*)\D+(\d+\.?\d*)")
+NUMBER = re.compile(r"\d+\.?\d*")
+
+
+class FileTail:
+    """
+    Reads the complete lines appended to a file since the previous call, starting from the last offset.
+
+    A partial last line is kept until its end is written. A truncated or replaced file (e.g. the tf dir of
+    a restarted run) is read again from the start, and generation is incremented.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b""
+        self.inode = None
+        self.generation = 0
+
+    def read_lines(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return []
+        if self.inode is not None and (stat.st_ino != self.inode or stat.st_size < self.offset):
+            self.offset, self.partial = 0, b""
+            self.generation += 1
+        self.inode = stat.st_ino
+        if stat.st_size == self.offset:
+            return []
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(stat.st_size - self.offset)
+        self.offset += len(data)
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        return [line.decode(errors="replace") for line in lines]
+
+
+class EnergyTrace:
+    """
+    The cumulative energy samples of one node read so far, trimmed to the ones still needed by the
+    rounds not settled yet.
+    """
+    def __init__(self, path):
+        self.tail = FileTail(path)
+        self.times = []
+        self.energies = []
+        self._generation = 0
+
+    def poll(self):
+        lines = self.tail.read_lines()
+        if self.tail.generation != self._generation:
+            self.times, self.energies = [], []
+            self._generation = self.tail.generation
+        for line in lines:
+            match = ENERGY_LINE.match(line)
+            if match:
+                self.times.append(float(match.group(1)))
+                self.energies.append(float(match.group(2)))
+
+    def last(self):
+        return (self.times[-1], self.energies[-1]) if self.times else (0.0, 0.0)
+
+    def at(self, t):
+        """
+        :return: the energy consumed at time t, the last sample at or before t (0 before the first sample)
+        """
+        i = bisect.bisect_right(self.times, t)
+        return self.energies[i - 1] if i else 0.0
+
+    def trim(self, t):
+        """
+        Drop the samples that at(t') no longer needs for any t' >= t.
+        """
+        i = bisect.bisect_right(self.times, t) - 1
+        if i > 0:
+            del self.times[:i]
+            del self.energies[:i]
+
+
+def _tf_dir(trace_dir):
+    """
+    :return: the results dir of a trace dir, from its run.json if any, else the sibling tf<record_prefix>
+    """
+    try:
+        with open(os.path.join(trace_dir, MANIFEST), "r") as f:
+            return os.path.normpath(os.path.join(trace_dir, json.load(f)["artifacts"]["tf"]))
+    except (OSError, ValueError, KeyError):
+        trace_dir = os.path.normpath(trace_dir)
+        name = os.path.basename(trace_dir)
+        return os.path.join(os.path.dirname(trace_dir), "tf" + name[len("trace"):])
+
+
+class RunFollower:
+    def __init__(self, trace_dir, tf_dir=None, clients_per_cell=0, accs=(), losses=()):
+        """
+        :param trace_dir: the trace dir of one run
+        :param tf_dir: its results dir, found from trace_dir if None
+        :param clients_per_cell: the number of clients per cell for the per-cell stats, one cell if 0
+        :param accs: thresholds crossed when acc > threshold
+        :param losses: thresholds crossed when loss < threshold
+        """
+        self.trace_dir = trace_dir
+        self.results = FileTail(os.path.join(tf_dir or _tf_dir(trace_dir), RESULTS_FILE))
+        self.energy = {}  # (kind, node) -> EnergyTrace, kind being "ml" or "wifi"
+        self.clients_per_cell = clients_per_cell
+        self.accs = sorted(accs)
+        self.losses = sorted(losses, reverse=True)
+        self.finished = False
+        self._reset_results()
+
+    def _reset_results(self):
+        self.rounds = []          # (epoch, time, loss, acc) of every evaluation
+        self.reached = {}         # ("acc" or "loss", threshold) -> (epoch, time)
+        self.best = (None, None)  # best acc, best loss
+        self.best_round = 0
+        self.round_energy = []    # energy of all the nodes at the time of each settled round
+        self._generation = self.results.generation
+
+    def poll(self):
+        """
+        Read what the run appended since the previous poll and update the aggregates.
+        """
+        try:
+            with open(os.path.join(self.trace_dir, MANIFEST), "r") as f:
+                self.finished = json.load(f).get("status") == "finished"
+        except (OSError, ValueError):
+            pass
+
+        lines = self.results.read_lines()
+        if self.results.generation != self._generation:
+            self._reset_results()
+        for line in lines:
+            numbers = NUMBER.findall(line)
+            if len(numbers) >= 5:
+                self._add_round(int(numbers[0]), float(numbers[1]), float(numbers[3]), float(numbers[4]))
+
+        try:
+            names = [entry.name for entry in os.scandir(self.trace_dir)]
+        except OSError:
+            names = []
+        for name in names:
+            match = ENERGY_FILE.match(name)
+            if match:
+                key = ("ml" if match.group(1) else "wifi", int(match.group(2)))
+                if key not in self.energy:
+                    self.energy[key] = EnergyTrace(os.path.join(self.trace_dir, name))
+        for trace in self.energy.values():
+            trace.poll()
+        self._settle()
+
+    def _add_round(self, epoch, t, loss, acc):
+        self.rounds.append((epoch, t, loss, acc))
+        best_acc, best_loss = self.best
+        if best_acc is None or acc > best_acc or loss < best_loss:
+            self.best_round = epoch + 1
+        self.best = (acc if best_acc is None else max(acc, best_acc), loss if best_loss is None else min(loss, best_loss))
+
+        for threshold in self.accs:
+            if acc > threshold:
+                self.reached.setdefault(("acc", threshold), (epoch, t))
+        for threshold in self.losses:
+            if loss < threshold:
+                self.reached.setdefault(("loss", threshold), (epoch, t))
+
+    def _settle(self):
+        """
+        Take the energy at the rounds that every node has traced past (all of them once the run finished).
+        """
+        if not self.energy:
+            return
+        horizon = float("inf") if self.finished else min(trace.last()[0] for trace in self.energy.values())
+        while len(self.round_energy) < len(self.rounds):
+            t = self.rounds[len(self.round_energy)][1]
+            if t > horizon:
+                break
+            self.round_energy.append(sum(trace.at(t) for trace in self.energy.values()))
+            for trace in self.energy.values():
+                trace.trim(t)
+
+    def cell(self, node):
+        return (node - 1) // self.clients_per_cell if self.clients_per_cell else 0
+
+    def summary(self):
+        """
+        :return: a dict of the running aggregates
+        """
+        summary = {
+            # rounds evaluated on a subset (see TaskBase.enable_async_eval) have no row, count the epochs
+            "rounds": self.rounds[-1][0] + 1 if self.rounds else 0,
+            "time": self.rounds[-1][1] if self.rounds else 0.0,
+            "acc": self.rounds[-1][3] if self.rounds else None,
+            "loss": self.rounds[-1][2] if self.rounds else None,
+            "best_acc": self.best[0],
+            "best_loss": self.best[1],
+            "stalled": (self.rounds[-1][0] + 1 if self.rounds else 0) - self.best_round,
+            "reached": dict(self.reached),
+            "finished": self.finished,
+            "history": list(self.rounds),
+        }
+
+        per_round = [b - a for a, b in zip([0.0] + self.round_energy[:-1], self.round_energy)]
+        summary["energy_per_round"] = per_round
+        summary["energy_round_mean"] = sum(per_round) / len(per_round) if per_round else None
+
+        cells = {}
+        for (kind, node), trace in self.energy.items():
+            stats = cells.setdefault(self.cell(node), {"nodes": set(), "ml": 0.0, "wifi": 0.0})
+            stats["nodes"].add(node)
+            stats[kind] += trace.last()[1]
+        for stats in cells.values():
+            stats["nodes"] = len(stats["nodes"])
+            stats["energy"] = stats["ml"] + stats["wifi"]
+            stats["ml_share"] = stats["ml"] / stats["energy"] if stats["energy"] else 0.0
+        summary["cells"] = cells
+        summary["energy"] = sum(stats["energy"] for stats in cells.values())
+        return summary
+
+
+def _format(value, spec="{:.4f}"):
+    return "-" if value is None else spec.format(value)
+
+
+def print_summary(name, summary):
+    print("{}{}".format(name, " (finished)" if summary["finished"] else ""))
+    print("  round {}  time {}s  acc {}  loss {}  best acc {}  best loss {}  stalled for {} rounds".format(
+        summary["rounds"], _format(summary["time"], "{:.1f}"), _format(summary["acc"]), _format(summary["loss"]),
+        _format(summary["best_acc"]), _format(summary["best_loss"]), summary["stalled"]))
+    per_round = summary["energy_per_round"]
+    print("  energy {}J  per round {}J (last {}J)".format(
+        _format(summary["energy"], "{:.2f}"), _format(summary["energy_round_mean"], "{:.2f}"),
+        _format(per_round[-1] if per_round else None, "{:.2f}")))
+    for (column, threshold), (epoch, t) in sorted(summary["reached"].items()):
+        print("  {} {} reached at round {}, {:.1f}s".format(column, threshold, epoch, t))
+    for cell, stats in sorted(summary["cells"].items()):
+        print("  cell {:>3}: {} nodes  {:.2f}J  ml {:.1f}%".format(
+            cell, stats["nodes"], stats["energy"], 100 * stats["ml_share"]))
+
+
+def plot_summaries(names, summaries, metric):
+    import matplotlib.pyplot as plt
+
+    plt.clf()
+    for name, summary in zip(names, summaries):
+        energy = [sum(summary["energy_per_round"][:i + 1]) for i in range(len(summary["energy_per_round"]))]
+        plt.plot(energy, [r[3 if metric == "acc" else 2] for r in summary["history"][:len(energy)]], label=name)
+    plt.xlabel("energy (J)")
+    plt.ylabel(metric)
+    plt.legend(loc="best")
+    plt.pause(0.01)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dirs", nargs="+", required=True, type=str,
+                        help="trace directories of the runs to follow.")
+    parser.add_argument("--clients_per_cell", default=0, type=int,
+                        help="if given, aggregate the energy per cell instead of over all the nodes.")
+    parser.add_argument("--accs", nargs="*", default=[], type=float,
+                        help="acc thresholds of the time-to-accuracy.")
+    parser.add_argument("--losses", nargs="*", default=[], type=float,
+                        help="loss thresholds of the time-to-accuracy.")
+    parser.add_argument("--interval", default=10.0, type=float,
+                        help="seconds between two polls.")
+    parser.add_argument("--plot", default=None, choices=["acc", "loss"],
+                        help="if given, also redraw acc or loss against the energy at each poll.")
+    args = parser.parse_args()
+
+    followers = {path: RunFollower(path, clients_per_cell=args.clients_per_cell, accs=args.accs, losses=args.losses)
+                 for path in args.dirs}
+    try:
+        while followers:
+            names, summaries = [], []
+            for path, follower in list(followers.items()):
+                follower.poll()
+                summary = follower.summary()
+                names.append(os.path.basename(os.path.normpath(path)))
+                summaries.append(summary)
+                print_summary(names[-1], summary)
+                if follower.finished:
+                    del followers[path]
+            if args.plot:
+                plot_summaries(names, summaries, args.plot)
+            print()
+            if followers:
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,88 @@
+"""
+Merge the binary trace shards of an MPI run into one time-ordered file.
+
+Each rank writes its own shard (trace-rank<rank>.bin, see TraceHelper::EnableBinary). The shards are read
+and sorted by time in parallel, one process per shard, then merged into one .npz holding:
+    records: all the records (time, node, metric, value) in time order
+    nodes:   the traced nodes, sorted
+    indptr:  records[perm[indptr[i]:indptr[i+1]]] are the records of nodes[i], in time order
+    perm:    see indptr
+
+python merge_traces.py --dir ../saved_minist/trace-... --output trace.npz
+"""
+import argparse
+import glob
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from utils import read_binary_trace, TRACE_DTYPE
+
+
+def load_shard(path):
+    """
+    :param path: one shard
+    :return: the records of the shard sorted by time
+    """
+    records = read_binary_trace(path)
+    # the chunks of one node are already in time order, a stable sort keeps the order of equal times
+    order = np.argsort(records["time"], kind="stable")
+    return np.asarray(records[order])
+
+
+def merge_shards(paths, processes=None):
+    """
+    :param paths: the shards to merge
+    :param processes: number of worker processes, one per cpu if None
+    :return: records, nodes, indptr, perm as described above
+    """
+    if len(paths) > 1:
+        with Pool(min(processes or os.cpu_count(), len(paths))) as pool:
+            shards = pool.map(load_shard, paths)
+    else:
+        shards = [load_shard(path) for path in paths]
+
+    if not shards:
+        records = np.empty(0, dtype=TRACE_DTYPE)
+    else:
+        # every shard is a sorted run, which the stable merge sort of numpy handles in linear passes
+        records = np.concatenate(shards)
+        records = records[np.argsort(records["time"], kind="stable")]
+
+    perm = np.argsort(records["node"], kind="stable")
+    nodes, counts = np.unique(records["node"][perm], return_counts=True)
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return records, nodes, indptr, perm
+
+
+def node_records(merged, node):
+    """
+    :param merged: the NpzFile of a merged trace
+    :param node: the node to read
+    :return: the records of one node in time order
+    """
+    nodes = merged["nodes"]
+    i = np.searchsorted(nodes, node)
+    if i == len(nodes) or nodes[i] != node:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    indptr = merged["indptr"]
+    return merged["records"][merged["perm"][indptr[i]:indptr[i + 1]]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=".", type=str,
+                        help="directory of the shards.")
+    parser.add_argument("--pattern", default="trace-rank*.bin", type=str,
+                        help="file name pattern of the shards.")
+    parser.add_argument("--output", default="trace.npz", type=str,
+                        help="the merged trace, relative to --dir.")
+    parser.add_argument("--processes", default=None, type=int,
+                        help="number of worker processes, one per cpu by default.")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.dir, args.pattern)))
+    records, nodes, indptr, perm = merge_shards(paths, args.processes)
+    np.savez(os.path.join(args.dir, args.output), records=records, nodes=nodes, indptr=indptr, perm=perm)
+    print("merged {} shards: {} records of {} nodes".format(len(paths), len(records), len(nodes)))
@@ -1,6 +1,7 @@
 import os
 import numpy as np
-from utils import plot_xs_ys, parse_time_acc_loss, parse_energy, plot_xs_ys1_ys2, parse_all_energy
+from utils import plot_xs_ys, parse_time_acc_loss, parse_energy, plot_xs_ys1_ys2, parse_all_energy, threshold_search, \
+    preload_sweep
 import matplotlib.pyplot as plt
 
 current_path = '/Users/mag0a/Desktop/Github/FLinMEN/ns-3-allinone/ns-3-dev/contrib/distributed-ml-test/demos/'
@@ -51,6 +52,9 @@ def process_acc_energy(energy, acc):
 
 
 if __name__=="__main__":
+    # parse the traces of all the configurations in parallel, the loops below read the cached arrays
+    preload_sweep([os.path.join(current_path, "saved_minist")])
+
     if plot_1:
         iters = 0
         epoch_w, time_w, wall_clock_w, loss_w, acc_w = {}, {}, {}, {}, {}
@@ -128,9 +132,10 @@ if __name__=="__main__":
                     acc_avg_energy_w[iters] = []
                     acc_sum_energy_w[iters] = []
                     acc_w[iters] = []
-                    for acc in np.arange(0.9, 0.955, 0.005):
-                        _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_acc=acc)
-                        _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                    thresholds = np.arange(0.9, 0.955, 0.005)
+                    _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_accs=thresholds)
+                    for acc, time in zip(thresholds, stop_times):
+                        _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                         acc_avg_energy_w[iters].append(avg_energy[-1])
                         acc_sum_energy_w[iters].append(sum_energy[-1])
                         acc_w[iters].append(acc)
@@ -227,9 +232,10 @@ if __name__=="__main__":
                 acc_avg_energy_w[iters] = []
                 acc_sum_energy_w[iters] = []
                 acc_w[iters] = []
-                for acc in np.arange(0.9, 0.98, 0.002):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_acc=acc)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.9, 0.98, 0.002)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_accs=thresholds)
+                for acc, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     acc_avg_energy_w[iters].append(avg_energy[-1])
                     acc_sum_energy_w[iters].append(sum_energy[-1])
                     acc_w[iters].append(acc)
@@ -343,13 +349,13 @@ if __name__=="__main__":
                     acc_avg_energy_w[iters] = []
                     acc_sum_energy_w[iters] = []
                     acc_w[iters] = []
-                    for acc in np.arange(0.9, 0.98, 0.002):
-                        epochs, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'),
-                                                               stop_acc=acc)
-                        if epochs[-1]==stop_epoch:
+                    thresholds = np.arange(0.9, 0.98, 0.002)
+                    stop_epochs, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_accs=thresholds)
+                    for acc, epoch, time in zip(thresholds, stop_epochs, stop_times):
+                        if epoch==stop_epoch:
                             print("reach stop epoch")
                             break
-                        _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                        _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                         acc_avg_energy_w[iters].append(avg_energy[-1])
                         acc_sum_energy_w[iters].append(sum_energy[-1])
                         acc_w[iters].append(acc)
@@ -466,9 +472,10 @@ if __name__=="__main__":
                 acc_avg_energy_w[iters] = []
                 acc_sum_energy_w[iters] = []
                 acc_w[iters] = []
-                for acc in np.arange(0.9, 0.98, 0.002):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_acc=acc)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.9, 0.98, 0.002)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_accs=thresholds)
+                for acc, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     acc_avg_energy_w[iters].append(avg_energy[-1])
                     acc_sum_energy_w[iters].append(sum_energy[-1])
                     acc_w[iters].append(acc)
@@ -565,9 +572,10 @@ if __name__=="__main__":
                 acc_avg_energy_w[iters] = []
                 acc_sum_energy_w[iters] = []
                 acc_w[iters] = []
-                for acc in np.arange(0.9, 0.98, 0.002):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_acc=acc)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.9, 0.98, 0.002)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_accs=thresholds)
+                for acc, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     acc_avg_energy_w[iters].append(avg_energy[-1])
                     acc_sum_energy_w[iters].append(sum_energy[-1])
                     acc_w[iters].append(acc)
@@ -664,9 +672,10 @@ if __name__=="__main__":
                 acc_avg_energy_w[iters] = []
                 acc_sum_energy_w[iters] = []
                 acc_w[iters] = []
-                for acc in np.arange(0.9, 0.98, 0.002):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_acc=acc)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.9, 0.98, 0.002)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_accs=thresholds)
+                for acc, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     acc_avg_energy_w[iters].append(avg_energy[-1])
                     acc_sum_energy_w[iters].append(sum_energy[-1])
                     acc_w[iters].append(acc)
@@ -747,7 +756,7 @@ if __name__=="__main__":
                 epochs, times, wall_clocks, losses, accs = parse_time_acc_loss(time_acc_loss_path, stop_epoch=9)
                 time_w[iters] = times
                 acc_w[iters] = accs
-                avg_time, avg_energy, energys = parse_all_energy(trace_dir, times[-1])
+                avg_time, avg_energy, energys, _ = parse_all_energy(trace_dir, times[-1])
 
                 acc_avg_energy_w[iters] = avg_energy
                 acc_energy_ratio[iters] = energys[0]/energys[-1]
@@ -1,7 +1,8 @@
 import os
 import pickle
 import numpy as np
-from utils import plot_xs_ys, parse_time_acc_loss, parse_energy, plot_xs_ys1_ys2, parse_all_energy
+from utils import plot_xs_ys, parse_time_acc_loss, parse_energy, plot_xs_ys1_ys2, parse_all_energy, threshold_search, \
+    preload_sweep
 import matplotlib.pyplot as plt
 
 
@@ -55,6 +56,8 @@ def process_loss_energy(energy, loss):
 
 
 if __name__=="__main__":
+    # parse the traces of all the configurations in parallel, the loops below read the cached arrays
+    preload_sweep([os.path.join(current_path, "saved_traffic")])
 
     if plot_1:
         iters = 0
@@ -144,9 +147,10 @@ if __name__=="__main__":
                     loss_avg_energy_w[iters] = []
                     loss_sum_energy_w[iters] = []
                     loss_w[iters] = []
-                    for loss in np.arange(0.275, 0.255, -0.001):
-                        _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_loss=loss)
-                        _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                    thresholds = np.arange(0.275, 0.255, -0.001)
+                    _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_losses=thresholds)
+                    for loss, time in zip(thresholds, stop_times):
+                        _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                         loss_avg_energy_w[iters].append(avg_energy[-1])
                         loss_sum_energy_w[iters].append(sum_energy[-1])
                         loss_w[iters].append(loss)
@@ -259,10 +263,10 @@ if __name__=="__main__":
                 loss_avg_energy_w[iters] = []
                 loss_sum_energy_w[iters] = []
                 loss_w[iters] = []
-                for loss in np.arange(0.3, 0.24, -0.001):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'),
-                                                           stop_loss=loss)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.3, 0.24, -0.001)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_losses=thresholds)
+                for loss, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     loss_avg_energy_w[iters].append(avg_energy[-1])
                     loss_sum_energy_w[iters].append(sum_energy[-1])
                     loss_w[iters].append(loss)
@@ -397,12 +401,12 @@ if __name__=="__main__":
                     loss_avg_energy_w[iters] = []
                     loss_sum_energy_w[iters] = []
                     loss_w[iters] = []
-                    for loss in np.arange(0.3, 0.245, -0.001):
-                        epochs, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'),
-                                                               stop_loss=loss)
-                        if epochs[-1]==stop_epoch:
+                    thresholds = np.arange(0.3, 0.245, -0.001)
+                    stop_epochs, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_losses=thresholds)
+                    for loss, epoch, time in zip(thresholds, stop_epochs, stop_times):
+                        if epoch==stop_epoch:
                             break
-                        _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                        _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                         loss_avg_energy_w[iters].append(avg_energy[-1])
                         loss_sum_energy_w[iters].append(sum_energy[-1])
                         loss_w[iters].append(loss)
@@ -518,9 +522,10 @@ if __name__=="__main__":
                 loss_avg_energy_w[iters] = []
                 loss_sum_energy_w[iters] = []
                 loss_w[iters] = []
-                for loss in np.arange(0.3, 0.245, -0.001):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_loss=loss)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.3, 0.245, -0.001)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_losses=thresholds)
+                for loss, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     loss_avg_energy_w[iters].append(avg_energy[-1])
                     loss_sum_energy_w[iters].append(sum_energy[-1])
                     loss_w[iters].append(loss)
@@ -617,9 +622,10 @@ if __name__=="__main__":
                 loss_avg_energy_w[iters] = []
                 loss_sum_energy_w[iters] = []
                 loss_w[iters] = []
-                for loss in np.arange(0.3, 0.245, -0.001):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_loss=loss)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.3, 0.245, -0.001)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_losses=thresholds)
+                for loss, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     loss_avg_energy_w[iters].append(avg_energy[-1])
                     loss_sum_energy_w[iters].append(sum_energy[-1])
                     loss_w[iters].append(loss)
@@ -717,9 +723,10 @@ if __name__=="__main__":
                 loss_avg_energy_w[iters] = []
                 loss_sum_energy_w[iters] = []
                 loss_w[iters] = []
-                for loss in np.arange(0.3, 0.245, -0.001):
-                    _, time, _, _, _ = parse_time_acc_loss(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_loss=loss)
-                    _, avg_energy, sum_energy = parse_energy(trace_dir, time[-1])
+                thresholds = np.arange(0.3, 0.245, -0.001)
+                _, stop_times = threshold_search(os.path.join(tf_dir, 'time-acc-loss.txt'), stop_losses=thresholds)
+                for loss, time in zip(thresholds, stop_times):
+                    _, avg_energy, sum_energy = parse_energy(trace_dir, time)
                     loss_avg_energy_w[iters].append(avg_energy[-1])
                     loss_sum_energy_w[iters].append(sum_energy[-1])
                     loss_w[iters].append(loss)
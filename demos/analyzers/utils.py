@@ -1,7 +1,16 @@
 import os
+import json
+import hashlib
 import matplotlib.pyplot as plt
 import re
 import numpy as np
+import sys
+from multiprocessing import Pool
+
+# the layout of the trace records is defined next to the simulation that writes them
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "network"))
+from trace_format import TRACE_MAGIC, TRACE_INDEX_MAGIC, TRACE_HEADER_SIZE, TRACE_TRAILER_SIZE, TRACE_DTYPE, \
+    TRACE_INDEX_DTYPE, TRACE_METRICS
 
 plt.rcParams.update({
     "text.usetex": True,
@@ -70,29 +79,205 @@ def plot_xs_ys1_ys2(xs, ys1, ys2, xlabel=None, ylabel1=None, ylabel2=None, title
 
 
 
+# Parsed text traces are cached as .npy files, one per version of the source: the key is the absolute
+# path, mtime and size of the text file. The cached arrays are memory-mapped read-only, so the processes
+# loading the same files share their pages instead of holding one copy each.
+CACHE_DIR = os.environ.get("AIRDL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "airdl"))
+
+RESULTS_COLUMNS = ["epoch", "time", "wall_clock", "loss", "acc"]
+_ENERGY_LINE = re.compile(r"^\D*(\d+\.?\d*)\D+(\d+\.?\d*)", re.M)
+_ENERGY_FILE = re.compile(r"^(ml_)?energy\d+\.txt$")
+_RESULTS_FILE = "time-acc-loss.txt"
+
+
+def _parse_results_text(path):
+    with open(path) as f:
+        rows = [[float(n) for n in re.findall(r"\d+\.?\d*", line)[:5]] for line in f]
+    return np.array([row for row in rows if len(row) == 5], dtype=np.float64).reshape(-1, 5)
+
+
+def _parse_energy_text(path):
+    with open(path) as f:
+        pairs = _ENERGY_LINE.findall(f.read())
+    return np.array(pairs, dtype=np.float64).reshape(-1, 2)
+
+
+_PARSERS = {"results": _parse_results_text, "energy": _parse_energy_text}
+
+
+def _cache_path(path, kind):
+    stat = os.stat(path)
+    key = "{}|{}|{}|{}".format(os.path.abspath(path), stat.st_mtime_ns, stat.st_size, kind)
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".npy")
+
+
+def _build_cache(job):
+    """
+    :param job: (path, kind) of a text file and its parser in _PARSERS
+    :return: the path of the cached array, parsed now if missing, None if the cache cannot be written
+    """
+    path, kind = job
+    cache_path = _cache_path(path, kind)
+    if os.path.exists(cache_path):
+        return cache_path
+    array = _PARSERS[kind](path)
+    tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, cache_path)  # concurrent loaders never see a partial file
+    except OSError:
+        return None
+    return cache_path
+
+
+def cached_array(path, kind):
+    """
+    :param path: a text trace
+    :param kind: "energy" (energy<id>.txt, ml_energy<id>.txt) or "results" (time-acc-loss.txt)
+    :return: the parsed table, memory-mapped read-only from the cache (parsed in memory if the cache is not writable)
+    """
+    cache_path = _build_cache((path, kind))
+    if cache_path is None:
+        return _PARSERS[kind](path)
+    try:
+        return np.load(cache_path, mmap_mode="r")
+    except ValueError:
+        return np.load(cache_path)  # an empty table cannot be mapped
+
+
+def load_parallel(paths, kind, processes=None):
+    """
+    :param paths: text traces of one kind, e.g. every energy file of a sweep
+    :param processes: number of worker processes, one per cpu if None
+    :return: {path: table} as cached_array, the missing cache entries being parsed across a process pool
+    """
+    jobs = [(path, kind) for path in paths if not os.path.exists(_cache_path(path, kind))]
+    if len(jobs) > 1 and processes != 1:
+        with Pool(min(processes or os.cpu_count(), len(jobs))) as pool:
+            pool.map(_build_cache, jobs)
+    return {path: cached_array(path, kind) for path in paths}
+
+
+def preload_sweep(roots, processes=None):
+    """
+    :param roots: directories holding runs, e.g. saved_minist, searched recursively
+    :return: the number of files cached. The energy traces and results of every configuration are parsed in
+             one process pool, so the parse_* calls of the plotting loops only map the cached arrays.
+    """
+    jobs = {"energy": [], "results": []}
+    for root in roots:
+        for dir_path, _, names in os.walk(root):
+            for name in names:
+                if _ENERGY_FILE.match(name):
+                    jobs["energy"].append(os.path.join(dir_path, name))
+                elif name == _RESULTS_FILE:
+                    jobs["results"].append(os.path.join(dir_path, name))
+    for kind, paths in jobs.items():
+        load_parallel(paths, kind, processes)
+    return sum(len(paths) for paths in jobs.values())
+
+
+_results_cache = {}
+
+
+def load_results(time_acc_loss_path):
+    """
+    :param time_acc_loss_path: the path of time-acc-loss.txt (the last column is the mse for traffic)
+    :return: {column: array} of RESULTS_COLUMNS, one element per evaluation, parsed once per file version
+    """
+    key = (time_acc_loss_path, os.path.getmtime(time_acc_loss_path))
+    if key in _results_cache:
+        return _results_cache[key]
+
+    table = cached_array(time_acc_loss_path, "results")
+    results = {column: table[:, i] for i, column in enumerate(RESULTS_COLUMNS)}
+    results["epoch"] = results["epoch"].astype(np.int64)
+
+    _results_cache[key] = results
+    return results
+
+
+def stop_index(results, stop_epoch=100, stop_acc=1000, stop_loss=0):
+    """
+    :param results: the output of load_results
+    :param stop_acc: a threshold or an array of thresholds on the acc column
+    :param stop_loss: a threshold or an array of thresholds on the loss column
+    :return: the index of the first evaluation with epoch > stop_epoch, acc > stop_acc or loss < stop_loss,
+             or of the last evaluation, per threshold
+    """
+    n = len(results["epoch"])
+    if n == 0:
+        raise ValueError("no evaluation in the results")
+    # the running max of acc and min of loss are sorted, so a binary search finds the first crossing
+    acc_index = np.searchsorted(np.maximum.accumulate(results["acc"]), stop_acc, side="right")
+    loss_index = np.searchsorted(-np.minimum.accumulate(results["loss"]), -np.asarray(stop_loss), side="right")
+    epoch_index = np.searchsorted(np.maximum.accumulate(results["epoch"]), stop_epoch, side="right")
+    return np.minimum(np.minimum(acc_index, loss_index), min(epoch_index, n - 1))
+
+
+def threshold_search(time_acc_loss_path, stop_accs=1000, stop_losses=0, stop_epoch=100):
+    """
+    :param stop_accs: thresholds on acc, e.g. np.arange(0.9, 0.98, 0.002)
+    :param stop_losses: thresholds on loss
+    :return: the epochs and times at which each threshold is reached, as parse_time_acc_loss(...)[0][-1] and [1][-1]
+    """
+    results = load_results(time_acc_loss_path)
+    index = stop_index(results, stop_epoch, stop_accs, stop_losses)
+    return results["epoch"][index], results["time"][index]
+
+
 def parse_time_acc_loss(time_acc_loss_path, stop_epoch=100, stop_acc=1000, stop_loss=0, time_ratio=1):
     """
     :param time_acc_loss_path: the path of time_acc_loss.txt
     :return: epochs, times, wall_clocks, losses, accs, before a stop_epoch
     """
-    epochs, times, wall_clocks, losses, accs = [], [], [], [], []
+    results = load_results(time_acc_loss_path)
+    if len(results["epoch"]) == 0:
+        return [], [], [], [], []
+    end = int(stop_index(results, stop_epoch, stop_acc, stop_loss)) + 1
+
+    return results["epoch"][:end].tolist(), (results["time"][:end]*time_ratio).tolist(), \
+        results["wall_clock"][:end].tolist(), results["loss"][:end].tolist(), results["acc"][:end].tolist()
+
+
+
+_energy_cache = {}
+
+
+def read_energy_file(log_path):
+    """
+    :param log_path: an energy<id>.txt or ml_energy<id>.txt trace
+    :return: times, energies as arrays, the first two numbers of each line, parsed once per file version
+    """
+    key = (log_path, os.path.getmtime(log_path))
+    if key not in _energy_cache:
+        values = cached_array(log_path, "energy")
+        _energy_cache[key] = (values[:, 0], values[:, 1])
+    return _energy_cache[key]
 
-    with open(time_acc_loss_path) as f:
-        for line in f.readlines():
-            numbers = re.findall(r"\d+\.?\d*", line)
-            epoch, time, wall_clock, loss, acc = int(numbers[0]), float(numbers[1]), float(numbers[2]), float(
-                numbers[3]), float(numbers[4])
 
-            epochs.append(epoch)
-            times.append(time*time_ratio)
-            wall_clocks.append(wall_clock)
-            losses.append(loss)
-            accs.append(acc)
-            if epoch > stop_epoch or acc > stop_acc or loss < stop_loss:
-                break
+def energy_as_of(times, energies, at):
+    """
+    :param times, energies: one energy trace, as returned by read_energy_file
+    :param at: query times
+    :return: the time and energy of the first sample at or after each query time, or of the last sample
+             (0, 0 for an empty trace), as parse_energy_per_file does for one query
+    """
+    at = np.asarray(at, dtype=np.float64)
+    if len(times) == 0:
+        return np.zeros_like(at), np.zeros_like(at)
+    index = np.minimum(np.searchsorted(np.maximum.accumulate(times), at, side="left"), len(times) - 1)
+    return times[index], energies[index]
 
-    return epochs, times, wall_clocks, losses, accs
 
+def _before(times, time_limit):
+    """
+    :return: the number of leading samples before the first one at or after time_limit
+    """
+    late = np.flatnonzero(times >= time_limit)
+    return late[0] if len(late) else len(times)
 
 
 def parse_energy(dir, time_limit):
@@ -103,85 +288,189 @@ def parse_energy(dir, time_limit):
     """
     times, energys = [], []
     for log_path in os.listdir(dir):
-        if "energy" in log_path and "ml_energy" not in log_path:
-            log_path = os.path.join(dir, log_path)
-            time_per, energy_per = [], []
-            with open(log_path) as f:
-                for line in f.readlines():
-                    numbers = re.findall(r"\d+\.?\d*", line)
-                    time, energy = float(numbers[0]), float(numbers[1])
-                    if time >= time_limit:
-                        break
-                    time_per.append(time)
-                    energy_per.append(energy)
-
-            times.append(time_per)
-            energys.append(energy_per)
+        match = _ENERGY_FILE.match(log_path)
+        if match and not match.group(1):
+            time_per, energy_per = read_energy_file(os.path.join(dir, log_path))
+            end = _before(time_per, time_limit)
+            times.append(time_per[:end])
+            energys.append(energy_per[:end])
 
     index = min([len(_) for _ in times])
 
-    times = [t[0:index] for t in times]
-    energys = [e[0:index] for e in energys]
-
-    times = np.array(times)
-    energys = np.array(energys)
+    times = np.array([t[0:index] for t in times])
+    energys = np.array([e[0:index] for e in energys])
     avg_time = np.average(times, axis=0)
     avg_energy = np.average(energys, axis=0)
-    sum_energy = np.sum(energys, axis=0)
     return avg_time, avg_energy, energys
 
 
 
 def parse_energy_per_file(log_path, time_limit):
-    time, energy = 0, 0
-    with open(log_path) as f:
-        for line in f.readlines():
-            numbers = re.findall(r"\d+\.?\d*", line)
-            time, energy = float(numbers[0]), float(numbers[1])
-            if time >= time_limit:
-                break
-    return time, energy
+    times, energies = read_energy_file(log_path)
+    time, energy = energy_as_of(times, energies, [time_limit])
+    return float(time[0]), float(energy[0])
 
 
 def parse_all_energy(dir, time_limit):
     """
     :param dir: the dir of trace
     :param time_limit: the given time limit
-    :return: the values which happened before time limit
+    :return: the values which happened before time limit. Every ml_energy<id>.txt sample is joined with the
+             first energy<id>.txt sample at or after it, all nodes being cut to the shortest series.
     """
 
-    times, energys, ml_to_wifi_ratio = [], [], []
+    times, ml_energys, wifi_energys = [], [], []
     for log_path in os.listdir(dir):
-        if "ml_energy" in log_path:
-            number = int(re.findall("\d+", log_path)[0])
-            log_path = os.path.join(dir, log_path)
-            time_per, energy_per, ml_to_wifi_ratio_per = [], [], []
-            with open(log_path) as f:
-                for line in f.readlines():
-                    numbers = re.findall(r"\d+\.?\d*", line)
-                    time_ml, energy_ml = float(numbers[0]), float(numbers[1])
-
-                    time_wifi, energy_wifi = parse_energy_per_file(os.path.join(dir, "energy{}.txt".format(number)), time_ml)
-
-                    if time_ml >= time_limit:
-                        break
-                    time_per.append(time_ml)
-                    energy_per.append(energy_ml + energy_wifi)
-                    ml_to_wifi_ratio_per.append(energy_ml / energy_wifi)
-
-            times.append(time_per)
-            energys.append(energy_per)
-            ml_to_wifi_ratio.append(ml_to_wifi_ratio_per)
+        match = _ENERGY_FILE.match(log_path)
+        if match and match.group(1):
+            number = int(re.findall(r"\d+", log_path)[0])
+            time_ml, energy_ml = read_energy_file(os.path.join(dir, log_path))
+            end = _before(time_ml, time_limit)
+
+            time_wifi, energy_wifi = read_energy_file(os.path.join(dir, "energy{}.txt".format(number)))
+            _, energy_wifi = energy_as_of(time_wifi, energy_wifi, time_ml[:end])
+
+            times.append(time_ml[:end])
+            ml_energys.append(energy_ml[:end])
+            wifi_energys.append(energy_wifi)
 
     index = min([len(_) for _ in times])
 
-    times = [t[0:index] for t in times]
-    energys = [e[0:index] for e in energys]
+    # one (nodes, samples) matrix per series, the totals and ratios of all the nodes in one operation
+    times = np.array([t[0:index] for t in times])
+    ml_energys = np.array([e[0:index] for e in ml_energys])
+    wifi_energys = np.array([e[0:index] for e in wifi_energys])
+    energys = ml_energys + wifi_energys
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ml_to_wifi_ratio = ml_energys / wifi_energys
 
-    times = np.array(times)
-    energys = np.array(energys)
-    ml_to_wifi_ratio = np.array(ml_to_wifi_ratio)
     avg_time = np.average(times, axis=0)
     avg_energy = np.average(energys, axis=0)
-    sum_energy = np.sum(energys, axis=0)
     return avg_time, avg_energy, energys, ml_to_wifi_ratio
+
+
+
+
+
+def _trace_layout(path):
+    """
+    :param path: a trace file written by TraceHelper.EnableBinary
+    :return: the end of the records and the index offset (None if the file has no index)
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(TRACE_HEADER_SIZE)
+        if len(header) < TRACE_HEADER_SIZE or header[:8] != TRACE_MAGIC:
+            raise ValueError("{} is not a binary trace".format(path))
+
+        version, record_size = np.frombuffer(header[8:], dtype="<u4")
+        if record_size != TRACE_DTYPE.itemsize:
+            raise ValueError("{}: unsupported record size {} (version {})".format(path, record_size, version))
+
+        if version < 2 or size < TRACE_HEADER_SIZE + TRACE_TRAILER_SIZE:
+            return size, None
+
+        f.seek(size - TRACE_TRAILER_SIZE)
+        trailer = f.read(TRACE_TRAILER_SIZE)
+    if trailer[:8] != TRACE_INDEX_MAGIC:
+        # the run did not reach Simulator::Destroy, the complete records are still readable
+        return TRACE_HEADER_SIZE + (size - TRACE_HEADER_SIZE) // record_size * record_size, None
+
+    index_offset = int(np.frombuffer(trailer[8:], dtype="<u8")[0])
+    return index_offset, index_offset
+
+
+def read_binary_trace(path):
+    """
+    :param path: a trace file written by TraceHelper.EnableBinary
+    :return: a read-only structured array (time, node, metric, value) mapped on the file, grouped in per-node chunks
+    """
+    end, _ = _trace_layout(path)
+    if end == TRACE_HEADER_SIZE:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    count = (end - TRACE_HEADER_SIZE) // TRACE_DTYPE.itemsize
+    return np.memmap(path, dtype=TRACE_DTYPE, mode="r", offset=TRACE_HEADER_SIZE, shape=(count,))
+
+
+def read_trace_index(path):
+    """
+    :param path: a trace file written by TraceHelper.EnableBinary
+    :return: the chunk index (node, count, offset), or None if the file has no index
+    """
+    _, index_offset = _trace_layout(path)
+    if index_offset is None:
+        return None
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(index_offset)
+        return np.frombuffer(f.read(size - TRACE_TRAILER_SIZE - index_offset), dtype=TRACE_INDEX_DTYPE)
+
+
+def read_trace_node(path, node):
+    """
+    :param path: a trace file written by TraceHelper.EnableBinary
+    :param node: the node to read
+    :return: the records of one node in time order, reading only its chunks when the file has an index
+    """
+    records = read_binary_trace(path)
+    index = read_trace_index(path)
+    if index is None:
+        return np.asarray(records[records["node"] == node])
+
+    chunks = index[index["node"] == node]
+    first = (chunks["offset"] - TRACE_HEADER_SIZE) // TRACE_DTYPE.itemsize
+    if len(chunks) == 0:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.concatenate([records[s:s + c] for s, c in zip(first, chunks["count"])])
+
+
+def parse_flow_stats(path):
+    """
+    :param path: a flows<id>.txt file written by DistributedMlTcpAgentHelper::EnableFlowStats
+    :return: a structured array with one row per connection and round, named after the header columns
+    """
+    with open(path, "r") as f:
+        names = f.readline().lstrip("#").split()
+    dtype = [(name, "U32" if name == "peer" else "f8") for name in names]
+    return np.atleast_1d(np.genfromtxt(path, dtype=dtype, delimiter="\t", skip_header=1))
+
+
+def parse_timeline(paths):
+    """
+    :param paths: timeline-rank<rank>.json files of one run, written by TimelineRecorder
+    :return: {pid: {name: [(tid, start, end), ...]}} of all the spans, in seconds and in time order
+    """
+    spans = {}
+    for path in paths:
+        with open(path, "r") as f:
+            events = json.load(f)["traceEvents"]
+        for event in events:
+            if event["ph"] != "X":
+                continue
+            start = event["ts"] * 1e-6
+            spans.setdefault(event["pid"], {}).setdefault(event["name"], []).append(
+                (event["tid"], start, start + event["dur"] * 1e-6))
+    for names in spans.values():
+        for name in names:
+            names[name].sort(key=lambda span: span[1])
+    return spans
+
+
+def select_trace(records, metric, node=None, time_limit=None):
+    """
+    :param records: the array returned by read_binary_trace
+    :param metric: a name of TRACE_METRICS or a metric id
+    :param node: keep one node only if given
+    :param time_limit: keep the records before time_limit if given
+    :return: times, nodes, values of the selected records, in time order
+    """
+    if isinstance(metric, str):
+        metric = TRACE_METRICS[metric]
+    mask = records["metric"] == metric
+    if node is not None:
+        mask &= records["node"] == node
+    if time_limit is not None:
+        mask &= records["time"] < time_limit
+
+    selected = records[mask]
+    return selected["time"], selected["node"], selected["value"]
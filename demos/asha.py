@@ -0,0 +1,210 @@
+"""
+	Successive halving of a sweep: unpromising runs are stopped early from their partial time-acc-loss.txt.
+	The spec is the one of sweep.py with a halving section (see configurations/sweep_minist.yaml):
+		metric:     acc or loss, the acc column being the mse for traffic
+		mode:       max or min
+		min_rounds: the first rung, in evaluated rounds
+		eta:        rungs are min_rounds*eta^k rounds, and a run passes a rung if it is in the top 1/eta
+		brackets:   Hyperband brackets, bracket b starting at min_rounds*eta^b (1 is plain successive halving)
+	Runs cannot be paused, so the halving is asynchronous (ASHA): when a run reaches a rung, its learning curve is
+	extrapolated to its full budget (its --epochs) and compared to the runs that reached the same rung before. Runs in
+	the top 1/eta continue, the others are stopped. With fewer than eta runs at a rung, the run continues.
+
+	Decisions are kept in the sweep.json of every run, an interrupted sweep resumes with the same rungs.
+
+	python asha.py configurations/sweep_minist.yaml --cores 32
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from sweep import load_spec, make_jobs, Scheduler
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "analyzers"))
+from follow import FileTail, NUMBER
+
+
+# exponents tried for the curve y = a + b*t^-c
+CURVE_EXPONENTS = [0.25, 0.5, 0.75, 1.0, 1.5, 2.0]
+DONE = {"finished", "failed", "stopped"}
+
+
+def default_epochs(script):
+	"""
+		:return: the --epochs default of a demo script, read from its source since importing it starts ns-3
+	"""
+	for path in [script, os.path.join(os.path.dirname(os.path.abspath(__file__)), script)]:
+		try:
+			with open(path) as f:
+				match = re.search(r"\"--epochs\", default=(\d+)", f.read())
+		except OSError:
+			continue
+		if match:
+			return int(match.group(1))
+	raise ValueError("no --epochs default found in {}".format(script))
+
+
+def extrapolate(rounds, values, horizon, mode):
+	"""
+		:param rounds: the rounds (from 1) evaluated on the full test set
+		:param values: the metric after each of them
+		:param horizon: the round to extrapolate to
+		:return: the predicted metric at horizon, fitting y = a + b*t^-c by least squares for each c of
+		         CURVE_EXPONENTS and keeping the best fit. The prediction is not worse than the best value seen
+		         so far, nor better than a perfect acc (1) or loss (0).
+	"""
+	y = np.asarray(values, dtype=np.float64)
+	best_seen = y.max() if mode == "max" else y.min()
+	if len(y) < 3:
+		return float(best_seen)
+	t = np.asarray(rounds, dtype=np.float64)
+
+	fit = None
+	for c in CURVE_EXPONENTS:
+		X = np.stack([np.ones_like(t), t**-c], axis=1)
+		coef = np.linalg.lstsq(X, y, rcond=None)[0]
+		sse = float(((X.dot(coef)-y)**2).sum())
+		if fit is None or sse < fit[0]:
+			fit = (sse, coef[0]+coef[1]*horizon**-c)
+
+	if mode == "max":
+		return float(min(max(fit[1], best_seen), 1.0))
+	return float(max(min(fit[1], best_seen), 0.0))
+
+
+class Halving:
+	def __init__(self, spec):
+		halving = spec.get("halving", {})
+		self.column = 4 if halving.get("metric", "acc") == "acc" else 3
+		self.mode = halving.get("mode", "max" if self.column == 4 else "min")
+		self.eta = halving.get("eta", 3)
+		self.min_rounds = halving.get("min_rounds", 3)
+		self.brackets = halving.get("brackets", 1)
+		self.default_epochs = default_epochs(spec["script"])
+		self.scores = {}   # (bracket, rung) -> scores of the runs that reached it
+		self.tails = {}    # job hash -> [FileTail, (round, value) pairs, generation of the pairs]
+
+	def horizon(self, job):
+		"""
+			:return: the rounds of a job, from its flags whether fixed, grid or random, else the demo default
+		"""
+		return int(job.flags.get("epochs", self.default_epochs))
+
+	def bracket(self, job):
+		return int(job.hash, 16) % self.brackets
+
+	def rungs(self, job):
+		rung, rungs = self.min_rounds*self.eta**self.bracket(job), []
+		while rung < self.horizon(job):
+			rungs.append(rung)
+			rung *= self.eta
+		return rungs
+
+	def restore(self, job):
+		for rung, score in job.state().get("rungs", {}).items():
+			self.scores.setdefault((self.bracket(job), int(rung)), []).append(score)
+
+	def progress(self, job):
+		"""
+			:return: (round, metric) of the rounds of a running job evaluated on the full test set, read incrementally.
+			         Rounds count from 1, the rounds evaluated on a subset only have no row.
+		"""
+		if job.hash not in self.tails:
+			paths = glob.glob(os.path.join(job.dir, "outputs-*", "tf*", "time-acc-loss.txt"))
+			if not paths:
+				return []
+			self.tails[job.hash] = [FileTail(paths[0]), [], 0]
+		tail = self.tails[job.hash]
+		lines = tail[0].read_lines()
+		if tail[0].generation != tail[2]:
+			tail[1], tail[2] = [], tail[0].generation
+		for line in lines:
+			numbers = NUMBER.findall(line)
+			if len(numbers) >= 5:
+				tail[1].append((int(numbers[0])+1, float(numbers[self.column])))
+		return tail[1]
+
+	def rounds_run(self, job):
+		progress = self.progress(job)
+		return progress[-1][0] if progress else 0
+
+	def promote(self, job, rung, score):
+		"""
+			Record the score of a job at a rung, :return: whether the job continues
+		"""
+		scores = self.scores.setdefault((self.bracket(job), rung), [])
+		scores.append(score)
+		rungs = job.state().get("rungs", {})
+		rungs[str(rung)] = score
+		job.write_state(rungs=rungs)
+		if len(scores) < self.eta:
+			return True
+		ranked = sorted(scores, reverse=(self.mode == "max"))
+		return score in ranked[:len(scores)//self.eta]
+
+	def check(self, job):
+		"""
+			:return: False if the job should be stopped now
+		"""
+		progress = self.progress(job)
+		decided = job.state().get("rungs", {})
+		for rung in self.rungs(job):
+			if not progress or progress[-1][0] < rung:
+				break
+			if str(rung) in decided:
+				continue
+			rounds, values = zip(*[(r, v) for r, v in progress if r <= rung])
+			if not self.promote(job, rung, extrapolate(rounds, values, self.horizon(job), self.mode)):
+				return False
+		return True
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("spec", type=str,
+	                        help="the yaml spec of the sweep, with a halving section.")
+	parser.add_argument("--cores", default=os.cpu_count(), type=int,
+	                        help="cores to fill, all of them by default.")
+	parser.add_argument("--memory", default=0, type=float,
+	                        help="memory to fill in GB, 0 does not limit it.")
+	parser.add_argument("--mpirun", default="mpirun", type=str,
+	                        help="the mpi launcher, e.g. \"mpirun --oversubscribe\".")
+	parser.add_argument("--interval", default=5.0, type=float,
+	                        help="seconds between two checks of the running jobs.")
+	args = parser.parse_args()
+
+	spec = load_spec(args.spec)
+	halving = Halving(spec)
+	jobs = make_jobs(spec)
+	for job in jobs:
+		halving.restore(job)
+	todo = [job for job in jobs if job.state().get("status") not in DONE]
+	print("{} configurations, {} to run, rungs {}".format(len(jobs), len(todo), \
+			sorted(set(r for job in jobs for r in halving.rungs(job)))))
+
+	scheduler = Scheduler(args.cores, args.memory, args.mpirun)
+	for job in todo:
+		scheduler.submit(job)
+
+	try:
+		while not scheduler.idle():
+			for job in scheduler.step():
+				print("{} {} after {} rounds".format(job.hash, job.state().get("status"), halving.rounds_run(job)))
+			for job in list(scheduler.running):
+				if not halving.check(job):
+					rounds = halving.rounds_run(job)
+					scheduler.stop(job, status="stopped")
+					print("{} stopped after {} rounds".format(job.hash, rounds))
+			time.sleep(args.interval)
+	except KeyboardInterrupt:
+		scheduler.stop_all()
+		print("interrupted, run the same command again to resume")
+
+	rounds = sum(halving.rounds_run(job) for job in jobs)
+	full = sum(halving.horizon(job) for job in jobs)
+	print("{} of {} rounds run ({:.1f}x less)".format(rounds, full, full/max(rounds, 1)))
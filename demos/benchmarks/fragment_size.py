@@ -0,0 +1,119 @@
+"""
+	Benchmark of the model fragment size.
+	One server and one client exchange a model of --num_params floats over a point-to-point link for
+	--rounds rounds, once per fragment size and once with adaptive fragmentation. For each run we report
+	the simulated time per round and the wall-clock time of the simulation.
+
+	python fragment_size.py --sizes 256,1024,4096,16384,65536 --error_rate 0.001
+"""
+import argparse
+import time
+
+import numpy as np
+import ns.core
+import ns.network
+import ns.internet
+import ns.point_to_point
+import ns.distributedml as dml
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--sizes", default="256,536,1024,4096,16384,65536", type=str,
+                        help="comma separated fragment sizes in bytes.")
+parser.add_argument("--num_params", default=100000, type=int,
+                        help="number of float parameters of the model.")
+parser.add_argument("--rounds", default=5, type=int,
+                        help="number of client-server rounds per run.")
+parser.add_argument("--error_rate", default=0, type=float,
+                        help="packet error rate of the link.")
+parser.add_argument("--data_rate", default="100Mbps", type=str,
+                        help="data rate of the link.")
+parser.add_argument("--delay", default="5ms", type=str,
+                        help="propagation delay of the link.")
+parser.add_argument("--no_adaptive", action='store_true',
+                        help="if added, skip the adaptive fragmentation run.")
+args = parser.parse_args()
+
+
+def long2int(addr):
+	return [addr%(2**32), addr//(2**32)]
+
+
+class BenchAgent(dml.DistributedMlTcpAgent):
+	"""
+		An agent without computation, the server records the simulated time of each round.
+	"""
+	def __init__(self, rounds=None, *args, **kwargs):
+		super(BenchAgent, self).__init__(*args, **kwargs)
+		self.rounds = rounds
+
+	def Processing(self):
+		if self.rounds is not None:
+			self.rounds.append(ns.core.Simulator.Now().GetSeconds())
+		return 0.0
+
+	def Sleeping(self):
+		return 0.0
+
+
+def run(fragment_size, adaptive=False):
+	nodes = ns.network.NodeContainer()
+	nodes.Create(2)
+
+	pointToPoint = ns.point_to_point.PointToPointHelper()
+	pointToPoint.SetDeviceAttribute("DataRate", ns.core.StringValue(args.data_rate))
+	pointToPoint.SetChannelAttribute("Delay", ns.core.StringValue(args.delay))
+	devices = pointToPoint.Install(nodes)
+	if args.error_rate>0:
+		em = ns.network.RateErrorModel ()
+		em.SetAttribute ("ErrorRate", ns.core.DoubleValue (args.error_rate))
+		em.SetAttribute ("ErrorUnit", ns.core.StringValue ("ERROR_UNIT_PACKET"))
+		devices.Get(1).SetAttribute ("ReceiveErrorModel", ns.core.PointerValue (em))
+
+	ns.internet.InternetStackHelper().Install(nodes)
+	address = ns.internet.Ipv4AddressHelper()
+	address.SetBase(ns.network.Ipv4Address("10.1.1.0"), ns.network.Ipv4Mask("255.255.255.0"))
+	interfaces = address.Assign(devices)
+
+	port = 9000
+	tcp = ns.core.TypeId.LookupByName("ns3::TcpSocketFactory")
+	models = [np.random.rand(args.num_params).astype(np.float32) for _ in range(2)]
+	rounds = []
+
+	server = BenchAgent(rounds, id=0)
+	server.SetAttributes(address=ns.network.InetSocketAddress(ns.network.Ipv4Address.GetAny(), port), \
+						socket=ns.network.Socket.CreateSocket(nodes.Get(0), tcp), \
+						num_packets=args.rounds, num_clients=1, packet_size=fragment_size)
+	server.SetRole("server")
+	server.EnableBroadcast()
+
+	client = BenchAgent(id=1)
+	client.SetAttributes(address=ns.network.InetSocketAddress(interfaces.GetAddress(0), port), \
+						socket=ns.network.Socket.CreateSocket(nodes.Get(1), tcp), \
+						num_packets=args.rounds, packet_size=fragment_size)
+	client.SetRole("client")
+
+	for app, node, model in zip([server, client], [nodes.Get(0), nodes.Get(1)], models):
+		app.SetAttribute("AdaptiveFragment", ns.core.BooleanValue(adaptive))
+		app.SetModel(long2int(model.ctypes.data), [model.size])
+		node.AddApplication(app)
+		app.SetStartTime(ns.core.Seconds(1.0))
+
+	t_now = time.time()
+	ns.core.Simulator.Run()
+	wall_clock = time.time()-t_now
+	ns.core.Simulator.Destroy()
+
+	sim_time = (rounds[-1]-rounds[0])/(len(rounds)-1) if len(rounds)>1 else float('nan')
+	return sim_time, wall_clock, len(rounds)
+
+
+if __name__ == "__main__":
+	runs = [(str(size), int(size), False) for size in args.sizes.split(',')]
+	if not args.no_adaptive:
+		runs.append(("adaptive", 1024, True))
+
+	print("{:>10} {:>16} {:>14} {:>8}".format("fragment", "sim s / round", "wall s", "rounds"))
+	for name, size, adaptive in runs:
+		sim_time, wall_clock, n = run(size, adaptive)
+		print("{:>10} {:>16.4f} {:>14.3f} {:>8}".format(name, sim_time, wall_clock, n))
@@ -0,0 +1,167 @@
+"""
+	Throughput benchmark of the ML workload of the demos, without ns-3.
+	The Processing of an agent is one AirTask.train() (clients) or evaluate() (server), and its wall time times
+	TIME_SHIFT becomes simulated computing time, so a slower train() also changes the simulated results.
+	For each --task, batch size, torch thread count and data pipeline, --clients client tasks share this
+	process as on one rank, and every round trains each of them once; the server task evaluates once per round.
+	We report samples/s of train() and evaluate(), and the simulated computing time per round of a client.
+	Pipelines:
+		default:  the DataLoader of the task
+		workers:  the same with --loader_workers worker processes
+		tensor:   the dataset materialized once as tensors, batches are slices
+
+	cd demos && python benchmarks/ml_throughput.py --task minist --batch_sizes 32,128 --threads 1,4 --clients 1,4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+DEMOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.extend([os.path.join(DEMOS, "model"), os.path.join(DEMOS, "network")])
+
+import torch
+from base import Mpi, TIME_SHIFT
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--task", default="minist", type=str,
+                        help="comma separated tasks, minist and/or traffic.")
+parser.add_argument("--batch_sizes", default="32,128", type=str,
+                        help="comma separated batch sizes.")
+parser.add_argument("--threads", default="1,4", type=str,
+                        help="comma separated torch thread counts.")
+parser.add_argument("--clients", default="1,4", type=str,
+                        help="comma separated numbers of client tasks in this process.")
+parser.add_argument("--pipelines", default="default,workers,tensor", type=str,
+                        help="comma separated data pipelines: default, workers, tensor.")
+parser.add_argument("--loader_workers", default=2, type=int,
+                        help="worker processes of the workers pipeline.")
+parser.add_argument("--global_size", default=16, type=int,
+                        help="number of clients the training set is partitioned for, as --nCells*--nActivePerCell.")
+parser.add_argument("--local_epochs", default=1, type=int,
+                        help="number of local epochs per train().")
+parser.add_argument("--rounds", default=3, type=int,
+                        help="timed rounds per configuration, after one warm-up round.")
+parser.add_argument("--output", default="ml_throughput.json", type=str,
+                        help="the JSON results.")
+parser.add_argument("--baseline", default=None, type=str,
+                        help="a previous output, configurations whose samples/s dropped by more than --tolerance fail.")
+parser.add_argument("--tolerance", default=0.1, type=float,
+                        help="allowed relative slowdown against --baseline.")
+args = parser.parse_args()
+
+
+def make_task(name, rank, **kwargs):
+	"""
+		Build an AirTask as rank `rank` would: clients (rank > 0) train on their partition, the server
+		(rank 0) evaluates on the test set and logs to a temporary dir.
+	"""
+	Mpi.rank, Mpi.world_size = rank, 2
+	if name == "minist":
+		from minist import AirTask
+	else:
+		from traffic import AirTask
+	return AirTask(global_size=args.global_size, log=tempfile.mkdtemp(prefix="tf_bench_"), **kwargs)
+
+
+def set_pipeline(loader, pipeline):
+	"""
+		:return: a loader over the same dataset and batches, built for `pipeline`
+	"""
+	if pipeline == "default":
+		return loader
+	if pipeline == "workers":
+		return torch.utils.data.DataLoader(loader.dataset, batch_size=loader.batch_size, drop_last=loader.drop_last, \
+					num_workers=args.loader_workers, persistent_workers=True)
+	if pipeline == "tensor":
+		samples = [loader.dataset[i] for i in range(len(loader.dataset))]
+		dataset = torch.utils.data.TensorDataset(torch.stack([s[0] for s in samples]), \
+					torch.stack([torch.as_tensor(s[1]) for s in samples]))
+		return torch.utils.data.DataLoader(dataset, batch_size=loader.batch_size, drop_last=loader.drop_last)
+	raise ValueError("unknown pipeline {}".format(pipeline))
+
+
+def samples(loader):
+	return len(loader)*loader.batch_size
+
+
+def run(name, batch_size, threads, clients, pipeline):
+	torch.set_num_threads(threads)
+
+	tasks = [make_task(name, 1, global_rank=i, batch_size=batch_size, local_epochs=args.local_epochs) for i in range(clients)]
+	server = make_task(name, 0, global_rank=-1, batch_size=batch_size)
+	for task in tasks:
+		task.train_loader = set_pipeline(task.train_loader, pipeline)
+	server.test_loader = set_pipeline(server.test_loader, pipeline)
+
+	train_s, eval_s = [], []
+	for r in range(args.rounds+1):
+		t_now = time.time()
+		for task in tasks:
+			task.train()
+		train_wall = time.time()-t_now
+
+		t_now = time.time()
+		server.evaluate()
+		eval_wall = time.time()-t_now
+
+		if r > 0:  # the first round warms up the loaders and the allocator
+			train_s.append(train_wall)
+			eval_s.append(eval_wall)
+
+	train_samples = sum(samples(task.train_loader) for task in tasks)*args.local_epochs
+	train_wall, eval_wall = min(train_s), min(eval_s)
+	return {"task": name, "batch_size": batch_size, "threads": threads, "clients": clients, "pipeline": pipeline, \
+			"train_samples_per_s": train_samples/train_wall, "eval_samples_per_s": samples(server.test_loader)/eval_wall, \
+			"train_wall_s": train_wall, "eval_wall_s": eval_wall, \
+			"sim_compute_s": TIME_SHIFT*train_wall/clients, "sim_eval_s": TIME_SHIFT*eval_wall}
+
+
+def key(r):
+	return (r["task"], r["batch_size"], r["threads"], r["clients"], r["pipeline"])
+
+
+def compare(records, baseline):
+	"""
+		:return: the configurations slower than in the baseline by more than --tolerance, in train or evaluate
+	"""
+	previous = {key(r): r for r in baseline.get("runs", [])}
+	slower = []
+	for r in records:
+		old = previous.get(key(r))
+		if old is None:
+			continue
+		for metric in ["train_samples_per_s", "eval_samples_per_s"]:
+			if r[metric] < old[metric]*(1-args.tolerance):
+				slower.append((r, old, metric))
+	return slower
+
+
+if __name__ == "__main__":
+	records = []
+	header = "{:>8} {:>6} {:>8} {:>8} {:>9} {:>14} {:>14} {:>16}"
+	line = "{:>8} {:>6} {:>8} {:>8} {:>9} {:>14.1f} {:>14.1f} {:>16.3f}"
+	print(header.format("task", "batch", "threads", "clients", "pipeline", "train smp/s", "eval smp/s", "sim s / client"))
+	for name in args.task.split(','):
+		for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+			for threads in [int(t) for t in args.threads.split(',')]:
+				for clients in [int(c) for c in args.clients.split(',')]:
+					for pipeline in args.pipelines.split(','):
+						r = run(name, batch_size, threads, clients, pipeline)
+						records.append(r)
+						print(line.format(name, batch_size, threads, clients, pipeline, r["train_samples_per_s"], \
+										r["eval_samples_per_s"], r["sim_compute_s"]))
+
+	with open(args.output, "w") as f:
+		json.dump({"time_shift": TIME_SHIFT, "global_size": args.global_size, "local_epochs": args.local_epochs, \
+					"torch": torch.__version__, "created": time.time(), "runs": records}, f, indent=1)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			slower = compare(records, json.load(f))
+		for r, old, metric in slower:
+			print("regression: {} {:.1f} against {:.1f} for {}".format(metric, r[metric], old[metric], key(r)))
+		sys.exit(1 if slower else 0)
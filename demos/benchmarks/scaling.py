@@ -0,0 +1,180 @@
+"""
+	Strong and weak scaling benchmark of the MPI demos.
+	Strong scaling runs --nCells cells on a growing number of worker ranks, weak scaling keeps
+	--cells_per_rank cells on every worker rank. Each run is launched with mpirun (one more rank for the
+	server) and --profile, then summarized from its time-acc-loss.txt and profile-rank<rank>.json:
+		wall_round_s:   median wall-clock seconds per round, the first round (setup) excluded
+		sim_round_s:    mean simulated seconds per round
+		events_per_s:   events of all the ranks over the wall time of the slowest rank
+		peak_rss_kb:    peak RSS of the largest rank, and peak_rss_kb_total of all the ranks
+	Speedup and efficiency are relative to the smallest worker count of each mode. The results are written to
+	--output as JSON, and compared to a previous output with --baseline.
+
+	python scaling.py --script idea_wifi_traffic.py --workers 1,2,4,8 --nCells 16 --cells_per_rank 2 --epochs 3
+"""
+import argparse
+import glob
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analyzers"))
+from utils import load_results
+
+
+DEMOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--script", default="idea_wifi_traffic.py", type=str,
+                        help="the demo to benchmark, relative to demos/.")
+parser.add_argument("--mode", default="both", choices=["strong", "weak", "both"],
+                        help="strong, weak or both.")
+parser.add_argument("--workers", default="1,2,4,8", type=str,
+                        help="comma separated numbers of worker ranks, the server rank comes on top.")
+parser.add_argument("--nCells", default=16, type=int,
+                        help="number of cells of the strong scaling runs.")
+parser.add_argument("--cells_per_rank", default=2, type=int,
+                        help="number of cells per worker rank of the weak scaling runs.")
+parser.add_argument("--epochs", default=3, type=int,
+                        help="number of rounds per run.")
+parser.add_argument("--mpirun", default="mpirun", type=str,
+                        help="the mpi launcher, e.g. \"mpirun --oversubscribe\".")
+parser.add_argument("--script_args", default="", type=str,
+                        help="extra arguments of the demo, e.g. \"--nWifiPerCell 8\".")
+parser.add_argument("--saved_dir", default="saved_scaling", type=str,
+                        help="saved dir of the runs, one sub dir per mode.")
+parser.add_argument("--timeout", default=None, type=float,
+                        help="seconds after which a run is killed.")
+parser.add_argument("--output", default="scaling.json", type=str,
+                        help="the JSON results.")
+parser.add_argument("--baseline", default=None, type=str,
+                        help="a previous output, runs whose wall_round_s grew by more than --tolerance fail.")
+parser.add_argument("--tolerance", default=0.1, type=float,
+                        help="allowed relative slowdown against --baseline.")
+args = parser.parse_args()
+
+
+def summarize(saved_dir, workers):
+	"""
+		:return: the metrics of the run of `workers` worker ranks under saved_dir, from its manifest
+	"""
+	manifests = glob.glob(os.path.join(saved_dir, "outputs-%d"%workers, "*", "run.json"))
+	if not manifests:
+		return {"error": "no run.json under {}".format(saved_dir)}
+	# the latest run, earlier ones may remain with other --script_args
+	manifest_path = max(manifests, key=os.path.getmtime)
+	trace_dir = os.path.dirname(manifest_path)
+	with open(manifest_path) as f:
+		manifest = json.load(f)
+
+	summary = {}
+	results = load_results(os.path.join(trace_dir, manifest["artifacts"]["tf"], "time-acc-loss.txt"))
+	if len(results["time"]) > 1:
+		summary["sim_round_s"] = float(np.diff(results["time"]).mean())
+	if len(results["wall_clock"]) > 2:
+		summary["wall_round_s"] = float(np.median(np.diff(results["wall_clock"])[1:]))
+	elif len(results["wall_clock"]) == 2:
+		summary["wall_round_s"] = float(np.diff(results["wall_clock"])[0])
+	summary["rounds"] = len(results["time"])
+
+	profiles = []
+	for path in glob.glob(os.path.join(trace_dir, "profile-rank*.json")):
+		with open(path) as f:
+			profiles.append(json.load(f))
+	if profiles:
+		wall = max(p["wall_s"] for p in profiles)
+		summary["wall_s"] = wall
+		summary["events"] = sum(p["events"] for p in profiles)
+		summary["events_per_s"] = summary["events"] / wall if wall > 0 else 0.0
+		summary["peak_rss_kb"] = max(p.get("peak_rss_kb", 0) for p in profiles)
+		summary["peak_rss_kb_total"] = sum(p.get("peak_rss_kb", 0) for p in profiles)
+	return summary
+
+
+def run(mode, workers, nCells):
+	saved_dir = os.path.join(args.saved_dir, mode)
+	cmd = shlex.split(args.mpirun) + ["-np", str(workers+1), sys.executable, args.script, "--mpi", "--profile", \
+					"--nCells", str(nCells), "--epochs", str(args.epochs), "--saved_dir", saved_dir] + shlex.split(args.script_args)
+	print(" ".join(cmd))
+
+	t_now = time.time()
+	try:
+		returncode = subprocess.run(cmd, cwd=DEMOS, stdout=subprocess.DEVNULL, timeout=args.timeout).returncode
+	except subprocess.TimeoutExpired:
+		returncode = None
+	record = {"mode": mode, "workers": workers, "ranks": workers+1, "nCells": nCells, "launch_s": time.time()-t_now, \
+				"returncode": returncode}
+	if returncode != 0:
+		record["error"] = "timeout" if returncode is None else "exit code {}".format(returncode)
+		return record
+	record.update(summarize(os.path.join(DEMOS, saved_dir), workers))
+	return record
+
+
+def add_speedup(records, mode):
+	"""
+		Strong: speedup = T(w0)/T(w), efficiency = speedup*w0/w. Weak: efficiency = T(w0)/T(w), speedup = efficiency*w/w0.
+		T is wall_round_s and w0 the smallest worker count with a result.
+	"""
+	done = [r for r in records if "wall_round_s" in r]
+	if not done:
+		return
+	base = min(done, key=lambda r: r["workers"])
+	for r in done:
+		ratio = base["wall_round_s"] / r["wall_round_s"]
+		scale = r["workers"] / base["workers"]
+		if mode == "strong":
+			r["speedup"], r["efficiency"] = ratio, ratio / scale
+		else:
+			r["speedup"], r["efficiency"] = ratio * scale, ratio
+
+
+def compare(records, baseline):
+	"""
+		:return: the runs slower than their baseline run (same mode, workers and nCells) by more than --tolerance
+	"""
+	previous = {(r["mode"], r["workers"], r["nCells"]): r for r in baseline.get("runs", []) if "wall_round_s" in r}
+	slower = []
+	for r in records:
+		old = previous.get((r["mode"], r["workers"], r["nCells"]))
+		if old is not None and "wall_round_s" in r and r["wall_round_s"] > old["wall_round_s"] * (1 + args.tolerance):
+			slower.append((r, old))
+	return slower
+
+
+if __name__ == "__main__":
+	workers = [int(w) for w in args.workers.split(',')]
+	modes = ["strong", "weak"] if args.mode == "both" else [args.mode]
+
+	records = []
+	for mode in modes:
+		runs = [run(mode, w, args.nCells if mode == "strong" else args.cells_per_rank*w) for w in workers]
+		add_speedup(runs, mode)
+		records.extend(runs)
+
+	header = "{:>6} {:>7} {:>6} {:>12} {:>12} {:>12} {:>12} {:>8} {:>10}"
+	line = "{:>6} {:>7} {:>6} {:>12.3f} {:>12.3f} {:>12.0f} {:>12.0f} {:>8.2f} {:>9.1f}%"
+	print(header.format("mode", "workers", "cells", "wall s/round", "sim s/round", "events/s", "peak RSS kB", "speedup", "efficiency"))
+	for r in records:
+		if "wall_round_s" not in r:
+			print("{:>6} {:>7} {:>6}   {}".format(r["mode"], r["workers"], r["nCells"], r.get("error", "no round")))
+			continue
+		print(line.format(r["mode"], r["workers"], r["nCells"], r["wall_round_s"], r.get("sim_round_s", float('nan')), \
+						r.get("events_per_s", float('nan')), r.get("peak_rss_kb", float('nan')), r["speedup"], 100*r["efficiency"]))
+
+	with open(args.output, "w") as f:
+		json.dump({"script": args.script, "epochs": args.epochs, "script_args": args.script_args, "created": time.time(), \
+					"runs": records}, f, indent=1)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			slower = compare(records, json.load(f))
+		for r, old in slower:
+			print("regression: {} {} workers {} cells, {:.3f} s/round against {:.3f}".format(r["mode"], r["workers"], \
+					r["nCells"], r["wall_round_s"], old["wall_round_s"]))
+		sys.exit(1 if slower else 0)
@@ -1,5 +1,7 @@
 import ns.distributedml as dml
 import ns.network
+import ns.core
+import ns.energy
 import sys
 import random
 import time
@@ -19,14 +21,6 @@ class PyDistributedMlTcpClient(dml.DistributedMlTcpAgent):
 		self.SetId(self.id)
 
 
-	def TriggerLogic(self):
-		# print("PYTHON:: Client: {}, self.m_TV.get('count'): {}, at epoch: {}, curret time: {}, wall-clock: {}".format(self.id, self.m_TV.get("count"), self.task.global_step, dml.PyTimer.now("s"), self.task.wall_clock))
-		if self.task.global_step == 60:
-			sys.exit(0)
-
-		return True
-		
-
 	@time_shift
 	def Processing(self):
 		# print("PYTHON:: calling processing: self.id: ", self.id)
@@ -39,14 +33,16 @@ class PyDistributedMlTcpClient(dml.DistributedMlTcpAgent):
 
 
 class ClientHelperSon(dml.DistributedMlTcpAgentHelper, _Iter):
-	def __init__(self, address, tasks, num_packets=5, num_clients=3, packet_size=1024, energy_models=None):
+	def __init__(self, address, tasks, num_packets=5, num_clients=3, packet_size=1024, energy_models=None, aircomp=None, adaptive_fragment=False):
 		
 		self.address = address
 		self.num_packets = num_packets
 		self.num_clients = num_clients
 		self.packet_size = packet_size
+		self.adaptive_fragment = adaptive_fragment
 		self.energy_models = energy_models
 		self.tasks = tasks
+		self.aircomp = aircomp
 		self.apps = ns.network.ApplicationContainer()
 
 		self._iter_index = 0
@@ -54,29 +50,70 @@ class ClientHelperSon(dml.DistributedMlTcpAgentHelper, _Iter):
 		super(ClientHelperSon, self).__init__()
 		_Iter.__init__(self, self.apps)
 
+		# every received global model starts a local round
+		self.SetAttribute("TriggerPolicy", ns.core.StringValue("every"))
+		self.SetAttribute("AdaptiveFragment", ns.core.BooleanValue(self.adaptive_fragment))
+
 	def Install(self, nodes):
-		if self.energy_models is None:
-			self.energy_models = [None]*len(self.tasks)
-		
-		for i, (task, model) in enumerate(zip(self.tasks, self.energy_models)):
-			app = self.InstallPriv(nodes.Get(i), task, model)
+		"""
+			Only the Python agents are built here, sockets, attributes, energy models and models
+			are set for the whole container by the C++ helper.
+		"""
+		self.agents = [PyDistributedMlTcpClient(task, num_clients=self.num_clients) for task in self.tasks]
+		for app in self.agents:
 			self.apps.Add(app)
-		
+
+		energy_models = self.energy_models
+		if energy_models is None:
+			energy_models = ns.energy.DeviceEnergyModelContainer()
+		elif isinstance(energy_models, list):
+			energy_models = ns.energy.DeviceEnergyModelContainer()
+			for model in self.energy_models:
+				energy_models.Add(model)
+
+		self.SetupAgents(self.apps, nodes, self.address, "client", packet_size=self.packet_size, \
+							num_packets=self.num_packets, num_clients=self.num_clients, energy=energy_models)
+
+		data_addrs, sizes = [], []
+		for task in self.tasks:
+			data_addr, size = task.addrs()
+			data_addrs.extend(data_addr)
+			sizes.extend(size)
+		self.SetModels(self.apps, data_addrs, sizes)
+
+		if self.aircomp is not None:
+			self.SetAirComp(self.apps, self.aircomp)
+
 		return self.apps
 
 
-	def InstallPriv(self, node, task, energy_model=None):
-		socket = self.CreateSocket (node)
+"""
+	Build the over-the-air aggregator of one cell
+"""
+class AirCompHelperSon(dml.DistributedMlTcpAgentHelper):
+	def __init__(self, address, num_transmitters=1, packet_size=1024, fading="none", noise_type="add", noise_ratio=0, symbol_rate=1e6):
+		self.address = address
+		self.num_transmitters = num_transmitters
+		self.packet_size = packet_size
+		self.fading = fading
+		self.noise_type = noise_type
+		self.noise_ratio = noise_ratio
+		self.symbol_rate = symbol_rate
 
-		app = PyDistributedMlTcpClient(task, num_clients=self.num_clients)
-		app.SetAttributes(address=self.address, socket=socket, num_packets=self.num_packets, packet_size=self.packet_size)
-		app.SetRole("client")
+		super(AirCompHelperSon, self).__init__()
 
-		if energy_model is not None:
-			app.SetEnergy(energy_model)
+	def Install(self, node):
+		"""
+			Install the aggregator on the AP node, the clients of the cell get it through ClientHelperSon(aircomp=...)
+		"""
+		socket = self.CreateSocket (node)
 
-		data_addr, sizes = task.addrs()
-		app.SetModel(data_addr, sizes)
+		app = dml.AirCompAggregator()
+		app.SetAttributes(address=self.address, socket=socket, packet_size=self.packet_size, num_transmitters=self.num_transmitters)
+		app.SetAttribute("Fading", ns.core.StringValue(self.fading))
+		app.SetAttribute("NoiseType", ns.core.StringValue(self.noise_type))
+		app.SetAttribute("NoiseRatio", ns.core.DoubleValue(self.noise_ratio))
+		app.SetAttribute("SymbolRate", ns.core.DoubleValue(self.symbol_rate))
 
 		node.AddApplication (app)
 		return app
@@ -94,52 +131,48 @@ class PyDistributedMlTcpServer(dml.DistributedMlTcpAgent):
 		self.id = 0
 		self.SetId(self.id)
 
-	def TriggerLogic(self):
-		# print("PYTHON:: Server: {}, self.m_TV.get('count'): {}, at epoch: {}, curret time: {}, wall-clock: {}".format(self.id, self.m_TV.get("count"), self.task.global_step, dml.PyTimer.now("s"), self.task.wall_clock))
-		
-		if self.task.global_step == 60:
-			sys.exit(0)
-
-		if (self.m_TV.get("count") == self.num_clients):
-			# print("PYTHON:: Server: {} TriggerLogic at epoch: {}, curret time: {}, wall-clock: {}".format(self.id, self.task.global_step, dml.PyTimer.now("s"), self.task.wall_clock))
-			return True
-		else:
-			return False
-
 	@time_shift
 	def Processing(self):	
 		# print("PYTHON:: Before Server Processing...\t curret time: {}".format(dml.PyTimer.now("s")))
-		self.task.evaluate()
+		self.task.evaluate_async()
 
 	def Sleeping(self):
 		return self.task.sleeping_time
 
 
 class ServerHelperSon(dml.DistributedMlTcpAgentHelper):
-	def __init__(self, address, task, num_packets=5, num_clients=3, packet_size=1024):
+	def __init__(self, address, task, num_packets=5, num_clients=3, packet_size=1024, adaptive_fragment=False, trigger_policy="count", deadline=0):
 		self.address = address
 		self.num_packets = num_packets
 		self.num_clients = num_clients
 		self.packet_size = packet_size
+		self.adaptive_fragment = adaptive_fragment
+		self.trigger_policy = trigger_policy
+		self.deadline = deadline
 
 		self.apps = ns.network.ApplicationContainer()
 		self.task = task
 
 		super(ServerHelperSon, self).__init__("server")
 
+		# by default, aggregate once the models of all num_clients clients arrived
+		self.SetAttribute("TriggerPolicy", ns.core.StringValue(self.trigger_policy))
+		self.SetAttribute("Deadline", ns.core.TimeValue(ns.core.Seconds(self.deadline)))
+		self.SetAttribute("AdaptiveFragment", ns.core.BooleanValue(self.adaptive_fragment))
 
-	def InstallPriv(self, node):      
-		serverSocket = self.CreateSocket (node)
-		app = PyDistributedMlTcpServer(self.task, num_clients=self.num_clients, id=0)
-		app.SetAttributes(address=self.address, socket=serverSocket, num_packets=self.num_packets, num_clients=self.num_clients, packet_size=self.packet_size)
-		app.SetRole("server")
+	def Install(self, nodes):
+		"""
+			One server per node sharing the task, set up by the C++ helper like the clients
+		"""
+		self.agents = [PyDistributedMlTcpServer(self.task, num_clients=self.num_clients, id=0) for _ in range(nodes.GetN())]
+		for app in self.agents:
+			self.apps.Add(app)
 
-		app.EnableBroadcast()
+		self.SetupAgents(self.apps, nodes, self.address, "server", packet_size=self.packet_size, \
+							num_packets=self.num_packets, num_clients=self.num_clients)
+		for app in self.agents:
+			app.EnableBroadcast()
 
 		data_addr, sizes = self.task.addrs()
-		app.SetModel(data_addr, sizes)
-
-		# app.SetTrigger(True)
-		node.AddApplication (app)
-		return app
-
+		self.SetModels(self.apps, list(data_addr)*len(self.agents), list(sizes)*len(self.agents))
+		return self.apps
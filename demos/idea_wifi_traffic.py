@@ -7,10 +7,11 @@
 import sys
 import os
 import argparse
+import time
 import ns.distributedml as dml
 import ns.network
 from traffic import AirTask
-from helper import ClientHelperSon, ServerHelperSon
+from helper import ClientHelperSon, ServerHelperSon, AirCompHelperSon
 from wifi import WifiCell
 from wifi import P2PChannel
 from wifi import Network
@@ -22,7 +23,7 @@ import ns.internet
 import ns.mobility
 import ns.point_to_point
 
-from base import Tracer, Mpi
+from base import Tracer, Mpi, write_manifest, ConvergenceMonitor
 
 import torchvision
 import torch
@@ -51,6 +52,54 @@ parser.add_argument("--noise_ratio", default=0, type=float,
                         help="noise ratio, default is 0.")
 parser.add_argument("--noise_type", default="add", type=str,
                         help="noise type, default is add-noise.")
+parser.add_argument("--aircomp", action='store_true',
+                        help="if added, clients upload through an over-the-air aggregator in each cell.")
+parser.add_argument("--fading", default="none", type=str,
+                        help="fading model of the over-the-air uplink, none or rayleigh.")
+parser.add_argument("--adaptive_fragment", action='store_true',
+                        help="if added, fragment sizes adapt per connection to the MSS and losses, --packet_size is ignored.")
+parser.add_argument("--trigger_policy", default="count", type=str,
+                        help="when the server aggregates: count (all clients), fraction, deadline or every.")
+parser.add_argument("--deadline", default=0, type=float,
+                        help="with --trigger_policy deadline, seconds after the global model of a round is sent, required.")
+parser.add_argument("--binary_trace", action='store_true',
+                        help="if added, write the energy and mobility traces of each rank to one binary shard, see analyzers/merge_traces.py.")
+parser.add_argument("--trace_period", default=1.0, type=float,
+                        help="keep at most one trace event per period seconds and per node, 0 keeps all.")
+parser.add_argument("--trace_window", default=0, type=float,
+                        help="if positive, write the energy and cwnd as min/max/mean/last per window of this many seconds instead of events.")
+parser.add_argument("--trace_per_cell", action='store_true',
+                        help="with --trace_window, aggregate each cell instead of each node.")
+parser.add_argument("--trace_ring", default=0, type=int,
+                        help="if positive, also keep the latest records of each trace metric of a rank in memory, read by --energy_budget.")
+parser.add_argument("--ring_only", action='store_true',
+                        help="with --trace_ring, write no energy and mobility text traces.")
+parser.add_argument("--timeline", action='store_true',
+                        help="if added, write the agent timeline of each rank as a chrome trace (timeline-rank<rank>.json).")
+parser.add_argument("--profile", action='store_true',
+                        help="if added, report where the wall time of each rank goes (profile-rank<rank>.json).")
+parser.add_argument("--flow_stats", action='store_true',
+                        help="if added, write the per-round transport statistics of the agents of each rank (flows<id>.txt).")
+parser.add_argument("--target_mse", default=0, type=float,
+                        help="stop once the test mse falls to this value, 0 disables it.")
+parser.add_argument("--plateau", default=0, type=int,
+                        help="stop after this many evaluations without the test loss improving by --min_delta, 0 disables it.")
+parser.add_argument("--min_delta", default=1e-4, type=float,
+                        help="with --plateau, the smallest loss decrease counted as an improvement.")
+parser.add_argument("--energy_budget", default=0, type=float,
+                        help="stop once the devices of all cells consumed this many J, 0 disables it.")
+parser.add_argument("--wall_budget", default=0, type=float,
+                        help="stop after this many wall-clock seconds, 0 disables it.")
+parser.add_argument("--monitor_period", default=1.0, type=float,
+                        help="simulated seconds between two energy and wall-clock checks of the stop conditions.")
+parser.add_argument("--sync_eval", action='store_true',
+                        help="if added, the server evaluates each round before broadcasting, instead of in a background thread.")
+parser.add_argument("--eval_fraction", default=1.0, type=float,
+                        help="fraction of the test set evaluated in most rounds, stratified by class for minist.")
+parser.add_argument("--eval_full_every", default=5, type=int,
+                        help="with --eval_fraction below 1, evaluate the full test set every this many rounds.")
+parser.add_argument("--eval_batch_size", default=1024, type=int,
+                        help="batch size of the background evaluation.")
 parser.add_argument("--verbose", action='store_true',
                         help="if added, enable log.")
 parser.add_argument("--mpi", action='store_true',
@@ -66,6 +115,8 @@ parser.add_argument("--part_ratio", default='1,1,1,1', type=str,
 
 
 args = parser.parse_args()
+if args.trigger_policy == "deadline" and args.deadline <= 0:
+	parser.error("--trigger_policy deadline needs a positive --deadline")
 
 
 # // Default Network Topology
@@ -84,6 +135,7 @@ if __name__ == "__main__":
 	if args.verbose:
 		ns.core.LogComponentEnable("DistributedMlTcpAgentApplication", ns.core.LOG_LEVEL_INFO)
 		ns.core.LogComponentEnable("DistributedMlUtils", ns.core.LOG_LEVEL_INFO)
+		ns.core.LogComponentEnable("DistributedMlAirComp", ns.core.LOG_LEVEL_INFO)
 
 	# print("sys.argv: ", sys.argv)  ## This command is necessary!! WTF
 	Mpi.enable(sys.argv)
@@ -116,22 +168,59 @@ if __name__ == "__main__":
 					"-noise_type-"+args.noise_type+ \
 					"-noise_ratio-"+str(args.noise_ratio)+ \
 					"-part_ratio-"+args.part_ratio
+	if args.aircomp:
+		record_prefix += "-aircomp-"+args.fading
+	if args.adaptive_fragment:
+		record_prefix += "-adaptive_fragment"
+	if args.trigger_policy != "count":
+		record_prefix += "-trigger-"+args.trigger_policy
+
+	manifest_path = os.path.join(args.saved_dir, "trace"+record_prefix, "run.json")
+	if systemId==systemServer:
+		write_manifest(manifest_path, script=os.path.basename(__file__), params=vars(args), record_prefix=record_prefix, \
+						system_count=systemCount, artifacts={"tf": os.path.join("..", "tf"+record_prefix), "trace": "."}, \
+						status="running", started=time.time(), finished=None)
+
+	# ends the run before --epochs rounds once a stop condition holds, see base.ConvergenceMonitor
+	monitor = None
+	if args.target_mse > 0 or args.plateau > 0 or args.energy_budget > 0 or args.wall_budget > 0:
+		monitor = ConvergenceMonitor(manifest_path, rank=systemId, target=args.target_mse or None, metric="mse", mode="min", \
+						plateau=args.plateau, min_delta=args.min_delta, energy_budget=args.energy_budget, \
+						wall_budget=args.wall_budget, period=args.monitor_period)
+
+	if args.timeline:
+		os.makedirs(os.path.join(args.saved_dir, "trace"+record_prefix), exist_ok=True)
+		dml.TimelineRecorder.Enable(os.path.join(args.saved_dir, "trace"+record_prefix, "timeline-rank%d.json"%systemId))
+	if args.profile:
+		os.makedirs(os.path.join(args.saved_dir, "trace"+record_prefix), exist_ok=True)
+		dml.HostProfiler.Enable(os.path.join(args.saved_dir, "trace"+record_prefix, "profile-rank%d.json"%systemId), 1.0)
 	
 	nTotalAgents = sum([len(wifi_cell) for wifi_cell in wifi_cells])		
 	nActiveAgents = args.nActivePerCell*len(wifi_cells)
 	active_ratio = args.nActivePerCell/args.nWifiPerCell
 
+	# With AirComp, each cell forwards one superposed model and the channel applies the noise
+	nServerClients = len(wifi_cells) if args.aircomp else nActiveAgents
+
 	if(systemId==systemServer):
 		print("nActiveAgents: ", nActiveAgents, "nTotalAgents: ", nTotalAgents)
 		print("systemWifi: ", systemWifi)
 
 		server_task = AirTask(global_rank=-1, global_size=nTotalAgents, log=os.path.join(args.saved_dir, "tf"+record_prefix))
 
-		serverHelper = ServerHelperSon(ns.network.InetSocketAddress (ns.network.Ipv4Address.GetAny (), sinkPort), server_task, num_packets=args.epochs, num_clients=nActiveAgents, packet_size=args.packet_size)
+		server_task.monitor = monitor
+		if not args.sync_eval:
+			server_task.enable_async_eval(fraction=args.eval_fraction, full_every=args.eval_full_every, batch_size=args.eval_batch_size)
+
+		serverHelper = ServerHelperSon(ns.network.InetSocketAddress (ns.network.Ipv4Address.GetAny (), sinkPort), server_task, num_packets=args.epochs, num_clients=nServerClients, packet_size=args.packet_size, adaptive_fragment=args.adaptive_fragment, \
+									trigger_policy=args.trigger_policy, deadline=args.deadline)
 
 		App = serverHelper.Install(server_agent.nodes)
 		App.Start(ns.core.Seconds(1.0))
 		App.Stop(ns.core.Seconds(end_time))
+		os.makedirs(os.path.join(args.saved_dir, "trace"+record_prefix), exist_ok=True)
+		if args.flow_stats:
+			serverHelper.EnableFlowStats(App, os.path.join(args.saved_dir, "trace"+record_prefix, "flows0.txt"))
 
 
 	global_rank = (systemId-1)*args.nActivePerCell
@@ -144,36 +233,69 @@ if __name__ == "__main__":
 				"batch_size": args.batch_size,\
 				"active_ratio": active_ratio,\
 				"sleeping_time": args.sleeping_time,\
-				"noise_ratio": args.noise_ratio, \
+				"noise_ratio": 0 if args.aircomp else args.noise_ratio, \
 				"noise_type": args.noise_type, \
 				"part_ratio": [int(_) for _ in args.part_ratio.split(',')]
 			}
 
+			aircomp = None
+			if args.aircomp:
+				aircompHelper = AirCompHelperSon(sinkAddress, num_transmitters=args.nActivePerCell, packet_size=args.packet_size, \
+								fading=args.fading, noise_type=args.noise_type, noise_ratio=args.noise_ratio)
+				aircomp = aircompHelper.Install(wifi_cell.ap.node)
+				aircomp.SetStartTime(ns.core.Seconds(1.0))
+				aircomp.SetStopTime(ns.core.Seconds(end_time))
+
 			client_task = [AirTask(global_rank=global_rank+i, global_size=nTotalAgents, **kwargs) for i in range(len(wifi_cell))]
 			
-			clientHelper = ClientHelperSon(sinkAddress, client_task, num_packets=args.epochs, num_clients=nActiveAgents, packet_size=args.packet_size, energy_models=wifi_cell.staMlEnergyModels)
+			clientHelper = ClientHelperSon(sinkAddress, client_task, num_packets=args.epochs, num_clients=nActiveAgents, packet_size=args.packet_size, energy_models=wifi_cell.sta.mlEnergyModels, aircomp=aircomp, adaptive_fragment=args.adaptive_fragment)
 			App = clientHelper.Install(wifi_cell.sta.nodes)
 			App.Start(ns.core.Seconds(1.0))
 			App.Stop(ns.core.Seconds(end_time))
 
-			for i, node in enumerate(wifi_cell.sta):
-				tracer = Tracer(prefix=os.path.join(args.saved_dir, "trace"+record_prefix))
-
-				tracer.trace_ml_energy_consumation(wifi_cell.staMlEnergyModels[i], "ml_energy%s.txt"%(global_rank+i+1))
-				tracer.trace_wifi_energy_consumation(wifi_cell.staWifiEnergyModels[i], "energy%s.txt"%(global_rank+i+1))
-				
-				tracer.trace_mobility(node, "mobility%s.txt"%(global_rank+i+1))
-				# tracer.trace_cwnd(clientHelper[i].GetSocket(), "cwnd%s.txt"%(global_rank+i+1))
-				# tracer.trace_drop(wifi_cell.staDevices.Get(i), "drop%s.pcap"%(global_rank+i+1))
+			tracer = Tracer(prefix=os.path.join(args.saved_dir, "trace"+record_prefix))
+			if args.flow_stats:
+				clientHelper.EnableFlowStats(App, os.path.join(tracer.prefix, "flows%s.txt"%(global_rank+1)))
+			for trace in ["energy", "mobility", "cwnd"]:
+				tracer.set_sampling(trace, args.trace_period)
+			if args.trace_window > 0:
+				tracer.trace_cell_window(wifi_cell, args.trace_window, first_id=global_rank+1, per_cell=args.trace_per_cell, apps=App)
+			else:
+				if args.binary_trace:
+					tracer.enable_binary("trace-rank%d.bin"%systemId)
+				if args.trace_ring > 0:
+					tracer.enable_ring(args.trace_ring, keep_files=not args.ring_only)
+				tracer.trace_cell(wifi_cell, first_id=global_rank+1)
+
+			if monitor is not None:
+				# the energy budget reads the rings of the tracers if they have some, the energy models otherwise
+				if args.trace_ring > 0 and args.trace_window == 0:
+					monitor.tracers.append(tracer)
+				else:
+					monitor.energy_models.extend([wifi_cell.sta.mlEnergyModels, wifi_cell.sta.wifiEnergyModels])
+			# for i in range(len(wifi_cell)):
+			# 	tracer.trace_cwnd(clientHelper[i].GetSocket(), "cwnd%s.txt"%(global_rank+i+1))
+			# 	tracer.trace_drop(wifi_cell.staDevices.Get(i), "drop%s.pcap"%(global_rank+i+1))
 
 			global_rank += args.nActivePerCell
 			
 
 	
 	ns.core.Simulator.Stop(ns.core.Seconds(end_time))
+	if monitor is not None:
+		monitor.start()
 	ns.core.Simulator.Run()
+	if systemId==systemServer:
+		# the run is over, the evaluations still pending are logged but can no longer stop it
+		server_task.monitor = None
+		server_task.poll_evaluations(wait=True)
+	sim_time = ns.core.Simulator.Now().GetSeconds()
 	ns.core.Simulator.Destroy()
 
+	if systemId==systemServer:
+		server_task.tb_writer.close()
+		write_manifest(manifest_path, status="finished", finished=time.time(), sim_time=sim_time)
+
 	if args.mpi and systemId==systemServer:
 		print("Disable mpi at final step, current time: ", dml.PyTimer.now("s"))
 		Mpi.disable()
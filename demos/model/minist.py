@@ -16,7 +16,7 @@ import os
 from tensorboardX import SummaryWriter
 import shutil
 
-import ns.distributedml as dml
+from base import sim_now
 import time
 
 from model import TaskBase
@@ -103,7 +103,8 @@ class AirTask(TaskBase):
 
 		self.train_loader = torch.utils.data.DataLoader(train_dataset, **train_kwargs)
 
-		self.test_loader = torch.utils.data.DataLoader(test_dataset, **train_kwargs)
+		# the whole test set is scored, as by the evaluation loaders of enable_async_eval
+		self.test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=self.batch_size)
 
 
 		self.optimizer = optim.Adadelta(self.model.parameters(), lr=1*self.active_ratio)
@@ -143,42 +144,33 @@ class AirTask(TaskBase):
 		self.global_step += 1		
 			
 
-	def evaluate(self):
-		self.model.eval()
+	def labels(self, dataset):
+		return [int(dataset.dataset.targets[i]) for i in dataset.indices]
+
+	def test_metrics(self, model, loader):
 		test_loss = 0
 		correct = 0
-		with torch.no_grad():
-			for batch_idx, (data, target) in enumerate(self.test_loader):
-				output = self.model(data)
-				test_loss += F.nll_loss(output, target, reduction='sum').item()  # sum up batch loss
-				pred = output.argmax(dim=1, keepdim=True)  # get the index of the max log-probability
-				correct += pred.eq(target.view_as(pred)).sum().item()
+		for batch_idx, (data, target) in enumerate(loader):
+			output = model(data)
+			test_loss += F.nll_loss(output, target, reduction='sum').item()  # sum up batch loss
+			pred = output.argmax(dim=1, keepdim=True)  # get the index of the max log-probability
+			correct += pred.eq(target.view_as(pred)).sum().item()
 
-				# if batch_idx % self.logging_steps == 0:
-				# 	print('EVAL:: epoch: {} [{}/{} ({:.0f}%)]\tLoss: {:.6f} \t Acc: {:.6f}'.format(
-				#             self.global_step, batch_idx * len(data), len(self.test_loader.dataset),
-				#             100. * batch_idx / len(self.test_loader), test_loss/((batch_idx+1)*len(data)), correct/((batch_idx+1)*len(data))))
-					# break
+		test_loss = test_loss/len(loader.dataset)
+		acc = correct / len(loader.dataset)
+		return {"loss": test_loss, "acc": acc}
 
-			test_loss = test_loss/len(self.test_loader.dataset)
-			acc = correct / len(self.test_loader.dataset)
+	def evaluate(self):
+		self.model.eval()
+		with torch.no_grad():
+			metrics = self.test_metrics(self.model, self.test_loader)
 
 		if self.rank == 0:
-			print("writing into tb_writer... curret time: {}, wall-clock: {}".format(dml.PyTimer.now("s"), self.wall_clock))
-			self.tb_writer.add_scalar('loss', test_loss, self.global_step)
-			self.tb_writer.add_scalar('acc', acc, self.global_step)
-			
-			with open(self.output, 'a+') as f:
-				out_str = "EVAL:: epoch: {} curret time: {}, wall-clock: {}, loss: {}, acc: {}\n".format(self.global_step, dml.PyTimer.now("s"), self.wall_clock, test_loss, acc)
-				print(out_str)
-				f.write(out_str)
-
-
-				self.tb_writer.flush()
+			self.log_evaluation(self.global_step, sim_now(), self.wall_clock, metrics)
 		
 
 		# with open(self.output, 'a+') as f:
-		# 	out_str = "EVAL:: epoch: {} curret time: {}, wall-clock: {}, loss: {}, acc: {}\n".format(self.global_step, dml.PyTimer.now("s"), self.wall_clock, 0, 0)
+		# 	out_str = "EVAL:: epoch: {} curret time: {}, wall-clock: {}, loss: {}, acc: {}\n".format(self.global_step, sim_now(), self.wall_clock, 0, 0)
 		# 	print(out_str)
 		# 	f.write(out_str)
 			
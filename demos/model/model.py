@@ -1,7 +1,10 @@
-from base import Mpi
+from base import Mpi, sim_now
 import time
 import os
+import copy
+import random
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from tensorboardX import SummaryWriter
 import torch
 
@@ -14,6 +17,8 @@ class TaskBase:
 		self.logging_steps = 100
 
 		self.model = model
+		self.monitor = None  # a base.ConvergenceMonitor, set on the server task to stop the run early
+		self.eval_pool = None  # set by enable_async_eval
 		self.rank = Mpi.rank
 		self.world_size = max(Mpi.world_size - 1, 1)  #this word size does not include the server
 
@@ -23,6 +28,8 @@ class TaskBase:
 
 			self.tb_writer = SummaryWriter(log)
 			self.output = os.path.join(log, "time-acc-loss.txt")
+			# subset evaluations of enable_async_eval, apart so that the readers of output only see the full test set
+			self.subset_output = os.path.join(log, "time-acc-loss-subset.txt")
 	
 	# Currently, we're not able to use std::vector<uint64_t> as python input.
 	# To avolocal_rank this awkward thing, we use the std::vector<uint32_t> as input, while
@@ -43,6 +50,92 @@ class TaskBase:
 
 		return self.long2int(addr_list), sizes
 	
+	def report(self, step, **metrics):
+		"""
+			Hand the metrics of the evaluation of round `step` to the convergence monitor, if any
+		"""
+		if self.monitor is not None:
+			self.monitor.evaluated(step, **metrics)
+
+	def test_metrics(self, model, loader):
+		"""
+			:return: the metrics of `model` on `loader` as an ordered dict, loss first
+		"""
+		raise NotImplementedError
+
+	def labels(self, dataset):
+		"""
+			The stratum of each sample of the test set, for the subset of enable_async_eval. One stratum by default.
+		"""
+		return [0]*len(dataset)
+
+	def log_evaluation(self, step, sim_time, wall_clock, metrics, subset=False):
+		print("writing into tb_writer... curret time: {}, wall-clock: {}".format(sim_time, wall_clock))
+		for name, value in metrics.items():
+			self.tb_writer.add_scalar(name+"_subset" if subset else name, value, step)
+
+		with open(self.subset_output if subset else self.output, 'a+') as f:
+			out_str = "EVAL:: epoch: {} curret time: {}, wall-clock: {}, ".format(step, sim_time, wall_clock) + \
+						", ".join("{}: {}".format(name, value) for name, value in metrics.items()) + "\n"
+			print(out_str)
+			f.write(out_str)
+
+		self.tb_writer.flush()
+		# the stop conditions are only checked on the full test set
+		if not subset:
+			self.report(step, **metrics)
+
+	def enable_async_eval(self, fraction=1.0, full_every=1, batch_size=1024):
+		"""
+			Evaluate the global model in a background thread instead of blocking Processing: evaluate_async()
+			snapshots the model of a round and returns at once, the metrics are logged against that round later.
+			With fraction < 1, rounds evaluate a stratified subset of the test set (see labels) and every
+			`full_every`-th round the full set. Subset metrics are logged as <name>_subset to TensorBoard and to
+			time-acc-loss-subset.txt, time-acc-loss.txt then has the rounds evaluated on the full set only.
+		"""
+		dataset = self.test_loader.dataset
+		self.eval_loaders = {False: torch.utils.data.DataLoader(dataset, batch_size=batch_size)}
+		if fraction < 1:
+			strata = {}
+			for i, label in enumerate(self.labels(dataset)):
+				strata.setdefault(label, []).append(i)
+			rng = random.Random(42)
+			indices = sorted(i for stratum in strata.values() for i in rng.sample(stratum, max(1, round(len(stratum)*fraction))))
+			self.eval_loaders[True] = torch.utils.data.DataLoader(torch.utils.data.Subset(dataset, indices), batch_size=batch_size)
+		self.eval_full_every = max(full_every, 1)
+		self.eval_model = copy.deepcopy(self.model)
+		self.eval_pool = ThreadPoolExecutor(max_workers=1)
+		self.eval_pending = []
+
+	def _evaluate_snapshot(self, state, loader):
+		self.eval_model.load_state_dict(state)
+		self.eval_model.eval()
+		with torch.inference_mode():
+			return self.test_metrics(self.eval_model, loader)
+
+	def evaluate_async(self):
+		"""
+			Queue the evaluation of the current global model and log the evaluations finished meanwhile
+		"""
+		if self.eval_pool is None:
+			return self.evaluate()
+
+		subset = True in self.eval_loaders and self.global_step % self.eval_full_every != 0
+		# the agent pastes the next aggregate into the model memory, the worker gets a copy
+		state = {name: value.detach().clone() for name, value in self.model.state_dict().items()}
+		future = self.eval_pool.submit(self._evaluate_snapshot, state, self.eval_loaders[subset])
+		self.eval_pending.append((self.global_step, sim_now(), self.wall_clock, subset, future))
+		self.global_step += 1
+		self.poll_evaluations()
+
+	def poll_evaluations(self, wait=False):
+		"""
+			Log the finished evaluations in round order, all of them with wait (at the end of the run)
+		"""
+		while self.eval_pool is not None and self.eval_pending and (wait or self.eval_pending[0][-1].done()):
+			step, sim_time, wall_clock, subset, future = self.eval_pending.pop(0)
+			self.log_evaluation(step, sim_time, wall_clock, future.result(), subset)
+
 	@property
 	def wall_clock(self):
 		return '{} s'.format(time.time() - self.sys_time_begin)
@@ -14,7 +14,7 @@ from torch.optim.lr_scheduler import StepLR
 import random
 
 
-import ns.distributedml as dml
+from base import sim_now
 import time
 
 
@@ -186,7 +186,8 @@ class AirTask(TaskBase):
 		self.train_loader = torch.utils.data.DataLoader(train_dataset, **train_kwargs)
 
 		if self.rank == 0:
-			self.test_loader = torch.utils.data.DataLoader(test_dataset, **train_kwargs)
+			# the whole test set is scored, as by the evaluation loaders of enable_async_eval
+			self.test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=self.batch_size)
 
 				
 		self.optimizer = optim.Adadelta(self.model.parameters(), lr=args.lr*self.active_ratio*self.global_size)
@@ -212,34 +213,29 @@ class AirTask(TaskBase):
 		self.global_step += 1		
 
 
+	def test_metrics(self, model, loader):
+		test_loss, mse, samples = 0.0, 0.0, 0
+		for batch_idx, (data, target) in enumerate(loader):
+			output = model(data)
+			test_loss += model.criterion(output, target).item()*len(target)  # sum up batch loss
+			mse += torch.sum((output - target) ** 2).item()
+			samples += len(target)
+
+		# per batch of batch_size samples as before, whatever the batch size of loader
+		test_loss = test_loss / samples
+		mse = mse / samples * self.batch_size
+		return {"loss": test_loss, "mse": mse}
+
 	def evaluate(self):
 		self.model.eval()
-		test_loss, mse = 0.0, 0.0
 		with torch.no_grad():
-			for batch_idx, (data, target) in enumerate(self.test_loader):
-				output = self.model(data)
-				test_loss += self.model.criterion(output, target).item()  # sum up batch loss
-				mse += torch.sum((output - target) ** 2).item()
-
-
-			test_loss = test_loss / (batch_idx+1)
-			mse = mse / (batch_idx+1)
-		
+			metrics = self.test_metrics(self.model, self.test_loader)
 		
 		if self.rank == 0:
-			print("writing into tb_writer... curret time: {}, wall-clock: {}".format(dml.PyTimer.now("s"), self.wall_clock))
-			self.tb_writer.add_scalar('loss', test_loss, self.global_step)
-			self.tb_writer.add_scalar('mse', mse, self.global_step)
-			
-			with open(self.output, 'a+') as f:
-				out_str = "EVAL:: epoch: {} curret time: {}, wall-clock: {}, loss: {}, mse: {}\n".format(self.global_step, dml.PyTimer.now("s"), self.wall_clock, test_loss, mse)
-				print(out_str)
-				f.write(out_str)
-
-			self.tb_writer.flush()
+			self.log_evaluation(self.global_step, sim_now(), self.wall_clock, metrics)
 
 		# with open(self.output, 'a+') as f:
-		# 	out_str = "EVAL:: epoch: {} curret time: {}, wall-clock: {}, loss: {}, mse: {}\n".format(self.global_step, dml.PyTimer.now("s"), self.wall_clock, test_loss, mse)
+		# 	out_str = "EVAL:: epoch: {} curret time: {}, wall-clock: {}, loss: {}, mse: {}\n".format(self.global_step, sim_now(), self.wall_clock, test_loss, mse)
 		# 	print(out_str)
 		# 	f.write(out_str)
 		self.global_step += 1
@@ -1,23 +1,45 @@
 from itertools import chain
 from abc import ABCMeta, abstractmethod
 import os
+import sys
 import yaml
-import ns.distributedml as dml
 import time
+import json
+import ctypes
+import numpy as np
+
+from trace_format import TRACE_DTYPE, TRACE_METRICS
+
+try:
+	import ns.distributedml as dml
+	import ns.core
+except ImportError:
+	# the models run without ns-3 in benchmarks/ml_throughput.py, the simulation classes need it
+	dml = None
+
+# simulated computing time per wall-clock second of Processing
+TIME_SHIFT = 10
 
 def time_shift(func):
 	"""
 		This time shift function wrapper is used to modifiy the computing time which ns3 cannot simulate.
-		We use the wall-clock time times 30 to denote the computing time for each task.
+		We use the wall-clock time times TIME_SHIFT to denote the computing time for each task.
 	"""
 	def wrapper(*args, **kwargs):
 		t_now = time.time()
 		func(*args, **kwargs)
-		return 10*(time.time()-t_now)
+		return TIME_SHIFT*(time.time()-t_now)
 
 	return wrapper
 
 
+def sim_now():
+	"""
+		The simulated time as printed in the logs, +0s when the models run without ns-3.
+	"""
+	return dml.PyTimer.now("s") if dml is not None else "+0s"
+
+
 
 
 def parse_yaml(yaml_path):
@@ -58,6 +80,26 @@ def parse_yaml(yaml_path):
 	return BackBoneNet, Cells
 
 
+def write_manifest(path, **fields):
+	"""
+		Write or update the run.json manifest of a run, indexed by analyzers/catalog.py.
+		Fields are merged into the existing manifest, and the file is replaced atomically so that a catalog
+		update never reads half a manifest.
+	"""
+	manifest = {}
+	if os.path.exists(path):
+		with open(path, 'r') as f:
+			manifest = json.load(f)
+	manifest.update(fields)
+
+	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+	tmp_path = path + ".tmp"
+	with open(tmp_path, 'w') as f:
+		json.dump(manifest, f, indent=1, sort_keys=True)
+	os.replace(tmp_path, path)
+	return manifest
+
+
 class __Base(object):
 	__metaclass__ = ABCMeta
 
@@ -121,11 +163,12 @@ class _Iter(object):
 
 
 
+
+
 class Tracer:
 	def __init__(self, prefix="./trace"):
 		self.prefix = prefix
-		if not os.path.exists(prefix):
-			os.makedirs(prefix)
+		os.makedirs(prefix, exist_ok=True)
 
 		self.tracer = dml.TraceHelper()
 
@@ -159,10 +202,80 @@ class Tracer:
 		else:
 			self.tracer.trace_drop(netdevice)
 
+	def set_sampling(self, trace, period):
+		"""
+			Keep at most one event per period seconds for each object of the trace ("energy", "remaining",
+			"cwnd", "mobility" or "drop") hooked afterwards, 0 keeps all events
+		"""
+		self.tracer.SetSamplingPeriod(trace, period)
+
+	def trace_cell_window(self, wifi_cell, window, first_id=1, per_cell=False, apps=None):
+		"""
+			Per window of `window` seconds, write min/max/mean/last of the energy of the STAs of a cell, and of
+			the cwnd of their agents if apps is given, to window_ml_energy<first_id>.txt, window_energy<first_id>.txt
+			and window_cwnd<first_id>.txt. With per_cell, the whole cell is aggregated under key first_id, its energy
+			being the sum of the energy of its STAs. Mobility is traced as in trace_cell.
+		"""
+		path = lambda name: os.path.join(self.prefix, "window_{}{}.txt".format(name, first_id))
+		self.tracer.trace_energy_window(wifi_cell.sta.mlEnergyModels, path("ml_energy"), window, first_id, per_cell)
+		self.tracer.trace_energy_window(wifi_cell.sta.wifiEnergyModels, path("energy"), window, first_id, per_cell)
+		self.tracer.trace_mobility(wifi_cell.sta.nodes, os.path.join(self.prefix, "mobility"), first_id)
+		if apps is not None:
+			for i in range(apps.GetN()):
+				self.tracer.trace_cwnd_window(apps.Get(i).GetSocket(), path("cwnd"), window, first_id if per_cell else first_id+i)
+
+	def enable_ring(self, capacity, keep_files=True):
+		"""
+			Keep the latest `capacity` records of each metric of trace_cell in memory, readable with ring() at any time
+		"""
+		self.tracer.EnableRing(capacity, keep_files)
+
+	def ring(self, metric):
+		"""
+			The whole ring of a metric as a structured array mapped on the C++ buffer (no copy), in slot order.
+			Returns the array and the number of records written so far, or (None, 0) if rings are not enabled.
+		"""
+		if isinstance(metric, str):
+			metric = TRACE_METRICS[metric]
+		ring = self.tracer.GetRing(metric)
+		if ring is None:
+			return None, 0
+		buffer = (ctypes.c_char * (ring.GetCapacity()*TRACE_DTYPE.itemsize)).from_address(ring.GetAddress())
+		return np.frombuffer(buffer, dtype=TRACE_DTYPE), ring.GetCount()
+
+	def latest(self, metric):
+		"""
+			The records of a metric still in its ring, oldest first (a copy)
+		"""
+		records, count = self.ring(metric)
+		if records is None:
+			return np.empty(0, dtype=TRACE_DTYPE)
+		capacity = len(records)
+		if count <= capacity:
+			return records[:count].copy()
+		head = count % capacity
+		return np.concatenate([records[head:], records[:head]])
+
+	def enable_binary(self, path, buffer_size=1<<20):
+		"""
+			Write the traces of trace_cell to one binary file, read it with analyzers/utils.py:read_binary_trace.
+			Tracers of a rank given the same path share one shard, merge the shards with analyzers/merge_traces.py.
+		"""
+		self.tracer.EnableBinary(os.path.join(self.prefix, path), buffer_size)
+
+	def trace_cell(self, wifi_cell, first_id=1):
+		"""
+			Trace the ml energy, wifi energy and mobility of all STAs of a cell in three C++ calls.
+			The i-th STA writes to ml_energy<first_id+i>.txt, energy<first_id+i>.txt and mobility<first_id+i>.txt.
+		"""
+		self.tracer.trace_energy_consumation(wifi_cell.sta.mlEnergyModels, os.path.join(self.prefix, "ml_energy"), first_id)
+		self.tracer.trace_energy_consumation(wifi_cell.sta.wifiEnergyModels, os.path.join(self.prefix, "energy"), first_id)
+		self.tracer.trace_mobility(wifi_cell.sta.nodes, os.path.join(self.prefix, "mobility"), first_id)
+
 class Mpi:
 	rank = 0
 	world_size = 1
-	m = dml.MpiHelper()
+	m = dml.MpiHelper() if dml is not None else None
 	@staticmethod
 	def enable(argv):
 		Mpi.m.Enable(argv[0:1])
@@ -177,6 +290,139 @@ class Mpi:
 	
 
 
-
-
-
+class ConvergenceMonitor:
+	"""
+		End a run as soon as it answered its question, instead of after --epochs rounds.
+		The server task reports each evaluation (target metric reached, or no loss improvement for `plateau`
+		rounds), and every `period` simulated seconds each rank writes the energy consumed by its devices to
+		monitor-rank<rank>.json, which the server sums against `energy_budget`, and the server checks the
+		wall-clock `wall_budget`.
+		The server writes the reason and a stop time into the run.json manifest and each rank stops its simulator
+		at that time, so Simulator::Run returns on all ranks together, and the tracers and TensorBoard flush as at
+		the end of a full run. The ranks coordinate through these files only, so they need a filesystem shared by
+		all of them (e.g. NFS when the MPI ranks run on several hosts).
+	"""
+	MESSAGES = {"target": "Converged (target reached)", "plateau": "Converged (plateau)", \
+				"energy": "Energy budget reached", "wall_clock": "Wall-clock budget reached"}
+
+	def __init__(self, manifest, rank=0, target=None, metric="acc", mode="max", plateau=0, min_delta=1e-4, \
+					energy_budget=0, wall_budget=0, period=1.0, energy_models=(), tracers=()):
+		self.manifest = manifest
+		self.rank = rank
+		self.target = target
+		self.metric = metric
+		self.mode = mode
+		self.plateau = plateau
+		self.min_delta = min_delta
+		self.energy_budget = energy_budget
+		self.wall_budget = wall_budget
+		self.period = period
+		self.energy_models = list(energy_models)
+		self.tracers = list(tracers)
+		self.ring_energy = {}  # (metric, node) -> latest energy read from the trace rings
+
+		self.best_loss = float("inf")
+		self.since_best = 0
+		self.stop_time = None
+		self.reason = None
+		self.wall_begin = time.time()
+
+	def start(self):
+		ns.core.Simulator.Schedule(ns.core.Seconds(self.period), self._check)
+
+	def evaluated(self, step, **metrics):
+		"""
+			Called by the server task after each evaluation of the global model
+		"""
+		value = metrics.get(self.metric)
+		if self.target is not None and value is not None and \
+				(value >= self.target if self.mode == "max" else value <= self.target):
+			return self.stop("target", step)
+
+		if self.plateau > 0 and "loss" in metrics:
+			if metrics["loss"] < self.best_loss - self.min_delta:
+				self.best_loss, self.since_best = metrics["loss"], 0
+			else:
+				self.since_best += 1
+				if self.since_best >= self.plateau:
+					return self.stop("plateau", step)
+
+	def energy(self):
+		"""
+			The energy consumed by the devices of this rank, in J. With tracers, the latest ml and wifi energy of
+			each node in their trace rings (see Tracer.enable_ring), otherwise straight from the energy models.
+		"""
+		if self.tracers:
+			for tracer in self.tracers:
+				for metric in ["ml_energy", "wifi_energy"]:
+					records = tracer.latest(metric)
+					for node, value in zip(records["node"].tolist(), records["value"].tolist()):
+						# the energy is cumulative, and a node whose records left the ring keeps its last value
+						key = (metric, node)
+						self.ring_energy[key] = max(self.ring_energy.get(key, 0.0), value)
+			return sum(self.ring_energy.values())
+
+		total = 0.0
+		for models in self.energy_models:
+			total += sum(models.Get(i).GetTotalEnergyConsumption() for i in range(models.GetN()))
+		return total
+
+	def _rank_path(self, rank):
+		return os.path.join(os.path.dirname(self.manifest), "monitor-rank%d.json"%rank)
+
+	def _total_energy(self):
+		total = 0.0
+		for name in os.listdir(os.path.dirname(self.manifest)):
+			if name.startswith("monitor-rank") and name.endswith(".json"):
+				try:
+					with open(os.path.join(os.path.dirname(self.manifest), name), 'r') as f:
+						total += json.load(f)["energy"]
+				except (OSError, ValueError, KeyError):
+					pass  # being replaced
+		return total
+
+	def _check(self):
+		if self.stop_time is not None:
+			return
+		if self.energy_models or self.tracers:
+			write_manifest(self._rank_path(self.rank), energy=self.energy(), time=ns.core.Simulator.Now().GetSeconds())
+
+		if self.rank == 0:
+			if self.energy_budget > 0 and self._total_energy() >= self.energy_budget:
+				return self.stop("energy")
+			if self.wall_budget > 0 and time.time()-self.wall_begin >= self.wall_budget:
+				return self.stop("wall_clock")
+		else:
+			try:
+				with open(self.manifest, 'r') as f:
+					stop_time = json.load(f).get("stop_time")
+			except (OSError, ValueError):
+				stop_time = None
+			if stop_time is not None:
+				return self._stop_at(stop_time)
+
+		ns.core.Simulator.Schedule(ns.core.Seconds(self.period), self._check)
+
+	def stop(self, reason, step=None):
+		"""
+			Decide to stop (server), the other ranks read the decision at their next check
+		"""
+		if self.stop_time is not None:
+			return
+		# far enough ahead for every rank to check the manifest before it
+		stop_time = ns.core.Simulator.Now().GetSeconds() + 2*self.period
+		self.reason = reason
+		write_manifest(self.manifest, stop_reason=reason, stop_round=step, stop_time=stop_time)
+		at_round = " at round {}".format(step) if step is not None else ""
+		print("{}{}, stopping at {} s".format(self.MESSAGES.get(reason, reason), at_round, stop_time))
+		self._stop_at(stop_time)
+
+	def _stop_at(self, stop_time):
+		self.stop_time = stop_time
+		now = ns.core.Simulator.Now().GetSeconds()
+		if stop_time < now:
+			# the ranks no longer stop at the same simulated time, the distributed simulator may wait on this one
+			print("Rank {} read the stop time {} s at {} s and stops late, the run may hang: raise --monitor_period " \
+					"or check that {} is on a filesystem shared by all ranks".format(self.rank, stop_time, now, self.manifest), \
+					file=sys.stderr)
+		ns.core.Simulator.Stop(ns.core.Seconds(max(stop_time - now, 0)))
@@ -0,0 +1,18 @@
+"""
+	Layout of the binary traces and trace rings written by TraceHelper (distributed-ml-traces.h), used by base.py
+	to map the rings of a running simulation and by the analyzers to read the files. Only NumPy is needed, so the
+	analyzers import it without ns-3.
+"""
+import numpy as np
+
+TRACE_MAGIC = b"AIRDLTR1"
+TRACE_INDEX_MAGIC = b"AIRDLIDX"
+TRACE_HEADER_SIZE = 16
+TRACE_TRAILER_SIZE = 16
+# TraceRecord, the same in the files and in the rings
+TRACE_DTYPE = np.dtype([("time", "<f8"), ("node", "<u4"), ("metric", "<u4"), ("value", "<f8")])
+TRACE_INDEX_DTYPE = np.dtype([("node", "<u4"), ("count", "<u4"), ("offset", "<u8")])
+# metric ids of BinaryTraceSink::Metric
+TRACE_METRICS = {"ml_energy": 0, "wifi_energy": 1, "remaining_energy": 2, "cwnd": 3,
+				"position_x": 4, "position_y": 5, "position_z": 6,
+				"velocity_x": 7, "velocity_y": 8, "velocity_z": 9}
@@ -142,6 +142,10 @@ class WifiCell(__Base, _Iter):
 		self.mobility = MobilityRandomWalk2d(ap=self.ap, sta=self.sta)
 		self.energy = EnergyModel(ap=self.ap, sta=self.sta, wifi=self.wifi)
 
+		self._apWifiEnergyModels = None
+		self._staWifiEnergyModels = None
+		self._staMlEnergyModels = None
+
 		super(WifiCell, self).__init__(*args, **kwargs)
 		_Iter.__init__(self, self.sta)
 		
@@ -155,17 +159,24 @@ class WifiCell(__Base, _Iter):
 		address.Assign(self.wifi.staDevices)
 		address.Assign(self.wifi.apDevices)
 
+	# The lists below are built once, indexing them in a loop over the STAs used to rebuild them each time
 	@property
 	def apWifiEnergyModels(self):
-		return [self.ap.wifiEnergyModels.Get(i) for i in range(self.ap.GetN())]
+		if self._apWifiEnergyModels is None:
+			self._apWifiEnergyModels = [self.ap.wifiEnergyModels.Get(i) for i in range(self.ap.GetN())]
+		return self._apWifiEnergyModels
 
 	@property
 	def staWifiEnergyModels(self):
-		return [self.sta.wifiEnergyModels.Get(i) for i in range(self.sta.GetN())]
+		if self._staWifiEnergyModels is None:
+			self._staWifiEnergyModels = [self.sta.wifiEnergyModels.Get(i) for i in range(self.sta.GetN())]
+		return self._staWifiEnergyModels
 
 	@property
 	def staMlEnergyModels(self):
-		return [self.sta.mlEnergyModels.Get(i) for i in range(self.sta.GetN())]
+		if self._staMlEnergyModels is None:
+			self._staMlEnergyModels = [self.sta.mlEnergyModels.Get(i) for i in range(self.sta.GetN())]
+		return self._staMlEnergyModels
 
 	@property
 	def apEnergySources(self):
@@ -0,0 +1,272 @@
+"""
+	Run a parameter sweep of a demo script across the cores of this machine.
+	The spec (see configurations/sweep_minist.yaml) gives the script, fixed flags, a grid and/or random samples
+	of flags, and the mpirun rank count (a list in the grid sweeps it too). Every configuration is identified by
+	the hash of its script, ranks and flags and runs in <saved_dir>/<hash>, where sweep.json records its status.
+	Finished configurations are skipped, so an interrupted sweep resumes where it stopped when run again.
+
+	Runs are packed by resources: a run needs ranks*cores_per_rank cores (and ranks*memory_per_rank GB if
+	given), and the largest pending run that fits in the free cores and memory is started first.
+
+	python sweep.py configurations/sweep_minist.yaml --cores 32
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+
+import yaml
+
+
+DEMOS = os.path.dirname(os.path.abspath(__file__))
+STATE = "sweep.json"
+
+
+def load_spec(path):
+	with open(path, 'r') as f:
+		spec = yaml.safe_load(f)
+	spec.setdefault("fixed", {})
+	spec.setdefault("grid", {})
+	spec.setdefault("ranks", 2)
+	spec.setdefault("cores_per_rank", 1)
+	spec.setdefault("memory_per_rank", 0)
+	spec.setdefault("saved_dir", "saved_sweep")
+	return spec
+
+
+def _sample(rng, value):
+	"""
+		A list is a choice, {uniform: [a, b]}, {log_uniform: [a, b]} and {int: [a, b]} are ranges.
+	"""
+	if isinstance(value, list):
+		return rng.choice(value)
+	(kind, (low, high)), = value.items()
+	if kind == "uniform":
+		return rng.uniform(low, high)
+	if kind == "log_uniform":
+		return math.exp(rng.uniform(math.log(low), math.log(high)))
+	if kind == "int":
+		return rng.randint(low, high)
+	raise ValueError("unknown distribution {}".format(kind))
+
+
+def expand(spec):
+	"""
+		:return: the configurations of a spec as (ranks, flags), the grid crossed with the random samples
+	"""
+	names = list(spec["grid"])
+	grid = [dict(zip(names, values)) for values in itertools.product(*[spec["grid"][n] for n in names])]
+
+	samples = [{}]
+	if "random" in spec:
+		rng = random.Random(spec["random"].get("seed", 0))
+		samples = [{name: _sample(rng, value) for name, value in spec["random"]["params"].items()} \
+					for _ in range(spec["random"]["samples"])]
+
+	configs = []
+	for point in grid:
+		for sample in samples:
+			flags = dict(spec["fixed"])
+			flags.update(point)
+			flags.update(sample)
+			ranks = flags.pop("ranks", spec["ranks"])
+			configs.append((ranks, flags))
+	return configs
+
+
+def config_hash(script, ranks, flags):
+	content = json.dumps({"script": script, "ranks": ranks, "flags": flags}, sort_keys=True)
+	return hashlib.sha1(content.encode()).hexdigest()[:12]
+
+
+def to_argv(flags):
+	"""
+		True adds the flag alone, False and None leave it out.
+	"""
+	argv = []
+	for name, value in sorted(flags.items()):
+		if value is True:
+			argv.append("--"+name)
+		elif value is not False and value is not None:
+			argv.extend(["--"+name, str(value)])
+	return argv
+
+
+class Job:
+	def __init__(self, spec, ranks, flags, root):
+		self.script = spec["script"]
+		self.ranks = ranks
+		self.flags = flags
+		self.cores = ranks*spec["cores_per_rank"]
+		self.memory = ranks*spec["memory_per_rank"]
+		self.threads = spec["cores_per_rank"]
+		self.hash = config_hash(self.script, ranks, flags)
+		self.dir = os.path.join(root, self.hash)
+		self.process = None
+		self.log = None
+
+	@property
+	def state_path(self):
+		return os.path.join(self.dir, STATE)
+
+	def state(self):
+		try:
+			with open(self.state_path) as f:
+				return json.load(f)
+		except (OSError, ValueError):
+			return {}
+
+	def write_state(self, **fields):
+		state = self.state()
+		state.update(fields)
+		os.makedirs(self.dir, exist_ok=True)
+		with open(self.state_path+".tmp", 'w') as f:
+			json.dump(state, f, indent=1)
+		os.replace(self.state_path+".tmp", self.state_path)
+
+	def command(self, mpirun, extra_flags=None):
+		flags = dict(self.flags)
+		flags.update(extra_flags or {})
+		flags["saved_dir"] = self.dir
+		flags["mpi"] = True
+		return shlex.split(mpirun) + ["-np", str(self.ranks), sys.executable, self.script] + to_argv(flags)
+
+	def start(self, mpirun, extra_flags=None):
+		cmd = self.command(mpirun, extra_flags)
+		os.makedirs(self.dir, exist_ok=True)
+		self.log = open(os.path.join(self.dir, "sweep.log"), 'a')
+		env = dict(os.environ, OMP_NUM_THREADS=str(self.threads), MKL_NUM_THREADS=str(self.threads))
+		self.process = subprocess.Popen(cmd, cwd=DEMOS, stdout=self.log, stderr=subprocess.STDOUT, env=env)
+		self.write_state(script=self.script, ranks=self.ranks, flags=self.flags, command=cmd, status="running", \
+						started=time.time(), finished=None, returncode=None)
+
+	def poll(self):
+		"""
+			:return: the return code once the process ended, None while it runs
+		"""
+		returncode = self.process.poll()
+		if returncode is not None:
+			self.log.close()
+			self.write_state(status="finished" if returncode == 0 else "failed", finished=time.time(), returncode=returncode)
+		return returncode
+
+	def stop(self, status="interrupted"):
+		if self.process is not None and self.process.poll() is None:
+			self.process.terminate()
+			try:
+				self.process.wait(timeout=30)
+			except subprocess.TimeoutExpired:
+				self.process.kill()
+				self.process.wait()
+			self.log.close()
+			self.write_state(status=status, finished=time.time(), returncode=self.process.returncode)
+
+
+class Scheduler:
+	"""
+		Starts jobs when their cores and memory are free, the largest one that fits first. A job larger than the
+		machine runs alone.
+	"""
+	def __init__(self, cores, memory=0, mpirun="mpirun"):
+		self.cores = cores
+		self.memory = memory
+		self.mpirun = mpirun
+		self.pending = []
+		self.running = []
+
+	def submit(self, job, extra_flags=None):
+		job.extra_flags = extra_flags
+		self.pending.append(job)
+
+	def _fits(self, job):
+		if not self.running:
+			return True
+		used_cores = sum(j.cores for j in self.running)
+		used_memory = sum(j.memory for j in self.running)
+		return used_cores+job.cores <= self.cores and (not self.memory or used_memory+job.memory <= self.memory)
+
+	def step(self):
+		"""
+			Reap the ended jobs and start the pending ones that fit.
+			:return: the jobs that ended since the previous step
+		"""
+		ended = [job for job in self.running if job.poll() is not None]
+		self.running = [job for job in self.running if job not in ended]
+
+		self.pending.sort(key=lambda job: (job.cores, job.memory), reverse=True)
+		for job in list(self.pending):
+			if self._fits(job):
+				job.start(self.mpirun, job.extra_flags)
+				self.pending.remove(job)
+				self.running.append(job)
+		return ended
+
+	def stop(self, job, status="interrupted"):
+		job.stop(status)
+		if job in self.running:
+			self.running.remove(job)
+
+	def stop_all(self):
+		for job in list(self.running):
+			self.stop(job)
+		self.pending = []
+
+	def idle(self):
+		return not self.pending and not self.running
+
+
+def make_jobs(spec):
+	root = os.path.abspath(spec["saved_dir"])
+	return [Job(spec, ranks, flags, root) for ranks, flags in expand(spec)]
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("spec", type=str,
+	                        help="the yaml spec of the sweep.")
+	parser.add_argument("--cores", default=os.cpu_count(), type=int,
+	                        help="cores to fill, all of them by default.")
+	parser.add_argument("--memory", default=0, type=float,
+	                        help="memory to fill in GB, 0 does not limit it.")
+	parser.add_argument("--mpirun", default="mpirun", type=str,
+	                        help="the mpi launcher, e.g. \"mpirun --oversubscribe\".")
+	parser.add_argument("--retry_failed", action='store_true',
+	                        help="if added, also rerun the configurations that failed.")
+	parser.add_argument("--dry_run", action='store_true',
+	                        help="if added, print the runs without starting them.")
+	args = parser.parse_args()
+
+	spec = load_spec(args.spec)
+	jobs = make_jobs(spec)
+	skip = {"finished", "failed"} if not args.retry_failed else {"finished"}
+	todo = [job for job in jobs if job.state().get("status") not in skip]
+	print("{} configurations, {} to run".format(len(jobs), len(todo)))
+
+	if args.dry_run:
+		for job in todo:
+			print(job.hash, job.state().get("status", "new"), " ".join(job.command(args.mpirun)))
+		sys.exit(0)
+
+	scheduler = Scheduler(args.cores, args.memory, args.mpirun)
+	for job in todo:
+		scheduler.submit(job)
+
+	done = 0
+	try:
+		while not scheduler.idle():
+			for job in scheduler.step():
+				done += 1
+				print("[{}/{}] {} {} (exit code {})".format(done, len(todo), job.hash, job.state().get("status"), \
+						job.process.returncode))
+			time.sleep(1)
+	except KeyboardInterrupt:
+		# the interrupted runs start over on the next invocation
+		scheduler.stop_all()
+		print("interrupted, run the same command again to resume")